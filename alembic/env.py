@@ -5,6 +5,7 @@ import sys
 import os
 
 from sqlalchemy import engine_from_config
+from sqlalchemy import event
 from sqlalchemy import pool
 
 from alembic import context
@@ -13,6 +14,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from models import Base
 from config import settings
+from online_migrations import is_dry_run, logger as online_logger
 
 config = context.config
 
@@ -51,18 +53,43 @@ def run_migrations_online():
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
+    sqlite = connectable.dialect.name == "sqlite"
+    if sqlite:
+        # pysqlite сам не открывает транзакцию перед DDL; без этого миграция
+        # на SQLite не откатывается целиком (и пробный прогон тоже)
+        @event.listens_for(connectable, "connect")
+        def _sqlite_connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(connectable, "begin")
+        def _sqlite_begin(conn):
+            conn.exec_driver_sql("BEGIN")
+
+    # -x dry_run=1: все миграции выполняются в одной транзакции, которая
+    # откатывается; оценки пишет online_migrations
+    dry_run = is_dry_run()
 
     with connectable.connect() as connection:
+        transaction = connection.begin() if dry_run else None
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
             compare_type=True,  # Это позволит Alembic отслеживать изменения типов данных
-            render_as_batch=True  # Это важно для поддержки ALTER TABLE в SQLite, можно удалить для PostgreSQL
+            # Копирование таблицы для ALTER нужно только SQLite; на PostgreSQL
+            # оно заблокировало бы большие таблицы на все время копирования
+            render_as_batch=sqlite,
+            # Каждая миграция коммитится отдельно: блокировки одной не
+            # держатся до конца всего upgrade
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
             context.run_migrations()
 
+        if transaction is not None:
+            transaction.rollback()
+            online_logger.info("[dry-run] Изменения откачены")
+
 
 if context.is_offline_mode():
     run_migrations_offline()
@@ -0,0 +1,48 @@
+"""Индексы внешних ключей корзины и заказов
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 12:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_cart_items_user_id", "cart_items", ["user_id"]),
+    ("ix_cart_items_product_id", "cart_items", ["product_id"]),
+    ("ix_orders_user_id_order_date", "orders", ["user_id", sa.text("order_date DESC")]),
+    ("ix_order_items_order_id", "order_items", ["order_id"]),
+    ("ix_order_items_product_id", "order_items", ["product_id"]),
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        # CREATE INDEX CONCURRENTLY не блокирует запись, но не может
+        # выполняться внутри транзакции
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+    else:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            for name, table, _ in INDEXES:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,155 @@
+"""Секционирование orders и order_items по месяцам order_date
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 13:00:00
+
+"""
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_partitions(first_month: date, last_month: date):
+    month = first_month
+    while month <= last_month:
+        upper = _add_months(month, 1)
+        for table in ("orders", "order_items"):
+            op.execute(
+                f"CREATE TABLE IF NOT EXISTS {table}_y{month.year}m{month.month:02d} "
+                f"PARTITION OF {table} FOR VALUES FROM ('{month}') TO ('{upper}')"
+            )
+        month = upper
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    columns = {column["name"] for column in sa.inspect(bind).get_columns("order_items")}
+    if "order_date" not in columns:
+        op.add_column("order_items", sa.Column("order_date", sa.DateTime(), nullable=True))
+    # Ключ секционирования позиций — дата их заказа
+    op.execute("UPDATE orders SET order_date = CURRENT_TIMESTAMP WHERE order_date IS NULL")
+    op.execute(
+        "UPDATE order_items SET order_date = "
+        "(SELECT orders.order_date FROM orders WHERE orders.id = order_items.order_id)"
+    )
+
+    if bind.dialect.name != "postgresql":
+        return
+
+    op.execute("ALTER TABLE order_items RENAME TO order_items_legacy")
+    op.execute("ALTER TABLE orders RENAME TO orders_legacy")
+    # Имена первичных ключей — это имена индексов, они должны освободиться
+    op.execute("ALTER TABLE order_items_legacy RENAME CONSTRAINT order_items_pkey TO order_items_legacy_pkey")
+    op.execute("ALTER TABLE orders_legacy RENAME CONSTRAINT orders_pkey TO orders_legacy_pkey")
+    for index in ("ix_orders_id", "ix_orders_user_id_order_date"):
+        op.execute(f"ALTER INDEX IF EXISTS {index} RENAME TO {index}_legacy")
+    for index in ("ix_order_items_id", "ix_order_items_order_id", "ix_order_items_product_id"):
+        op.execute(f"ALTER INDEX IF EXISTS {index} RENAME TO {index}_legacy")
+
+    # Первичный ключ секционированной таблицы обязан включать ключ секционирования
+    op.execute("""
+        CREATE TABLE orders (
+            id INTEGER NOT NULL DEFAULT nextval('orders_id_seq'),
+            user_id INTEGER REFERENCES users (id),
+            order_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            status orderstatus,
+            total_price DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (id, order_date)
+        ) PARTITION BY RANGE (order_date)
+    """)
+    op.execute("""
+        CREATE TABLE order_items (
+            id INTEGER NOT NULL DEFAULT nextval('order_items_id_seq'),
+            order_id INTEGER NOT NULL,
+            order_date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            product_id INTEGER REFERENCES products (id),
+            quantity INTEGER NOT NULL,
+            price DOUBLE PRECISION NOT NULL,
+            PRIMARY KEY (id, order_date),
+            FOREIGN KEY (order_id, order_date) REFERENCES orders (id, order_date)
+        ) PARTITION BY RANGE (order_date)
+    """)
+
+    first = bind.execute(sa.text("SELECT min(order_date) FROM orders_legacy")).scalar() or datetime.utcnow()
+    this_month = datetime.utcnow().date().replace(day=1)
+    _create_partitions(min(first.date().replace(day=1), this_month), _add_months(this_month, MONTHS_AHEAD))
+
+    op.execute("INSERT INTO orders SELECT id, user_id, order_date, status, total_price FROM orders_legacy")
+    op.execute(
+        "INSERT INTO order_items SELECT id, order_id, order_date, product_id, quantity, price "
+        "FROM order_items_legacy"
+    )
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY order_items.id")
+    op.execute("DROP TABLE order_items_legacy")
+    op.execute("DROP TABLE orders_legacy")
+
+    op.create_index("ix_orders_id", "orders", ["id"])
+    op.create_index("ix_orders_user_id_order_date", "orders", ["user_id", sa.text("order_date DESC")])
+    op.create_index("ix_order_items_id", "order_items", ["id"])
+    op.create_index("ix_order_items_order_id", "order_items", ["order_id"])
+    op.create_index("ix_order_items_product_id", "order_items", ["product_id"])
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("ALTER TABLE order_items RENAME TO order_items_partitioned")
+        op.execute("ALTER TABLE orders RENAME TO orders_partitioned")
+        op.execute("ALTER TABLE order_items_partitioned RENAME CONSTRAINT order_items_pkey TO order_items_partitioned_pkey")
+        op.execute("ALTER TABLE orders_partitioned RENAME CONSTRAINT orders_pkey TO orders_partitioned_pkey")
+        for index in ("ix_orders_id", "ix_orders_user_id_order_date", "ix_order_items_id",
+                      "ix_order_items_order_id", "ix_order_items_product_id"):
+            op.execute(f"DROP INDEX IF EXISTS {index}")
+        op.execute("""
+            CREATE TABLE orders (
+                id INTEGER NOT NULL DEFAULT nextval('orders_id_seq') PRIMARY KEY,
+                user_id INTEGER REFERENCES users (id),
+                order_date TIMESTAMP WITHOUT TIME ZONE,
+                status orderstatus,
+                total_price DOUBLE PRECISION NOT NULL
+            )
+        """)
+        op.execute("""
+            CREATE TABLE order_items (
+                id INTEGER NOT NULL DEFAULT nextval('order_items_id_seq') PRIMARY KEY,
+                order_id INTEGER REFERENCES orders (id),
+                order_date TIMESTAMP WITHOUT TIME ZONE,
+                product_id INTEGER REFERENCES products (id),
+                quantity INTEGER NOT NULL,
+                price DOUBLE PRECISION NOT NULL
+            )
+        """)
+        op.execute("INSERT INTO orders SELECT id, user_id, order_date, status, total_price FROM orders_partitioned")
+        op.execute(
+            "INSERT INTO order_items SELECT id, order_id, order_date, product_id, quantity, price "
+            "FROM order_items_partitioned"
+        )
+        op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+        op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY order_items.id")
+        op.execute("DROP TABLE order_items_partitioned CASCADE")
+        op.execute("DROP TABLE orders_partitioned CASCADE")
+        op.create_index("ix_orders_id", "orders", ["id"])
+        op.create_index("ix_orders_user_id_order_date", "orders", ["user_id", sa.text("order_date DESC")])
+        op.create_index("ix_order_items_id", "order_items", ["id"])
+        op.create_index("ix_order_items_order_id", "order_items", ["order_id"])
+        op.create_index("ix_order_items_product_id", "order_items", ["product_id"])
+
+    with op.batch_alter_table("order_items") as batch_op:
+        batch_op.drop_column("order_date")
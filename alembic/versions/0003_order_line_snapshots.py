@@ -0,0 +1,88 @@
+"""Снимок товара в позициях заказа и количество единиц в заказе
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 14:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+
+def _columns(bind, table: str) -> set:
+    return {column["name"] for column in sa.inspect(bind).get_columns(table)}
+
+
+def _backfill(bind, table: str, statement: str):
+    # Заполняем диапазонами id, чтобы не держать блокировки на всей таблице
+    max_id = bind.execute(sa.text(f"SELECT MAX(id) FROM {table}")).scalar() or 0
+    for start in range(0, max_id, BATCH_SIZE):
+        bind.execute(sa.text(statement), {"start": start, "end": start + BATCH_SIZE})
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    item_columns = _columns(bind, "order_items")
+    if "product_name" not in item_columns:
+        op.add_column("order_items", sa.Column("product_name", sa.String(255), nullable=True))
+    if "product_category" not in item_columns:
+        op.add_column("order_items", sa.Column("product_category", sa.String(100), nullable=True))
+    if "item_count" not in _columns(bind, "orders"):
+        op.add_column("orders", sa.Column("item_count", sa.Integer(), nullable=False, server_default="0"))
+
+    backfills = [
+        ("order_items", """
+            UPDATE order_items SET
+                product_name = (SELECT products.name FROM products WHERE products.id = order_items.product_id),
+                product_category = (SELECT products.category FROM products WHERE products.id = order_items.product_id)
+            WHERE id > :start AND id <= :end AND product_name IS NULL
+        """),
+        ("orders", """
+            UPDATE orders SET item_count = COALESCE((
+                SELECT SUM(order_items.quantity) FROM order_items
+                WHERE order_items.order_id = orders.id AND order_items.order_date = orders.order_date
+            ), 0)
+            WHERE id > :start AND id <= :end
+        """),
+    ]
+    if bind.dialect.name == "postgresql":
+        # Каждая пачка фиксируется отдельно
+        with op.get_context().autocommit_block():
+            for table, statement in backfills:
+                _backfill(bind, table, statement)
+        # Удаление товара больше не ломается о ссылки из старых заказов
+        for fk in sa.inspect(bind).get_foreign_keys("order_items"):
+            if fk["referred_table"] == "products":
+                op.drop_constraint(fk["name"], "order_items", type_="foreignkey")
+        op.create_foreign_key(
+            "order_items_product_id_fkey", "order_items", "products",
+            ["product_id"], ["id"], ondelete="SET NULL",
+        )
+    else:
+        for table, statement in backfills:
+            _backfill(bind, table, statement)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        op.drop_constraint("order_items_product_id_fkey", "order_items", type_="foreignkey")
+        op.create_foreign_key(
+            "order_items_product_id_fkey", "order_items", "products", ["product_id"], ["id"],
+        )
+    with op.batch_alter_table("orders") as batch:
+        batch.drop_column("item_count")
+    with op.batch_alter_table("order_items") as batch:
+        batch.drop_column("product_category")
+        batch.drop_column("product_name")
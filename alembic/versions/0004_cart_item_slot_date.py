@@ -0,0 +1,30 @@
+"""День выполнения услуги в позиции корзины
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 15:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("cart_items")}
+    if "slot_date" not in columns:
+        # Столбец допускает NULL, поэтому добавляется без перезаписи таблицы
+        op.add_column("cart_items", sa.Column("slot_date", sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("cart_items") as batch:
+        batch.drop_column("slot_date")
@@ -0,0 +1,43 @@
+"""Время последнего изменения позиции корзины
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 16:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX = ("ix_cart_items_user_id_updated_at", "cart_items", ["user_id", "updated_at"])
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    columns = {column["name"] for column in sa.inspect(bind).get_columns("cart_items")}
+    if "updated_at" not in columns:
+        # Существующие корзины считаются измененными в момент миграции, чтобы
+        # первая же очистка не удалила их. На PostgreSQL 11+ значение по
+        # умолчанию из now() не переписывает таблицу
+        op.add_column("cart_items", sa.Column(
+            "updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now(),
+        ))
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.create_index(*INDEX, postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index(*INDEX, if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX[0], table_name=INDEX[1], if_exists=True)
+    with op.batch_alter_table("cart_items") as batch:
+        batch.drop_column("updated_at")
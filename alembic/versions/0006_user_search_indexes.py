@@ -0,0 +1,45 @@
+"""Индексы поиска пользователей
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 18:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+POSTGRESQL_INDEXES = {
+    "ix_users_username_lower": "(lower(username) text_pattern_ops)",
+    "ix_users_email_lower": "(lower(email) text_pattern_ops)",
+    "ix_users_role_is_active_id": "(role, is_active, id)",
+    "ix_users_username_trgm": "USING gin (username gin_trgm_ops)",
+    "ix_users_email_trgm": "USING gin (email gin_trgm_ops)",
+}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        # Индексы строятся без блокировки записи в users
+        with op.get_context().autocommit_block():
+            for name, definition in POSTGRESQL_INDEXES.items():
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON users {definition}")
+        return
+    op.create_index("ix_users_username_lower", "users", [sa.text("lower(username)")], if_not_exists=True)
+    op.create_index("ix_users_email_lower", "users", [sa.text("lower(email)")], if_not_exists=True)
+    op.create_index("ix_users_role_is_active_id", "users", ["role", "is_active", "id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name in reversed(POSTGRESQL_INDEXES):
+        op.drop_index(name, table_name="users", if_exists=True)
@@ -0,0 +1,93 @@
+import asyncio
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+import repository
+from config import settings
+from models import User, UserRole
+from core import metrics
+from core.cache import TTLCache
+
+# Отметка в кэше: пользователя с таким именем нет
+_NOT_FOUND = object()
+
+
+class UserPrincipal:
+    """Данные пользователя, нужные для проверки доступа.
+
+    Не связан с сессией БД, поэтому его можно кэшировать и передавать
+    между потоками; для изменения пользователя нужно загрузить модель User.
+    """
+
+    __slots__ = ("id", "username", "role", "is_active")
+
+    def __init__(self, id: int, username: str, role: UserRole, is_active: int):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.is_active = is_active
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(user.id, user.username, user.role, user.is_active)
+
+    def __repr__(self):
+        return f"UserPrincipal(id={self.id}, username={self.username!r}, role={self.role.value})"
+
+
+class PrincipalCache:
+    """Кэш UserPrincipal по имени пользователя, в том числе отрицательный.
+
+    Запись сбрасывается явно при регистрации, активации и деактивации.
+    Кэш свой у каждого процесса, поэтому изменения, сделанные в другом
+    процессе, видны не позже чем через PRINCIPAL_CACHE_SECONDS.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float):
+        self._cache = TTLCache(maxsize, ttl)
+        self.negative_ttl = negative_ttl
+        self.negative_hits = 0
+
+    def _cached(self, username: str):
+        principal = self._cache.get(username)
+        if principal is _NOT_FOUND:
+            self.negative_hits += 1
+        return principal
+
+    def _fetch(self, db: Session, username: str) -> Optional[UserPrincipal]:
+        user = repository.user_by_username(db, username)
+        if user is None:
+            self._cache.set(username, _NOT_FOUND, ttl=self.negative_ttl)
+            return None
+        principal = UserPrincipal.from_user(user)
+        self._cache.set(username, principal)
+        return principal
+
+    def load(self, db: Session, username: str) -> Optional[UserPrincipal]:
+        principal = self._cached(username)
+        if principal is None:
+            return self._fetch(db, username)
+        return None if principal is _NOT_FOUND else principal
+
+    async def aload(self, db: Session, username: str) -> Optional[UserPrincipal]:
+        """То же, что load, но запрос к БД при промахе выполняется вне цикла событий."""
+        principal = self._cached(username)
+        if principal is None:
+            return await asyncio.to_thread(self._fetch, db, username)
+        return None if principal is _NOT_FOUND else principal
+
+    def invalidate(self, username: str):
+        self._cache.pop(username)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "negative_hits": self.negative_hits}
+
+
+principal_cache = PrincipalCache(
+    settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_CACHE_SECONDS, settings.PRINCIPAL_NEGATIVE_CACHE_SECONDS,
+)
+metrics.register("principals", principal_cache.stats)
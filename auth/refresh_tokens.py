@@ -0,0 +1,91 @@
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import repository
+from config import settings
+from models import RefreshToken, User
+
+
+def hash_token(token: str) -> str:
+    # Токен — 256 бит случайности, перебор невозможен, поэтому достаточно
+    # быстрого sha256 вместо bcrypt; по хэшу ищем через уникальный индекс
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_refresh_token(db: Session, user_id: int, family_id: Optional[str] = None) -> str:
+    """Создает refresh-токен (новую цепочку, если family_id не задан). Коммит за вызывающим."""
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        family_id=family_id or secrets.token_hex(16),
+        token_hash=hash_token(token),
+        expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+def _revoke_family(db: Session, family_id: str):
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rotate_refresh_token(db: Session, token: str) -> Tuple[User, str]:
+    """Обменивает refresh-токен на новый из той же цепочки.
+
+    Повторное предъявление уже обмененного токена означает, что он утек:
+    вся цепочка отзывается, и выйти из нее можно только новым входом.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Недействительный refresh-токен",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    record = db.query(RefreshToken).filter(RefreshToken.token_hash == hash_token(token)).first()
+    if record is None or record.revoked_at is not None or record.expires_at <= datetime.utcnow():
+        raise invalid
+    # Условное обновление: из двух одновременных обменов одного токена
+    # успешен только первый, второй считается повторным использованием
+    claimed = db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == record.id, RefreshToken.used_at.is_(None))
+        .values(used_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    user = repository.user_by_id(db, record.user_id)
+    if not claimed or user is None or user.is_active == 0:
+        _revoke_family(db, record.family_id)
+        db.commit()
+        raise invalid
+    new_token = issue_refresh_token(db, user.id, record.family_id)
+    db.commit()
+    return user, new_token
+
+
+def revoke_refresh_token(db: Session, token: str) -> bool:
+    """Отзывает цепочку, к которой относится токен (выход на устройстве)."""
+    record = db.query(RefreshToken).filter(RefreshToken.token_hash == hash_token(token)).first()
+    if record is None:
+        return False
+    _revoke_family(db, record.family_id)
+    db.commit()
+    return True
+
+
+def revoke_user_tokens(db: Session, user_id: int):
+    """Отзывает все refresh-токены пользователя. Коммит за вызывающим."""
+    db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
@@ -1,18 +1,23 @@
+import hashlib
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 
+import repository
 from config import settings
-from models import User, UserRole
+from models import UserRole
 from database import get_db
 from schemas import TokenData
+from auth.principal import UserPrincipal, principal_cache
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = "HS256"
+# Токены восстановления пароля не должны приниматься как токены доступа
+PASSWORD_RESET_SCOPE = "password_reset"
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -30,7 +35,7 @@ def get_password_hash(password):
 
 # Получение пользователя по имени
 def get_user(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+    return repository.user_by_username(db, username)
 
 
 # Аутентификация пользователя
@@ -45,6 +50,31 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 
+# Отпечаток хэша пароля в токене восстановления: после смены пароля
+# токен перестает совпадать, поэтому ссылка из письма работает один раз
+def password_fingerprint(hashed_password: str) -> str:
+    return hashlib.sha256(hashed_password.encode()).hexdigest()[:16]
+
+
+def create_password_reset_token(username: str, hashed_password: str) -> str:
+    return create_access_token(
+        data={"sub": username, "scope": PASSWORD_RESET_SCOPE, "pwd": password_fingerprint(hashed_password)},
+        expires_delta=timedelta(minutes=settings.PASSWORD_RESET_TOKEN_EXPIRE_MINUTES),
+    )
+
+
+# Возвращает (имя пользователя, отпечаток пароля) или None, если токен
+# недействителен или выдан не для восстановления пароля
+def decode_password_reset_token(token: str) -> Optional[tuple]:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("scope") != PASSWORD_RESET_SCOPE or not payload.get("sub") or not payload.get("pwd"):
+        return None
+    return payload["sub"], payload["pwd"]
+
+
 # Создание токена доступа
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -53,11 +83,17 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-# Получение текущего пользователя по токену
-def get_current_user(
+# Получение текущего пользователя по токену. Зависимость асинхронная:
+# при попадании в кэш не нужен переход в пул потоков
+async def get_current_user(
+        request: Request,
         token: str = Depends(oauth2_scheme),
         db: Session = Depends(get_db)
-):
+) -> UserPrincipal:
+    # Пакетный запрос уже проверил токен, подзапросы получают его пользователя
+    batch_user = getattr(request.state, "batch_user", None)
+    if batch_user is not None:
+        return batch_user
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Не удалось подтвердить учетные данные",
@@ -66,26 +102,26 @@ def get_current_user(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("scope") == PASSWORD_RESET_SCOPE:
             raise credentials_exception
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(db, username=token_data.username)
+    user = await principal_cache.aload(db, token_data.username)
     if user is None or user.is_active == 0:
         raise credentials_exception
     return user
 
 
 # Проверка активного пользователя
-def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user(current_user: UserPrincipal = Depends(get_current_user)):
     if current_user.is_active == 0:
         raise HTTPException(status_code=400, detail="Неактивный пользователь")
     return current_user
 
 
 # Проверка администратора
-def get_current_active_admin(current_user: User = Depends(get_current_user)):
+async def get_current_active_admin(current_user: UserPrincipal = Depends(get_current_user)):
     if current_user.role != UserRole.admin:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
     return current_user
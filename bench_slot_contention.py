@@ -0,0 +1,124 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.exc import OperationalError
+
+# Добавляем путь к проекту, чтобы можно было импортировать modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from database import Base, SessionLocal, engine
+from models import User, UserRole, Product, ServiceSlot, SlotReservation
+from core import slots
+
+
+def prepare(clients: int, capacity: int):
+    db = SessionLocal()
+    try:
+        product = Product(name="Бенчмарк слотов", price=1.0, category="bench", available=1)
+        db.add(product)
+        users = [
+            User(username=f"slot_bench_{time.time_ns()}_{i}", email=f"slot_bench_{time.time_ns()}_{i}@example.com",
+                 hashed_password="x", role=UserRole.client)
+            for i in range(clients)
+        ]
+        db.add_all(users)
+        db.commit()
+        slot_date = date.today() + timedelta(days=1)
+        slots.set_capacity(db, product.id, slot_date, slot_date, capacity)
+        return product.id, slot_date, [user.id for user in users]
+    finally:
+        db.close()
+
+
+def cleanup(product_id: int, user_ids):
+    db = SessionLocal()
+    try:
+        slot_ids = db.execute(select(ServiceSlot.id).where(ServiceSlot.product_id == product_id)).scalars().all()
+        db.execute(delete(SlotReservation).where(SlotReservation.slot_id.in_(slot_ids)))
+        db.execute(delete(ServiceSlot).where(ServiceSlot.product_id == product_id))
+        db.execute(delete(Product).where(Product.id == product_id))
+        db.execute(delete(User).where(User.id.in_(user_ids)))
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(product_id: int, slot_date: date, user_ids, attempts: int):
+    results = {"held": 0, "full": 0, "errors": 0}
+    lock = threading.Lock()
+    start = threading.Barrier(len(user_ids) + 1)
+
+    def client(user_id: int):
+        db = SessionLocal()
+        start.wait()
+        try:
+            for _ in range(attempts):
+                try:
+                    slots.hold(db, user_id, product_id, slot_date, 1)
+                    outcome = "held"
+                except HTTPException:
+                    outcome = "full"
+                except OperationalError:
+                    # SQLite не держит параллельную запись: "database is locked"
+                    db.rollback()
+                    outcome = "errors"
+                with lock:
+                    results[outcome] += 1
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=client, args=(user_id,)) for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный тест бронирования: много клиентов одновременно бронируют один день",
+    )
+    parser.add_argument("--clients", type=int, default=200, help="количество одновременных клиентов")
+    parser.add_argument("--capacity", type=int, default=100, help="вместимость слота")
+    parser.add_argument("--attempts", type=int, default=1, help="попыток бронирования на клиента")
+    parser.add_argument("--keep", action="store_true", help="не удалять тестовые данные")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    product_id, slot_date, user_ids = prepare(args.clients, args.capacity)
+    try:
+        results, elapsed = run(product_id, slot_date, user_ids, args.attempts)
+        db = SessionLocal()
+        try:
+            reserved = db.execute(
+                select(ServiceSlot.reserved).where(ServiceSlot.product_id == product_id)
+            ).scalar()
+        finally:
+            db.close()
+        total = sum(results.values())
+        print(f"Клиентов: {args.clients}, попыток: {total}, вместимость: {args.capacity}")
+        print(f"Забронировано: {results['held']}, отказов (нет мест): {results['full']}, ошибок БД: {results['errors']}")
+        print(f"Время: {elapsed:.3f} с, пропускная способность: {total / elapsed:.1f} попыток/с, "
+              f"{results['held'] / elapsed:.1f} броней/с")
+        print(f"Занято в слоте: {reserved}")
+        if reserved != results["held"] or reserved > args.capacity:
+            print("ОШИБКА: счетчик занятых мест не совпадает с числом броней")
+            sys.exit(1)
+        print("Перебронирования нет")
+    finally:
+        if not args.keep:
+            cleanup(product_id, user_ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import delete
+
+# Добавляем путь к проекту, чтобы можно было импортировать modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+import repository
+from database import Base, SessionLocal, engine
+from models import User, UserRole, Product, CartItem, Order, OrderStatus
+from core.partitions import ensure_partitions
+
+
+def prepare():
+    db = SessionLocal()
+    try:
+        suffix = time.time_ns()
+        user = User(username=f"stmt_bench_{suffix}", email=f"stmt_bench_{suffix}@example.com",
+                    hashed_password="x", role=UserRole.client)
+        product = Product(name="Бенчмарк запросов", price=1.0, category="bench", available=1)
+        db.add_all([user, product])
+        db.flush()
+        db.add(CartItem(user_id=user.id, product_id=product.id, quantity=1))
+        order = Order(user_id=user.id, order_date=datetime.utcnow(), status=OrderStatus.pending, total_price=1.0)
+        db.add(order)
+        db.commit()
+        return user.username, user.id, product.id, order.id
+    finally:
+        db.close()
+
+
+def cleanup(user_id: int, product_id: int, order_id: int):
+    db = SessionLocal()
+    try:
+        db.execute(delete(Order).where(Order.id == order_id))
+        db.execute(delete(CartItem).where(CartItem.user_id == user_id))
+        db.execute(delete(Product).where(Product.id == product_id))
+        db.execute(delete(User).where(User.id == user_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def lookups(username: str, user_id: int, product_id: int, order_id: int):
+    # Пары: запрос в прежнем виде и его вариант из repository
+    return {
+        "user_by_username": (
+            lambda db: db.query(User).filter(User.username == username).first(),
+            lambda db: repository.user_by_username(db, username),
+        ),
+        "product_by_id": (
+            lambda db: db.query(Product).filter(Product.id == product_id).first(),
+            lambda db: repository.product_by_id(db, product_id),
+        ),
+        "cart_items_for_user": (
+            lambda db: db.query(CartItem).filter(CartItem.user_id == user_id).all(),
+            lambda db: repository.cart_items_for_user(db, user_id),
+        ),
+        "order_for_user": (
+            lambda db: db.query(Order).filter(Order.id == order_id, Order.user_id == user_id).first(),
+            lambda db: repository.order_for_user(db, order_id, user_id),
+        ),
+    }
+
+
+def measure(lookup, iterations: int) -> float:
+    """Среднее время одного вызова в микросекундах."""
+    db = SessionLocal()
+    try:
+        for _ in range(min(iterations, 100)):
+            lookup(db)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            lookup(db)
+            # Без этого объекты берутся из карты идентичности сессии
+            db.expunge_all()
+        return (time.perf_counter() - started) / iterations * 1_000_000
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Сравнение частых запросов через db.query и через repository (lambda_stmt). "
+                    "На SQLite время почти целиком — накладные расходы Python",
+    )
+    parser.add_argument("--iterations", type=int, default=5000, help="вызовов каждого запроса")
+    parser.add_argument("--keep", action="store_true", help="не удалять тестовые данные")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    ensure_partitions(engine)
+    username, user_id, product_id, order_id = prepare()
+    try:
+        print(f"{engine.dialect.name}, {args.iterations} вызовов, мкс на вызов")
+        print(f"{'запрос':<22}{'db.query':>10}{'repository':>12}{'экономия':>10}")
+        for name, (legacy, cached) in lookups(username, user_id, product_id, order_id).items():
+            legacy_us = measure(legacy, args.iterations)
+            cached_us = measure(cached, args.iterations)
+            print(f"{name:<22}{legacy_us:>10.1f}{cached_us:>12.1f}{(1 - cached_us / legacy_us) * 100:>9.1f}%")
+    finally:
+        if not args.keep:
+            cleanup(user_id, product_id, order_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import argparse
+import os
+import sys
+
+# Добавляем путь к проекту, чтобы можно было импортировать modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from core.recommendations import recommender
+
+
+# Построение индекса "часто заказывают вместе" по позициям заказов
+def main():
+    parser = argparse.ArgumentParser(description="Построение матрицы совместных покупок")
+    parser.add_argument("--full", action="store_true", help="пересобрать индекс с нуля вместо инкрементального обновления")
+    args = parser.parse_args()
+
+    print("Строим индекс совместных покупок...")
+    result = recommender.build(incremental=not args.full)
+    print(f"Готово: {result}")
+
+
+if __name__ == "__main__":
+    main()
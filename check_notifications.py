@@ -0,0 +1,194 @@
+import argparse
+import email
+import email.policy
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import delete
+
+# Добавляем путь к проекту, чтобы можно было импортировать modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from config import settings
+from database import Base, SessionLocal, engine
+from models import User, UserRole, Product, Order, OrderItem, OrderStatus
+from auth.security import decode_password_reset_token, password_fingerprint
+from core.notifications import send_order_confirmation, send_password_reset_email
+from core.partitions import ensure_partitions
+
+
+# Проверка писем: задачи уведомлений отправляют почту на SMTP-заглушку на
+# localhost, а скрипт проверяет полученные письма. Заглушка — aiosmtpd, если
+# он установлен, иначе модуль smtpd стандартной библиотеки (до Python 3.12)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class SmtpStandIn:
+    """SMTP-сервер на localhost, складывающий полученные письма в messages."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.messages = []
+        self._stop = None
+
+    def _received(self, data: bytes):
+        self.messages.append(email.message_from_bytes(data, policy=email.policy.default))
+
+    def start(self):
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError:
+            self._start_smtpd()
+            return
+        stand_in = self
+
+        class Handler:
+            async def handle_DATA(self, server, session, envelope):
+                stand_in._received(envelope.content)
+                return "250 OK"
+
+        controller = Controller(Handler(), hostname="127.0.0.1", port=self.port)
+        controller.start()
+        self._stop = controller.stop
+
+    def _start_smtpd(self):
+        import asyncore
+        import smtpd
+
+        stand_in = self
+
+        class Server(smtpd.SMTPServer):
+            def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+                stand_in._received(data)
+
+        server = Server(("127.0.0.1", self.port), None, decode_data=False)
+        thread = threading.Thread(target=asyncore.loop, kwargs={"timeout": 0.1}, daemon=True)
+        thread.start()
+
+        def stop():
+            server.close()
+            thread.join()
+
+        self._stop = stop
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop()
+
+    def wait(self, count: int, timeout: float = 5.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while len(self.messages) < count and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return len(self.messages) >= count
+
+
+def prepare():
+    db = SessionLocal()
+    try:
+        suffix = time.time_ns()
+        user = User(username=f"mail_check_{suffix}", email=f"mail_check_{suffix}@example.com",
+                    hashed_password="x", role=UserRole.client)
+        product = Product(name="Проверка писем", price=12.5, category="check", available=1)
+        db.add_all([user, product])
+        db.flush()
+        order_date = datetime.utcnow()
+        order = Order(user_id=user.id, order_date=order_date, status=OrderStatus.pending, total_price=25.0)
+        db.add(order)
+        db.flush()
+        db.add(OrderItem(order_id=order.id, order_date=order_date, product_id=product.id,
+                         product_name=product.name, product_category=product.category, quantity=2, price=12.5))
+        db.commit()
+        return user.id, user.username, user.email, user.hashed_password, product.id, order.id
+    finally:
+        db.close()
+
+
+def cleanup(user_id: int, product_id: int, order_id: int):
+    db = SessionLocal()
+    try:
+        db.execute(delete(OrderItem).where(OrderItem.order_id == order_id))
+        db.execute(delete(Order).where(Order.id == order_id))
+        db.execute(delete(Product).where(Product.id == product_id))
+        db.execute(delete(User).where(User.id == user_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def check_password_reset(message, username: str, address: str, hashed_password: str) -> list:
+    errors = []
+    if message["To"] != address:
+        errors.append(f"адресат {message['To']!r}, ожидался {address!r}")
+    body = message.get_content()
+    prefix = re.escape(settings.PASSWORD_RESET_URL.split("{token}")[0])
+    match = re.search(prefix + r"([\w.-]+)", body)
+    if match is None:
+        errors.append("в письме нет ссылки PASSWORD_RESET_URL")
+    elif decode_password_reset_token(match.group(1)) != (username, password_fingerprint(hashed_password)):
+        errors.append("токен из ссылки не принимается для восстановления пароля")
+    return errors
+
+
+def check_order_confirmation(message, address: str, order_id: int) -> list:
+    errors = []
+    if message["To"] != address:
+        errors.append(f"адресат {message['To']!r}, ожидался {address!r}")
+    if message["Subject"] != f"Заказ #{order_id} принят":
+        errors.append(f"тема {message['Subject']!r}")
+    body = message.get_content()
+    for expected in ("Проверка писем: 2 x 12.50", "Итого: 25.00"):
+        if expected not in body:
+            errors.append(f"в письме нет строки {expected!r}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Отправка писем восстановления пароля и подтверждения заказа на SMTP-заглушку на localhost",
+    )
+    parser.add_argument("--port", type=int, default=0, help="порт заглушки (0 - любой свободный)")
+    parser.add_argument("--keep", action="store_true", help="не удалять тестовые данные")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    ensure_partitions(engine)
+    stand_in = SmtpStandIn(args.port or _free_port())
+    # Задачи читают настройки при каждой отправке
+    settings.SMTP_HOST, settings.SMTP_PORT = "127.0.0.1", stand_in.port
+    settings.SMTP_USE_TLS, settings.SMTP_USERNAME = False, None
+    stand_in.start()
+    user_id, username, address, hashed_password, product_id, order_id = prepare()
+    try:
+        send_password_reset_email(user_id)
+        send_order_confirmation(order_id)
+        if not stand_in.wait(2):
+            print(f"Получено писем: {len(stand_in.messages)} из 2")
+            sys.exit(1)
+        reset, confirmation = stand_in.messages
+        failures = {
+            "send_password_reset_email": check_password_reset(reset, username, address, hashed_password),
+            "send_order_confirmation": check_order_confirmation(confirmation, address, order_id),
+        }
+    finally:
+        stand_in.stop()
+        if not args.keep:
+            cleanup(user_id, product_id, order_id)
+    for task, errors in failures.items():
+        print(f"{task}: {'OK' if not errors else '; '.join(errors)}")
+    if any(failures.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+
+# Добавляем путь к проекту, чтобы можно было импортировать modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from config import settings
+from database import Base
+from models import (
+    User, UserRole, Product, CartItem, Order, OrderItem, OrderStatus, IdempotencyKey, Job, OrderArchive,
+    ServiceSlot, SlotReservation, RefreshToken, AuditEvent,
+)
+
+
+# Запросы маршрутов, которые должны выполняться по индексу
+def router_queries(dialect: str):
+    queries = {
+        "auth.get_user": select(User).where(User.username == "user_1"),
+        "auth.register": select(User).where((User.username == "user_1") | (User.email == "user_1@example.com")),
+        "products.get_product": select(Product).where(Product.id == 1, Product.available == 1),
+        "cart.display_cart": select(CartItem).where(CartItem.user_id == 1),
+        "cart.add_in_cart": select(CartItem).where(CartItem.user_id == 1, CartItem.product_id == 1),
+        "auth.refresh": select(RefreshToken).where(RefreshToken.token_hash == "0" * 64),
+        "users.revoke_refresh_tokens": select(RefreshToken).where(RefreshToken.user_id == 1),
+        "users.search_by_role": select(User).where(
+            User.role == UserRole.admin, User.is_active == 1, User.id > 0,
+        ).order_by(User.id).limit(50),
+        "cart.delete_from_cart": select(CartItem).where(CartItem.id == 1, CartItem.user_id == 1),
+        "cleanup.abandoned_carts": select(CartItem.user_id).where(CartItem.user_id > 1)
+        .group_by(CartItem.user_id).having(func.max(CartItem.updated_at) < datetime(2024, 1, 1))
+        .order_by(CartItem.user_id).limit(500),
+        "orders.get_my_orders": select(Order).where(Order.user_id == 1).order_by(Order.order_date.desc()),
+        "orders.get_order_details": select(Order).where(Order.id == 1, Order.user_id == 1),
+        "orders.order_items": select(OrderItem).where(
+            OrderItem.order_id == 1, OrderItem.order_date == datetime(2024, 1, 1),
+        ),
+        "orders.items_by_product": select(OrderItem).where(OrderItem.product_id == 1),
+        "orders.get_order_admin": select(Order).where(Order.id == 1),
+        "orders.get_order_archived": select(OrderArchive).where(OrderArchive.order_id == 1),
+        "idempotency.lookup": select(IdempotencyKey).where(
+            IdempotencyKey.user_id == 1, IdempotencyKey.scope == "createOrder", IdempotencyKey.key == "k",
+        ),
+        "jobs.claim": select(Job).where(Job.status == "queued", Job.run_at <= datetime(2030, 1, 1)).order_by(Job.run_at),
+        "slots.lookup": select(ServiceSlot.id).where(
+            ServiceSlot.product_id == 1, ServiceSlot.slot_date == datetime(2024, 1, 1).date(),
+        ),
+        "slots.expire_holds": select(SlotReservation).where(
+            SlotReservation.status == "held", SlotReservation.expires_at <= datetime(2030, 1, 1),
+        ),
+        "slots.consume_hold": select(SlotReservation).where(
+            SlotReservation.user_id == 1, SlotReservation.slot_id == 1, SlotReservation.status == "held",
+        ),
+        "slots.release_for_orders": select(SlotReservation).where(SlotReservation.order_id == 1),
+        "admin.audit_log": select(AuditEvent).where(
+            AuditEvent.entity_type == "order", AuditEvent.entity_id == 1, AuditEvent.id < 1000,
+        ).order_by(AuditEvent.id.desc()).limit(100),
+    }
+    if dialect == "postgresql":
+        # SQLite не использует индексы по выражениям для LIKE
+        queries.update({
+            "users.search_prefix": select(User).where(
+                func.lower(User.username).like("us%") | func.lower(User.email).like("us%"),
+            ).order_by(User.id).limit(50),
+            "users.search_substring": select(User).where(
+                User.username.ilike("%ser_1%") | User.email.ilike("%ser_1%"),
+            ).order_by(User.id).limit(50),
+        })
+    return queries
+
+
+def seed(db_connection, users: int, products: int, orders_per_user: int):
+    print(f"Заполняем БД: {users} пользователей, {products} товаров, {users * orders_per_user} заказов...")
+    now = datetime.utcnow()
+    db_connection.execute(User.__table__.insert(), [
+        {"username": f"user_{i}", "email": f"user_{i}@example.com", "hashed_password": "x",
+         "role": UserRole.client, "is_active": 1}
+        for i in range(1, users + 1)
+    ])
+    db_connection.execute(Product.__table__.insert(), [
+        {"name": f"Услуга {i}", "price": 10.0 + i % 50, "category": f"Категория {i % 10}", "available": 1}
+        for i in range(1, products + 1)
+    ])
+    user_ids = [row[0] for row in db_connection.execute(select(User.id))]
+    product_ids = [row[0] for row in db_connection.execute(select(Product.id))]
+    db_connection.execute(CartItem.__table__.insert(), [
+        {"user_id": user_id, "product_id": random.choice(product_ids), "quantity": 1}
+        for user_id in user_ids
+    ])
+    db_connection.execute(Order.__table__.insert(), [
+        {"user_id": user_id, "order_date": now - timedelta(days=random.randint(0, 365)),
+         "status": random.choice(list(OrderStatus)), "total_price": 20.0,
+         "item_count": 2}
+        for user_id in user_ids for _ in range(orders_per_user)
+    ])
+    orders = db_connection.execute(select(Order.id, Order.order_date)).all()
+    db_connection.execute(OrderItem.__table__.insert(), [
+        {"order_id": order_id, "order_date": order_date, "product_id": random.choice(product_ids),
+         "product_name": "Товар", "quantity": 1, "price": 10.0}
+        for order_id, order_date in orders for _ in range(2)
+    ])
+
+
+def explain(connection, statement) -> list:
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "postgresql":
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return list(_pg_nodes(plan[0]["Plan"]))
+    # SQLite: "SCAN <таблица>" без индекса — полный просмотр таблицы
+    return [row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+def _pg_nodes(node):
+    yield f'{node["Node Type"]} {node.get("Relation Name", "")} {node.get("Index Name", "")}'.strip()
+    for child in node.get("Plans", []):
+        yield from _pg_nodes(child)
+
+
+def is_sequential_scan(dialect: str, step: str) -> bool:
+    if dialect == "postgresql":
+        return step.startswith("Seq Scan")
+    return step.startswith("SCAN ") and " USING " not in step
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Проверка планов запросов маршрутов на последовательное сканирование. "
+                    "Без --database-url проверка идет на временной БД SQLite с синтетическими данными",
+    )
+    parser.add_argument("--database-url", help="БД для проверки (не рабочая БД приложения)")
+    parser.add_argument("--seed", action="store_true",
+                        help="заполнить пустую БД из --database-url синтетическими данными перед проверкой")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--orders-per-user", type=int, default=5)
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.database_url is None:
+        temp_dir = tempfile.mkdtemp(prefix="query_plans_")
+        database_url, seed_database = f"sqlite:///{os.path.join(temp_dir, 'plans.db')}", True
+    else:
+        database_url, seed_database = args.database_url, args.seed
+        # Синтетические данные не должны попасть в рабочую БД
+        if seed_database and make_url(database_url) == make_url(settings.DATABASE_URL):
+            parser.error("--seed нельзя применять к БД приложения (DATABASE_URL); укажите отдельную БД")
+
+    engine = create_engine(database_url)
+    try:
+        failures = check(engine, seed_database, args)
+    except IntegrityError:
+        print("БД уже содержит данные: --seed заполняет только пустую БД. "
+              "Запустите без --seed или укажите другую --database-url")
+        sys.exit(2)
+    finally:
+        engine.dispose()
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if failures:
+        print(f"Последовательное сканирование в {failures} запросах")
+        sys.exit(1)
+    print("Все запросы используют индексы")
+
+
+def check(engine, seed_database: bool, args) -> int:
+    Base.metadata.create_all(bind=engine)
+    if seed_database:
+        with engine.begin() as connection:
+            seed(connection, args.users, args.products, args.orders_per_user)
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+
+    failures = 0
+    dialect = engine.dialect.name
+    with engine.connect() as connection:
+        if dialect == "postgresql":
+            # На маленьких таблицах планировщик честно выбирает Seq Scan;
+            # запрещаем его, чтобы проверить наличие подходящего индекса
+            connection.execute(text("SET enable_seqscan = off"))
+        for name, statement in router_queries(dialect).items():
+            plan = explain(connection, statement)
+            regressed = [step for step in plan if is_sequential_scan(dialect, step)]
+            failures += bool(regressed)
+            print(f"{'FAIL' if regressed else 'OK  '} {name}: {' -> '.join(plan)}")
+    return failures
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import os
+import sys
+
+# Добавляем путь к проекту, чтобы можно было импортировать modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from config import settings
+from database import Base, SessionLocal, engine
+from core.cleanup import run_cleanup
+
+TASKS = ["carts", "idempotency_keys", "refresh_tokens", "slot_holds", "jobs"]
+
+
+# Удаление брошенных корзин и устаревших служебных данных пачками
+def main():
+    parser = argparse.ArgumentParser(description="Очистка брошенных корзин и устаревших служебных данных")
+    parser.add_argument("--cart-max-age-days", type=int, default=settings.CLEANUP_CART_MAX_AGE_DAYS,
+                        help="удалять корзины, не менявшиеся дольше этого числа дней")
+    parser.add_argument("--batch-size", type=int, default=settings.CLEANUP_BATCH_SIZE,
+                        help="строк (для корзин — пользователей) в одной транзакции")
+    parser.add_argument("--sleep", type=float, default=settings.CLEANUP_SLEEP_SECONDS,
+                        help="пауза между пачками, секунд")
+    parser.add_argument("--max-rows-per-second", type=int, default=settings.CLEANUP_MAX_ROWS_PER_SECOND,
+                        help="ограничение скорости удаления (0 - без ограничения)")
+    parser.add_argument("--only", choices=TASKS, action="append", help="выполнить только указанные задачи")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        reports = run_cleanup(
+            db,
+            cart_max_age_days=args.cart_max_age_days,
+            batch_size=args.batch_size,
+            sleep_seconds=args.sleep,
+            max_rows_per_second=args.max_rows_per_second,
+            tasks=args.only,
+        )
+    finally:
+        db.close()
+    for report in reports:
+        print(f"{report['task']}: удалено {report['rows']} строк за {report['seconds']} с "
+              f"({report['rows_per_second']} строк/с)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -5,6 +7,73 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     DATABASE_URL: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_WAIT_TIMEOUT_SECONDS: float = 30.0
+    ORDER_EVENTS_PG_BRIDGE: bool = False
+    ORDER_EVENTS_HEARTBEAT_SECONDS: float = 15.0
+    ORDER_EVENTS_HISTORY_SIZE: int = 1000
+    ORDER_EVENTS_QUEUE_SIZE: int = 100
+    JOB_QUEUE_DURABLE: bool = False
+    JOB_QUEUE_CONCURRENCY: int = 4
+    JOB_QUEUE_MAX_SIZE: int = 1000
+    JOB_QUEUE_MAX_ATTEMPTS: int = 5
+    JOB_QUEUE_RETRY_BASE_SECONDS: float = 2.0
+    JOB_QUEUE_POLL_SECONDS: float = 1.0
+    SMTP_HOST: str = "localhost"
+    SMTP_PORT: int = 25
+    SMTP_USERNAME: Optional[str] = None
+    SMTP_PASSWORD: Optional[str] = None
+    SMTP_USE_TLS: bool = False
+    SMTP_FROM: str = "noreply@example.com"
+    PASSWORD_RESET_TOKEN_EXPIRE_MINUTES: int = 15
+    # Страница фронтенда: она спрашивает новый пароль и отправляет его
+    # вместе с токеном в POST /auth/reset-password
+    PASSWORD_RESET_URL: str = "http://localhost:3000/reset-password?token={token}"
+    RECOMMENDATIONS_DIR: str = "data/recommendations"
+    RECOMMENDATIONS_TOP_K: int = 20
+    RECOMMENDATIONS_REFRESH_ON_ORDER: bool = True
+    ORDER_PARTITION_MONTHS_AHEAD: int = 3
+    ORDER_ARCHIVE_AFTER_MONTHS: int = 12
+    SLOT_HOLD_MINUTES: int = 15
+    SLOT_AVAILABILITY_CACHE_SECONDS: float = 5.0
+    SLOT_AVAILABILITY_CACHE_SIZE: int = 10000
+    CART_STORE: str = "sql"  # sql или memory (только при одном рабочем процессе)
+    CART_SNAPSHOT_PATH: str = "data/carts.json"
+    CART_SNAPSHOT_SECONDS: float = 5.0
+    CLEANUP_INTERVAL_MINUTES: int = 60  # 0 - плановая очистка выключена
+    CLEANUP_CART_MAX_AGE_DAYS: int = 30
+    CLEANUP_JOB_MAX_AGE_DAYS: int = 7
+    CLEANUP_BATCH_SIZE: int = 500
+    CLEANUP_SLEEP_SECONDS: float = 0.1
+    CLEANUP_MAX_ROWS_PER_SECOND: int = 5000
+    BATCH_MAX_REQUESTS: int = 20
+    MEDIA_ROOT: str = "data/media"
+    IMAGE_MAX_UPLOAD_BYTES: int = 10 * 1024 * 1024
+    IMAGE_THUMBNAIL_BUDGET_BYTES: int = 512 * 1024 * 1024
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_IP_PER_MINUTE: int = 30
+    RATE_LIMIT_IP_BURST: int = 10
+    RATE_LIMIT_USERNAME_PER_MINUTE: int = 10
+    RATE_LIMIT_USERNAME_BURST: int = 5
+    RATE_LIMIT_REDIS_URL: Optional[str] = None  # общий лимит для всех процессов; нужен пакет redis
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_SECONDS: float = 30.0
+    PRINCIPAL_NEGATIVE_CACHE_SECONDS: float = 5.0
+    ESTIMATE_CACHE_SECONDS: float = 60.0
+    DB_PREPARE_THRESHOLD: int = 5  # только для драйвера psycopg (postgresql+psycopg://)
+    DB_QUERY_CACHE_SIZE: int = 500  # размер кэша скомпилированных запросов SQLAlchemy
+    DASHBOARD_SNAPSHOT_SECONDS: float = 15.0
+    DASHBOARD_TOP_PRODUCTS: int = 5
+    PROFILING_ENABLED: bool = False  # без него профилирование не подключается и ничего не стоит
+    PROFILING_SAMPLE_RATE: float = 0.0  # доля случайных запросов, выполняемых под профилировщиком
+    PROFILING_DIR: str = "data/profiles"
+    PROFILING_MAX_REPORTS: int = 200
+    AUDIT_BUFFER_SIZE: int = 10000
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_SECONDS: float = 2.0
+    AUDIT_MAX_BLOCK_SECONDS: float = 0.5  # сколько record() ждет места в полном буфере
 
     class Config:
         env_file = ".env"
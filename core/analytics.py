@@ -0,0 +1,169 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import delete, func, insert, select, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import (
+    Order, OrderItem, OrderStatus, Product,
+    DailySales, OrderStatusCount, ProductSales, CategorySales,
+)
+
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _increment(db: Session, model, keys: dict, deltas: dict):
+    dialect = db.get_bind().dialect.name
+    upsert = _UPSERT_INSERTS.get(dialect)
+    if upsert is not None:
+        statement = upsert(model).values(**keys, **deltas)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: getattr(model, column) + statement.excluded[column] for column in deltas},
+        )
+        db.execute(statement)
+        return
+    updated = db.query(model).filter_by(**keys).update(
+        {getattr(model, column): getattr(model, column) + value for column, value in deltas.items()},
+        synchronize_session=False,
+    )
+    if not updated:
+        db.execute(insert(model).values(**keys, **deltas))
+
+
+def _apply_sales(db: Session, day, total_price: float, lines: Iterable[Tuple[int, str, int, float]], sign: int):
+    _increment(db, DailySales, {"day": day}, {"order_count": sign, "revenue": sign * total_price})
+    by_category: Dict[str, list] = defaultdict(lambda: [0, 0.0])
+    for product_id, category, quantity, price in lines:
+        # Товар удален (ON DELETE SET NULL): по товару учитывать нечего, как
+        # и в rebuild(), а категория берется из снимка позиции
+        if product_id is not None:
+            _increment(db, ProductSales, {"product_id": product_id},
+                       {"quantity": sign * quantity, "revenue": sign * quantity * price})
+        by_category[category or ""][0] += quantity
+        by_category[category or ""][1] += quantity * price
+    for category, (quantity, revenue) in by_category.items():
+        _increment(db, CategorySales, {"category": category},
+                   {"quantity": sign * quantity, "revenue": sign * revenue})
+
+
+def apply_order_created(db: Session, order: Order, lines: List[Tuple[int, str, int, float]]):
+    """Учитывает новый заказ в сводных таблицах в текущей транзакции.
+
+    lines — позиции заказа в виде (product_id, category, quantity, price).
+    """
+    _increment(db, OrderStatusCount, {"status": order.status}, {"order_count": 1})
+    if order.status != OrderStatus.cancelled:
+        _apply_sales(db, order.order_date.date(), order.total_price, lines, sign=1)
+
+
+def apply_status_changes(db: Session, changes: List[Tuple[int, OrderStatus, OrderStatus]]):
+    """Учитывает смену статусов заказов: changes — список (order_id, old_status, new_status)."""
+    changes = [(order_id, old, new) for order_id, old, new in changes if old != new]
+    if not changes:
+        return
+
+    status_deltas: Dict[OrderStatus, int] = defaultdict(int)
+    for _, old, new in changes:
+        status_deltas[old] -= 1
+        status_deltas[new] += 1
+    for status, delta in status_deltas.items():
+        if delta:
+            _increment(db, OrderStatusCount, {"status": status}, {"order_count": delta})
+
+    # Выручка меняется только при отмене заказа или возврате из отмены
+    signs = {
+        order_id: -1 if new == OrderStatus.cancelled else 1
+        for order_id, old, new in changes
+        if (old == OrderStatus.cancelled) != (new == OrderStatus.cancelled)
+    }
+    if not signs:
+        return
+    orders = db.execute(
+        select(Order.id, Order.order_date, Order.total_price).where(Order.id.in_(signs))
+    ).all()
+    lines = defaultdict(list)
+    for order_id, product_id, category, quantity, price in db.execute(
+        select(OrderItem.order_id, OrderItem.product_id, OrderItem.product_category,
+               OrderItem.quantity, OrderItem.price)
+        .where(OrderItem.order_id.in_(signs))
+    ):
+        lines[order_id].append((product_id, category, quantity, price))
+    for order_id, order_date, total_price in orders:
+        _apply_sales(db, order_date.date(), total_price, lines[order_id], signs[order_id])
+
+
+def rebuild(db: Session):
+    """Полностью пересчитывает сводные таблицы по заказам (заполнение и восстановление)."""
+    for model in (DailySales, OrderStatusCount, ProductSales, CategorySales):
+        db.execute(delete(model))
+
+    not_cancelled = Order.status != OrderStatus.cancelled
+    day = func.date(Order.order_date)
+    db.execute(insert(DailySales).from_select(
+        ["day", "order_count", "revenue"],
+        select(day, func.count(Order.id), func.sum(Order.total_price)).where(not_cancelled).group_by(day),
+    ))
+    db.execute(insert(OrderStatusCount).from_select(
+        ["status", "order_count"],
+        select(Order.status, func.count(Order.id)).where(Order.status.is_not(None)).group_by(Order.status),
+    ))
+    revenue = func.sum(OrderItem.quantity * OrderItem.price)
+    db.execute(insert(ProductSales).from_select(
+        ["product_id", "quantity", "revenue"],
+        select(OrderItem.product_id, func.sum(OrderItem.quantity), revenue)
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(not_cancelled, OrderItem.product_id.is_not(None))
+        .group_by(OrderItem.product_id),
+    ))
+    category = func.coalesce(OrderItem.product_category, literal(""))
+    db.execute(insert(CategorySales).from_select(
+        ["category", "quantity", "revenue"],
+        select(category, func.sum(OrderItem.quantity), revenue)
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(not_cancelled)
+        .group_by(category),
+    ))
+    _rebuild_from_archive(db)
+    db.commit()
+
+
+def _rebuild_from_archive(db: Session):
+    # Архивные заказы хранятся сжатыми записями (core.archive): агрегируем их
+    # в памяти и добавляем к результатам запросов по живым таблицам
+    from core.archive import iter_archived_orders
+
+    # Архивные записи, созданные до появления снимка категории в позициях,
+    # дополняются текущей категорией товара
+    categories = dict(db.execute(select(Product.id, Product.category)).all())
+    status_counts = defaultdict(int)
+    daily = defaultdict(lambda: [0, 0.0])
+    products = defaultdict(lambda: [0, 0.0])
+    by_category = defaultdict(lambda: [0, 0.0])
+    for order in iter_archived_orders(db):
+        status_counts[order["status"]] += 1
+        if order["status"] == OrderStatus.cancelled:
+            continue
+        day = daily[order["order_date"].date()]
+        day[0] += 1
+        day[1] += order["total_price"]
+        for item in order["items"]:
+            revenue = item["quantity"] * item["price"]
+            if item["product_id"] is not None:
+                products[item["product_id"]][0] += item["quantity"]
+                products[item["product_id"]][1] += revenue
+            category = by_category[
+                item.get("product_category") or categories.get(item["product_id"]) or ""
+            ]
+            category[0] += item["quantity"]
+            category[1] += revenue
+
+    for status, count in status_counts.items():
+        _increment(db, OrderStatusCount, {"status": status}, {"order_count": count})
+    for day, (count, revenue) in daily.items():
+        _increment(db, DailySales, {"day": day}, {"order_count": count, "revenue": revenue})
+    for product_id, (quantity, revenue) in products.items():
+        _increment(db, ProductSales, {"product_id": product_id}, {"quantity": quantity, "revenue": revenue})
+    for category, (quantity, revenue) in by_category.items():
+        _increment(db, CategorySales, {"category": category}, {"quantity": quantity, "revenue": revenue})
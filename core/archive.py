@@ -0,0 +1,112 @@
+import json
+import time
+import zlib
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy.orm import Session, selectinload
+
+from models import Order, OrderItem, OrderStatus, OrderArchive
+from core.partitions import add_months
+
+# В архив переносятся только заказы в конечных статусах
+ARCHIVABLE_STATUSES = (OrderStatus.delivered, OrderStatus.cancelled)
+
+
+def _serialize(order: Order) -> dict:
+    return {
+        "id": order.id,
+        "user_id": order.user_id,
+        "order_date": order.order_date.isoformat(),
+        "status": order.status.name,
+        "total_price": order.total_price,
+        "item_count": order.item_count,
+        "items": [
+            {
+                "product_id": item.product_id,
+                "product_name": item.product_name or "",
+                "product_category": item.product_category,
+                "quantity": item.quantity,
+                "price": item.price,
+            }
+            for item in order.items
+        ],
+    }
+
+
+def _decode(payload: bytes) -> dict:
+    data = json.loads(zlib.decompress(payload))
+    data["order_date"] = datetime.fromisoformat(data["order_date"])
+    data["status"] = OrderStatus[data["status"]]
+    data.setdefault("item_count", sum(item["quantity"] for item in data["items"]))
+    return data
+
+
+def archive_cutoff(older_than_months: int) -> datetime:
+    this_month = datetime.utcnow().date().replace(day=1)
+    return datetime.combine(add_months(this_month, -older_than_months), datetime.min.time())
+
+
+def archive_orders(db: Session, older_than_months: int, batch_size: int = 500, sleep_seconds: float = 0.0) -> int:
+    """Переносит завершенные заказы старше N месяцев в сжатый архив пачками.
+
+    Каждая пачка — отдельная короткая транзакция: вставка в order_archive и
+    удаление заказа с позициями из секционированных таблиц.
+    """
+    cutoff = archive_cutoff(older_than_months)
+    archived = 0
+    last_id = 0
+    while True:
+        orders = db.query(Order).options(
+            selectinload(Order.items)
+        ).filter(
+            Order.status.in_(ARCHIVABLE_STATUSES),
+            Order.order_date < cutoff,
+            Order.id > last_id,
+        ).order_by(Order.id).limit(batch_size).all()
+        if not orders:
+            break
+
+        ids = [order.id for order in orders]
+        db.add_all([
+            OrderArchive(
+                order_id=order.id,
+                user_id=order.user_id,
+                order_date=order.order_date,
+                status=order.status,
+                payload=zlib.compress(json.dumps(_serialize(order), ensure_ascii=False).encode("utf-8"), 9),
+            )
+            for order in orders
+        ])
+        db.query(OrderItem).filter(
+            OrderItem.order_id.in_(ids), OrderItem.order_date < cutoff
+        ).delete(synchronize_session=False)
+        db.query(Order).filter(
+            Order.id.in_(ids), Order.order_date < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+
+        archived += len(ids)
+        last_id = ids[-1]
+        if sleep_seconds:
+            time.sleep(sleep_seconds)
+    return archived
+
+
+def load_archived_order(db: Session, order_id: int) -> Optional[dict]:
+    record = db.query(OrderArchive).filter(OrderArchive.order_id == order_id).first()
+    return _decode(record.payload) if record else None
+
+
+def iter_archived_orders(db: Session, batch_size: int = 1000) -> Iterator[dict]:
+    last_id = 0
+    while True:
+        records = db.query(OrderArchive.order_id, OrderArchive.payload).filter(
+            OrderArchive.order_id > last_id
+        ).order_by(OrderArchive.order_id).limit(batch_size).all()
+        if not records:
+            return
+        for order_id, payload in records:
+            yield _decode(payload)
+        last_id = records[-1][0]
@@ -0,0 +1,183 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import insert
+
+from config import settings
+from database import SessionLocal
+from models import AuditEvent
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Предел паузы между повторами записи, пока БД недоступна
+MAX_RETRY_SECONDS = 60.0
+
+
+class AuditLog:
+    """Журнал изменений с отложенной записью.
+
+    record() только кладет событие в буфер в памяти, поэтому не удлиняет
+    запрос. Фоновый поток записывает буфер пачками одним INSERT, когда в нем
+    набирается batch_size событий или прошло flush_seconds. Буфер ограничен:
+    если запись в БД не успевает, record() ждет места не дольше
+    max_block_seconds, а затем событие отбрасывается; и ожидания, и потери
+    видны в метриках. При остановке приложения и выходе процесса буфер
+    дописывается.
+    """
+
+    def __init__(self, buffer_size: int, batch_size: int, flush_seconds: float, max_block_seconds: float):
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_block_seconds = max_block_seconds
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._has_events = threading.Condition(self._lock)
+        self._has_space = threading.Condition(self._lock)
+        # Пачки пишет один поток за раз: фоновый или вызвавший flush()
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+        self.flushes = 0
+        self.failures = 0
+        self.high_water = 0
+        self.last_flush_seconds = 0.0
+
+    def record(self, entity_type: str, entity_id: int, action: str, actor_id: Optional[int] = None,
+               old_value: Optional[str] = None, new_value: Optional[str] = None):
+        """Добавляет событие; вызывается после коммита изменения."""
+        event = {
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "action": action,
+            "actor_id": actor_id,
+            "old_value": old_value,
+            "new_value": new_value,
+            "created_at": datetime.utcnow(),
+        }
+        with self._lock:
+            if len(self._buffer) >= self.buffer_size:
+                self.blocked += 1
+                started = time.monotonic()
+                self._has_events.notify()
+                self._has_space.wait_for(lambda: len(self._buffer) < self.buffer_size, self.max_block_seconds)
+                self.blocked_seconds += time.monotonic() - started
+                if len(self._buffer) >= self.buffer_size:
+                    self.dropped += 1
+                    logger.warning("Журнал изменений переполнен, событие %s %s:%s отброшено",
+                                   action, entity_type, entity_id)
+                    return
+            self._buffer.append(event)
+            self.recorded += 1
+            self.high_water = max(self.high_water, len(self._buffer))
+            if len(self._buffer) >= self.batch_size:
+                self._has_events.notify()
+
+    def flush(self) -> bool:
+        """Записывает все накопленные события; возвращает после записи.
+
+        False — запись не удалась, события остались в буфере.
+        """
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                if not batch:
+                    return True
+                if not self._write(batch):
+                    return False
+
+    def _write(self, batch: list) -> bool:
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            db.execute(insert(AuditEvent), batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Не удалось записать журнал изменений, повтор при следующей записи")
+            with self._lock:
+                self.failures += 1
+                # Пачка возвращается в начало буфера; что не помещается — теряется
+                room = max(self.buffer_size - len(self._buffer), 0)
+                self.dropped += max(len(batch) - room, 0)
+                self._buffer.extendleft(reversed(batch[:room]))
+            return False
+        finally:
+            db.close()
+        with self._lock:
+            self.written += len(batch)
+            self.flushes += 1
+            self.last_flush_seconds = round(time.perf_counter() - started, 4)
+            self._has_space.notify_all()
+        return True
+
+    def _flush_loop(self):
+        retry_seconds = 0.0
+        while True:
+            with self._lock:
+                if retry_seconds:
+                    # После ошибки записи пауза выдерживается целиком: полный
+                    # буфер не должен превращать повторы в непрерывный цикл
+                    self._has_events.wait_for(lambda: self._stopping, retry_seconds)
+                else:
+                    self._has_events.wait_for(
+                        lambda: self._stopping or len(self._buffer) >= self.batch_size, self.flush_seconds,
+                    )
+                stopping = self._stopping
+            if self.flush():
+                retry_seconds = 0.0
+            else:
+                retry_seconds = min(max(retry_seconds * 2, self.flush_seconds), MAX_RETRY_SECONDS)
+            if stopping:
+                return
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._flush_loop, name="audit-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            with self._lock:
+                self._stopping = True
+                self._has_events.notify()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "buffered": len(self._buffer),
+                "buffer_size": self.buffer_size,
+                "high_water": self.high_water,
+                "recorded": self.recorded,
+                "written": self.written,
+                "dropped": self.dropped,
+                "blocked": self.blocked,
+                "blocked_seconds": round(self.blocked_seconds, 4),
+                "flushes": self.flushes,
+                "failures": self.failures,
+                "last_flush_seconds": self.last_flush_seconds,
+            }
+
+
+audit_log = AuditLog(
+    settings.AUDIT_BUFFER_SIZE, settings.AUDIT_BATCH_SIZE, settings.AUDIT_FLUSH_SECONDS, settings.AUDIT_MAX_BLOCK_SECONDS,
+)
+# Процесс может завершиться без события shutdown (CLI-скрипты, сигнал)
+atexit.register(audit_log.stop)
+metrics.register("audit", audit_log.stats)
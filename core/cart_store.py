@@ -0,0 +1,369 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, event, exists, func, select
+from sqlalchemy.orm import Session, aliased
+
+import repository
+from config import settings
+from models import CartItem
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CartLine:
+    __slots__ = ("id", "user_id", "product_id", "quantity", "slot_date", "updated_at")
+
+    def __init__(self, id: int, user_id: int, product_id: int, quantity: int, slot_date: Optional[date] = None,
+                 updated_at: Optional[datetime] = None):
+        self.id = id
+        self.user_id = user_id
+        self.product_id = product_id
+        self.quantity = quantity
+        self.slot_date = slot_date
+        self.updated_at = updated_at or datetime.utcnow()
+
+    def copy(self) -> "CartLine":
+        return CartLine(self.id, self.user_id, self.product_id, self.quantity, self.slot_date, self.updated_at)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "product_id": self.product_id,
+            "quantity": self.quantity,
+            "slot_date": self.slot_date.isoformat() if self.slot_date else None,
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CartLine":
+        slot_date = data.get("slot_date")
+        updated_at = data.get("updated_at")
+        return cls(
+            data["id"], data["user_id"], data["product_id"], data["quantity"],
+            date.fromisoformat(slot_date) if slot_date else None,
+            datetime.fromisoformat(updated_at) if updated_at else None,
+        )
+
+
+class CartStore(ABC):
+    """Хранилище корзин. Сессия БД передается во все методы: SQL-хранилищу
+    она нужна для работы, хранилище в памяти использует ее только для привязки
+    к коммиту заказа.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def items(self, db: Session, user_id: int) -> List[CartLine]:
+        ...
+
+    @abstractmethod
+    def add(self, db: Session, user_id: int, product_id: int, quantity: int,
+            slot_date: Optional[date] = None) -> CartLine:
+        """Добавляет товар или увеличивает количество уже лежащей в корзине позиции."""
+
+    @abstractmethod
+    def remove(self, db: Session, user_id: int, item_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def clear(self, db: Session, user_id: int):
+        ...
+
+    @abstractmethod
+    def discard_on_commit(self, db: Session, user_id: int, item_ids: List[int]):
+        """Убирает оформленные позиции вместе с коммитом заказа в сессии db."""
+
+    @abstractmethod
+    def purge_abandoned(self, db: Session, cutoff: datetime, batch_size: int, throttle) -> int:
+        """Удаляет корзины, не менявшиеся с cutoff, пачками по batch_size
+        пользователей с паузой throttle.pause(rows) между пачками.
+        Возвращает число удаленных позиций.
+        """
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class SqlCartStore(CartStore):
+    """Корзины в таблице cart_items: каждая операция — отдельная транзакция."""
+
+    name = "sql"
+
+    @staticmethod
+    def _line(item: CartItem) -> CartLine:
+        return CartLine(item.id, item.user_id, item.product_id, item.quantity, item.slot_date, item.updated_at)
+
+    def items(self, db: Session, user_id: int) -> List[CartLine]:
+        return [self._line(item) for item in repository.cart_items_for_user(db, user_id)]
+
+    def add(self, db: Session, user_id: int, product_id: int, quantity: int,
+            slot_date: Optional[date] = None) -> CartLine:
+        item = db.query(CartItem).filter(
+            CartItem.user_id == user_id,
+            CartItem.product_id == product_id,
+            CartItem.slot_date == slot_date,
+        ).first()
+        if item:
+            item.quantity += quantity
+        else:
+            item = CartItem(user_id=user_id, product_id=product_id, quantity=quantity, slot_date=slot_date)
+            db.add(item)
+        db.commit()
+        db.refresh(item)
+        return self._line(item)
+
+    def remove(self, db: Session, user_id: int, item_id: int) -> bool:
+        deleted = db.query(CartItem).filter(
+            CartItem.id == item_id,
+            CartItem.user_id == user_id,
+        ).delete(synchronize_session=False)
+        db.commit()
+        return bool(deleted)
+
+    def clear(self, db: Session, user_id: int):
+        db.query(CartItem).filter(CartItem.user_id == user_id).delete(synchronize_session=False)
+        db.commit()
+
+    def discard_on_commit(self, db: Session, user_id: int, item_ids: List[int]):
+        # Удаление в той же транзакции, что и заказ
+        db.query(CartItem).filter(
+            CartItem.user_id == user_id,
+            CartItem.id.in_(item_ids),
+        ).delete(synchronize_session=False)
+
+    def purge_abandoned(self, db: Session, cutoff: datetime, batch_size: int, throttle) -> int:
+        newer = aliased(CartItem)
+        # Корзина брошена, если ни одна ее позиция не менялась с cutoff;
+        # проверка повторяется при удалении на случай добавления товара
+        not_touched = ~exists().where(newer.user_id == CartItem.user_id, newer.updated_at >= cutoff)
+        deleted = 0
+        last_user_id = 0
+        while True:
+            user_ids = db.execute(
+                select(CartItem.user_id)
+                .where(CartItem.user_id > last_user_id)
+                .group_by(CartItem.user_id)
+                .having(func.max(CartItem.updated_at) < cutoff)
+                .order_by(CartItem.user_id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not user_ids:
+                return deleted
+            last_user_id = user_ids[-1]
+            rows = db.execute(
+                delete(CartItem)
+                .where(CartItem.user_id.in_(user_ids), not_touched)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            deleted += rows
+            throttle.pause(rows)
+
+
+class MemoryCartStore(CartStore):
+    """Корзины в памяти процесса со снимком в JSON-файле.
+
+    Запись в корзину не обращается к БД: в SQL попадает только оформленный
+    заказ. Снимок сохраняется фоновым потоком, если корзины изменились, и при
+    остановке приложения, и загружается при старте. Корзины видны только
+    своему процессу, поэтому режим рассчитан на один рабочий процесс.
+    """
+
+    name = "memory"
+
+    def __init__(self, snapshot_path: str, snapshot_seconds: float):
+        self.snapshot_path = snapshot_path
+        self.snapshot_seconds = snapshot_seconds
+        self._carts: Dict[int, "OrderedDict[int, CartLine]"] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._snapshots = 0
+        self._last_snapshot_seconds = 0.0
+
+    def items(self, db: Session, user_id: int) -> List[CartLine]:
+        with self._lock:
+            return [line.copy() for line in self._carts.get(user_id, {}).values()]
+
+    def add(self, db: Session, user_id: int, product_id: int, quantity: int,
+            slot_date: Optional[date] = None) -> CartLine:
+        with self._lock:
+            cart = self._carts.setdefault(user_id, OrderedDict())
+            for line in cart.values():
+                if line.product_id == product_id and line.slot_date == slot_date:
+                    line.quantity += quantity
+                    line.updated_at = datetime.utcnow()
+                    break
+            else:
+                line = CartLine(next(self._ids), user_id, product_id, quantity, slot_date)
+                cart[line.id] = line
+            self._dirty = True
+            return line.copy()
+
+    def remove(self, db: Session, user_id: int, item_id: int) -> bool:
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if not cart or cart.pop(item_id, None) is None:
+                return False
+            if not cart:
+                del self._carts[user_id]
+            self._dirty = True
+            return True
+
+    def clear(self, db: Session, user_id: int):
+        with self._lock:
+            if self._carts.pop(user_id, None) is not None:
+                self._dirty = True
+
+    def _discard(self, user_id: int, item_ids: List[int]):
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is None:
+                return
+            for item_id in item_ids:
+                cart.pop(item_id, None)
+            if not cart:
+                del self._carts[user_id]
+            self._dirty = True
+
+    def discard_on_commit(self, db: Session, user_id: int, item_ids: List[int]):
+        # Корзина очищается только после успешного коммита заказа: если
+        # оформление откатится, товары останутся в корзине. Обработчики
+        # привязаны к текущей транзакции: сессия /batch после отката
+        # используется дальше, и чужой коммит не должен очистить корзину
+        transaction = db.get_transaction() or db.begin()
+        pending = [True]
+
+        def on_commit(session):
+            if pending[0] and session.get_transaction() is transaction:
+                pending[0] = False
+                self._discard(user_id, item_ids)
+
+        def on_transaction_end(session, ended):
+            if ended is transaction:
+                pending[0] = False
+
+        event.listen(db, "after_commit", on_commit)
+        event.listen(db, "after_transaction_end", on_transaction_end)
+
+    def purge_abandoned(self, db: Session, cutoff: datetime, batch_size: int, throttle) -> int:
+        with self._lock:
+            abandoned = [
+                user_id for user_id, cart in self._carts.items()
+                if max(line.updated_at for line in cart.values()) < cutoff
+            ]
+        deleted = 0
+        # Блокировка берется на одну пачку, чтобы не задерживать запросы к корзинам
+        for start in range(0, len(abandoned), batch_size):
+            rows = 0
+            with self._lock:
+                for user_id in abandoned[start:start + batch_size]:
+                    cart = self._carts.get(user_id)
+                    if cart and max(line.updated_at for line in cart.values()) < cutoff:
+                        rows += len(self._carts.pop(user_id))
+                self._dirty = self._dirty or bool(rows)
+            deleted += rows
+            throttle.pause(rows)
+        return deleted
+
+    def load(self):
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as snapshot:
+                lines = [CartLine.from_dict(data) for data in json.load(snapshot)]
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._carts.clear()
+            for line in lines:
+                self._carts.setdefault(line.user_id, OrderedDict())[line.id] = line
+            self._ids = itertools.count(max((line.id for line in lines), default=0) + 1)
+            self._dirty = False
+        logger.info("Загружено корзин из снимка: %d", len(self._carts))
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            lines = [line.to_dict() for cart in self._carts.values() for line in cart.values()]
+            self._dirty = False
+        started = time.perf_counter()
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Временный файл и атомарная подмена: при падении во время записи
+        # остается предыдущий целый снимок
+        tmp_path = self.snapshot_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as snapshot:
+                json.dump(lines, snapshot)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError:
+            with self._lock:
+                self._dirty = True
+            raise
+        self._snapshots += 1
+        self._last_snapshot_seconds = time.perf_counter() - started
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(self.snapshot_seconds):
+            try:
+                self.save()
+            except OSError:
+                logger.exception("Не удалось сохранить снимок корзин")
+
+    def start(self):
+        self.load()
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._snapshot_loop, name="cart-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "carts": len(self._carts),
+                "lines": sum(len(cart) for cart in self._carts.values()),
+                "dirty": self._dirty,
+                "snapshots": self._snapshots,
+                "last_snapshot_seconds": round(self._last_snapshot_seconds, 4),
+            }
+
+
+def create_cart_store(backend: str) -> CartStore:
+    if backend == "sql":
+        return SqlCartStore()
+    if backend == "memory":
+        return MemoryCartStore(settings.CART_SNAPSHOT_PATH, settings.CART_SNAPSHOT_SECONDS)
+    raise ValueError(f"Неизвестное хранилище корзин: {backend}")
+
+
+cart_store = create_cart_store(settings.CART_STORE)
+metrics.register("cart", cart_store.stats)
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal, engine
+from models import IdempotencyKey, Job, RefreshToken
+from core import metrics, slots
+from core.cart_store import cart_store
+from core.jobs import job_queue
+from core.partitions import ensure_partitions
+from core.throttle import Throttle
+
+logger = logging.getLogger(__name__)
+
+# Результаты последнего прогона по каждой задаче очистки
+_last_reports: dict = {}
+
+
+def delete_in_batches(db: Session, model, condition, batch_size: int, throttle: Throttle) -> int:
+    """Удаляет строки по условию пачками по первичному ключу, коммитя каждую пачку.
+
+    Короткие транзакции не держат блокировки долго, а пауза между пачками
+    оставляет запас ввода-вывода основной нагрузке.
+    """
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = db.execute(
+            select(model.id).where(condition, model.id > last_id).order_by(model.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return deleted
+        last_id = ids[-1]
+        # Условие повторяется: строка могла измениться после выборки
+        rows = db.execute(
+            delete(model).where(model.id.in_(ids), condition).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        deleted += rows
+        throttle.pause(rows)
+
+
+def _report(task: str, rows: int, started: float) -> dict:
+    seconds = time.perf_counter() - started
+    report = {
+        "task": task,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else 0.0,
+        "finished_at": datetime.utcnow().isoformat(),
+    }
+    _last_reports[task] = report
+    logger.info("Очистка %s: %d строк за %.3f с (%.1f строк/с)",
+                task, rows, seconds, report["rows_per_second"])
+    return report
+
+
+def run_cleanup(
+        db: Session,
+        cart_max_age_days: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        sleep_seconds: Optional[float] = None,
+        max_rows_per_second: Optional[int] = None,
+        tasks: Optional[List[str]] = None,
+) -> List[dict]:
+    """Удаляет брошенные корзины и устаревшие служебные данные.
+
+    tasks — подмножество из carts, idempotency_keys, refresh_tokens, slot_holds, jobs;
+    по умолчанию выполняются все. Возвращает отчет по каждой задаче.
+    """
+    cart_max_age_days = settings.CLEANUP_CART_MAX_AGE_DAYS if cart_max_age_days is None else cart_max_age_days
+    batch_size = batch_size or settings.CLEANUP_BATCH_SIZE
+    throttle = Throttle(
+        settings.CLEANUP_SLEEP_SECONDS if sleep_seconds is None else sleep_seconds,
+        settings.CLEANUP_MAX_ROWS_PER_SECOND if max_rows_per_second is None else max_rows_per_second,
+    )
+    now = datetime.utcnow()
+    tasks = tasks or ["carts", "idempotency_keys", "refresh_tokens", "slot_holds", "jobs"]
+    reports = []
+
+    if "carts" in tasks:
+        started = time.perf_counter()
+        rows = cart_store.purge_abandoned(db, now - timedelta(days=cart_max_age_days), batch_size, throttle)
+        reports.append(_report("carts", rows, started))
+    if "idempotency_keys" in tasks:
+        started = time.perf_counter()
+        rows = delete_in_batches(db, IdempotencyKey, IdempotencyKey.expires_at <= now, batch_size, throttle)
+        reports.append(_report("idempotency_keys", rows, started))
+    if "refresh_tokens" in tasks:
+        started = time.perf_counter()
+        rows = delete_in_batches(db, RefreshToken, RefreshToken.expires_at <= now, batch_size, throttle)
+        reports.append(_report("refresh_tokens", rows, started))
+    if "slot_holds" in tasks:
+        started = time.perf_counter()
+        rows = slots.expire_holds(db)
+        db.commit()
+        reports.append(_report("slot_holds", rows, started))
+    if "jobs" in tasks:
+        started = time.perf_counter()
+        finished = Job.status.in_(("done", "failed")) & (
+            Job.created_at < now - timedelta(days=settings.CLEANUP_JOB_MAX_AGE_DAYS)
+        )
+        rows = delete_in_batches(db, Job, finished, batch_size, throttle)
+        reports.append(_report("jobs", rows, started))
+    return reports
+
+
+@job_queue.task("cleanup_stale_data", max_attempts=1)
+def cleanup_stale_data():
+    # Секции на будущие месяцы: процесс может работать дольше, чем их
+    # создано при запуске
+    try:
+        ensure_partitions(engine, months_ahead=settings.ORDER_PARTITION_MONTHS_AHEAD)
+    except Exception:
+        logger.exception("Не удалось создать секции заказов")
+    db = SessionLocal()
+    try:
+        run_cleanup(db)
+    finally:
+        db.close()
+
+
+async def schedule_cleanup(interval_minutes: float):
+    """Ставит очистку в очередь задач раз в interval_minutes, пока приложение работает."""
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        job_queue.enqueue("cleanup_stale_data")
+
+
+metrics.register("cleanup", lambda: dict(_last_reports))
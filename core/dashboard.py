@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import SessionLocal
+from models import User, UserRole, Product, DailySales, OrderStatusCount, ProductSales
+from core import metrics
+from core.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def compute(db: Session) -> dict:
+    """Сводка для панели администратора: четыре агрегирующих запроса.
+
+    Заказы, выручка и товары берутся из сводных таблиц аналитики, по
+    таблице пользователей — один проход со всеми счетчиками сразу.
+    """
+    users_total, users_active, admins = db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(case((User.is_active == 1, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((User.role == UserRole.admin, 1), else_=0)), 0),
+        ).select_from(User)
+    ).one()
+    today = datetime.utcnow().date()
+    today_sales = db.execute(
+        select(DailySales.order_count, DailySales.revenue).where(DailySales.day == today)
+    ).first()
+    top_products = db.execute(
+        select(ProductSales.product_id, Product.name, ProductSales.quantity, ProductSales.revenue)
+        .outerjoin(Product, Product.id == ProductSales.product_id)
+        .order_by(ProductSales.revenue.desc())
+        .limit(settings.DASHBOARD_TOP_PRODUCTS)
+    ).mappings().all()
+    return {
+        "users_total": users_total,
+        "users_active": users_active,
+        "admins": admins,
+        "orders_by_status": [
+            {"status": row.status, "order_count": row.order_count}
+            for row in db.query(OrderStatusCount).all()
+        ],
+        "today_orders": today_sales.order_count if today_sales else 0,
+        "today_revenue": today_sales.revenue if today_sales else 0.0,
+        "top_products": [dict(row) for row in top_products],
+        "generated_at": datetime.utcnow(),
+    }
+
+
+class DashboardSnapshot:
+    """Снимок сводки, общий для всех запросов процесса.
+
+    Пока снимок моложе ttl, он отдается как есть. Устаревший снимок тоже
+    отдается сразу, а пересчет запускается в фоновом потоке — не больше
+    одного одновременно. Поэтому нагрузка на БД не зависит от числа
+    открытых панелей: один пересчет в ttl секунд на процесс.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshot = None
+        self._computed_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # Первый запрос ждет расчета; одновременные первые запросы — один расчет
+        self._flight = SingleFlight("dashboard")
+        self.served = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh_seconds = 0.0
+
+    def get(self) -> dict:
+        with self._lock:
+            self.served += 1
+            snapshot = self._snapshot
+            stale = time.monotonic() - self._computed_at > self.ttl
+            start_refresh = snapshot is not None and stale and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+        if snapshot is None:
+            return self._flight.do("snapshot", self._refresh)
+        if start_refresh:
+            threading.Thread(target=self._refresh_in_background, name="dashboard-refresh", daemon=True).start()
+        return snapshot
+
+    def _refresh(self) -> dict:
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            snapshot = compute(db)
+        finally:
+            db.close()
+        with self._lock:
+            self._snapshot = snapshot
+            self._computed_at = time.monotonic()
+            self.refreshes += 1
+            self.last_refresh_seconds = round(time.perf_counter() - started, 4)
+        return snapshot
+
+    def _refresh_in_background(self):
+        try:
+            self._refresh()
+        except Exception:
+            # Остается прежний снимок; следующий запрос попробует снова
+            with self._lock:
+                self.failures += 1
+            logger.exception("Не удалось обновить сводку панели администратора")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "served": self.served,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "last_refresh_seconds": self.last_refresh_seconds,
+                "age_seconds": round(time.monotonic() - self._computed_at, 1) if self._snapshot else None,
+            }
+
+
+dashboard_snapshot = DashboardSnapshot(settings.DASHBOARD_SNAPSHOT_SECONDS)
+metrics.register("dashboard", dashboard_snapshot.stats)
@@ -0,0 +1,55 @@
+import json
+from typing import Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from config import settings
+from core import metrics
+from core.cache import TTLCache
+
+# Точные счетчики для СУБД без статистики планировщика
+_counts = TTLCache(maxsize=1000, ttl=settings.ESTIMATE_CACHE_SECONDS)
+
+
+class _ExplainJson(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) над запросом; параметры передаются связанными, а не текстом."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_ExplainJson, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def estimate_count(db: Session, statement) -> Tuple[int, bool]:
+    """Приблизительное число строк запроса и признак того, что оно оценочное.
+
+    На PostgreSQL берется оценка планировщика из EXPLAIN: она не читает
+    таблицу и стоит столько же при миллионах строк. На других СУБД
+    выполняется COUNT(*), результат кэшируется на ESTIMATE_CACHE_SECONDS.
+    """
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql":
+        plan = db.execute(_ExplainJson(statement)).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"]), True
+    compiled = statement.compile(dialect=bind.dialect)
+    key = (str(compiled), repr(sorted(compiled.params.items())))
+    count = _counts.get(key)
+    if count is not None:
+        # Из кэша число могло устареть
+        return count, True
+    count = db.execute(select(func.count()).select_from(statement.subquery())).scalar()
+    _counts.set(key, count)
+    return count, False
+
+
+metrics.register("estimates", _counts.stats)
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+
+from config import settings
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "order_events"
+
+
+class Event:
+    __slots__ = ("id", "user_id", "type", "data")
+
+    def __init__(self, id: int, user_id: int, type: str, data: dict):
+        self.id = id
+        self.user_id = user_id
+        self.type = type
+        self.data = data
+
+    def to_sse(self) -> str:
+        payload = json.dumps(self.data, ensure_ascii=False)
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "user_id": self.user_id, "type": self.type, "data": self.data}
+
+
+class Subscription:
+    __slots__ = ("user_id", "queue", "loop")
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, event: Event):
+        # Вызывается в цикле событий подписчика; медленный клиент теряет
+        # самые старые события, но не блокирует публикацию
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class EventBroker:
+    """Внутрипроцессная шина событий с историей для возобновления по Last-Event-ID.
+
+    Публиковать можно из любого потока (обработчики FastAPI работают в пуле
+    потоков), подписчики получают события в своем цикле событий. При включенном
+    мосте PostgreSQL LISTEN/NOTIFY события видны всем рабочим процессам.
+    """
+
+    def __init__(self, history_size: int = 1000, queue_size: int = 100):
+        self.origin = uuid.uuid4().hex
+        self._queue_size = queue_size
+        self._history: deque = deque(maxlen=history_size)
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._bridge: Optional["PgNotifyBridge"] = None
+        self._published = 0
+        self._delivered = 0
+
+    def _next_id(self) -> int:
+        # Идентификатор — время в микросекундах, строго возрастающее в процессе;
+        # так события разных рабочих процессов сравнимы при возобновлении
+        with self._lock:
+            self._last_id = max(self._last_id + 1, time.time_ns() // 1000)
+            return self._last_id
+
+    def publish(self, user_id: int, type: str, data: dict) -> Event:
+        return self.publish_many([(user_id, type, data)])[0]
+
+    def publish_many(self, items: Iterable[tuple]) -> List[Event]:
+        events = [Event(self._next_id(), user_id, type, data) for user_id, type, data in items]
+        if not events:
+            return events
+        self._deliver(events)
+        if self._bridge is not None:
+            self._bridge.notify(events)
+        return events
+
+    def _deliver(self, events: List[Event]):
+        with self._lock:
+            self._published += len(events)
+            for event in events:
+                self._history.append(event)
+                self._last_id = max(self._last_id, event.id)
+            targets = [
+                (subscription, event)
+                for event in events
+                for subscription in self._subscribers.get(event.user_id, ())
+            ]
+            self._delivered += len(targets)
+        for subscription, event in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                pass
+
+    def history_since(self, user_id: int, last_id: int) -> List[Event]:
+        with self._lock:
+            return [event for event in self._history if event.user_id == user_id and event.id > last_id]
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int):
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self._queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(user_id)
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def start_pg_bridge(self, engine):
+        if self._bridge is None:
+            self._bridge = PgNotifyBridge(self, engine)
+            self._bridge.start()
+
+    def stop_pg_bridge(self):
+        if self._bridge is not None:
+            self._bridge.stop()
+            self._bridge = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": sum(len(subs) for subs in self._subscribers.values()),
+                "published": self._published,
+                "delivered": self._delivered,
+                "history": len(self._history),
+                "pg_bridge": self._bridge is not None,
+            }
+
+
+class PgNotifyBridge:
+    """Пересылка событий между рабочими процессами через PostgreSQL LISTEN/NOTIFY."""
+
+    def __init__(self, broker: EventBroker, engine, channel: str = NOTIFY_CHANNEL):
+        self.broker = broker
+        self.engine = engine
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def notify(self, events: List[Event]):
+        try:
+            with self.engine.begin() as connection:
+                for event in events:
+                    payload = json.dumps(
+                        {"origin": self.broker.origin, **event.to_dict()},
+                        ensure_ascii=False,
+                    )
+                    connection.execute(
+                        text("SELECT pg_notify(:channel, :payload)"),
+                        {"channel": self.channel, "payload": payload},
+                    )
+        except Exception:
+            logger.exception("Не удалось отправить NOTIFY для событий заказов")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="pg-notify-bridge", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Соединение LISTEN потеряно, переподключение")
+                self._stop.wait(1)
+
+    def _listen(self):
+        # Отдельное долгоживущее соединение, изъятое из пула
+        raw = self.engine.raw_connection()
+        raw.detach()
+        connection = raw.driver_connection
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            while not self._stop.is_set():
+                if select.select([connection], [], [], 1.0) == ([], [], []):
+                    continue
+                connection.poll()
+                events = []
+                while connection.notifies:
+                    notify = connection.notifies.pop(0)
+                    message = json.loads(notify.payload)
+                    if message.get("origin") == self.broker.origin:
+                        continue
+                    events.append(Event(message["id"], message["user_id"], message["type"], message["data"]))
+                if events:
+                    self.broker._deliver(events)
+        finally:
+            connection.close()
+
+
+order_events = EventBroker(
+    history_size=settings.ORDER_EVENTS_HISTORY_SIZE,
+    queue_size=settings.ORDER_EVENTS_QUEUE_SIZE,
+)
+metrics.register("order_events", order_events.stats)
+
+
+def order_status_event(order_id: int, user_id: int, status) -> tuple:
+    return (
+        user_id,
+        "order_status",
+        {"order_id": order_id, "status": status.name, "status_name": status.value},
+    )
+
+
+def publish_order_status(order) -> Event:
+    return order_events.publish(*order_status_event(order.id, order.user_id, order.status))
@@ -0,0 +1,48 @@
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel, create_model
+from sqlalchemy import select
+from sqlalchemy.sql import Select
+
+# Описание параметра fields для маршрутов со списками
+FIELDS_DESCRIPTION = "Поля ответа через запятую, например id,name,price. По умолчанию возвращаются все поля."
+
+
+def parse_fields(fields: Optional[str], response_model: Type[BaseModel]) -> Optional[Tuple[str, ...]]:
+    """Разбирает параметр fields в кортеж полей в порядке схемы ответа.
+
+    Порядок не зависит от запроса, поэтому кортеж годится как ключ кэша.
+    None — поля не указаны, нужен полный ответ.
+    """
+    if fields is None:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(response_model.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(sorted(unknown))}")
+    if not requested:
+        raise HTTPException(status_code=400, detail="Не указано ни одного поля")
+    return tuple(name for name in response_model.model_fields if name in requested)
+
+
+@lru_cache(maxsize=None)
+def narrowed_model(response_model: Type[BaseModel], fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """Схема ответа только с выбранными полями; создается один раз на набор полей."""
+    return create_model(
+        f"{response_model.__name__}Fields",
+        **{name: (response_model.model_fields[name].annotation, response_model.model_fields[name])
+           for name in fields},
+    )
+
+
+def select_fields(orm_model, fields: Tuple[str, ...]) -> Select:
+    # Имена полей схем совпадают с атрибутами моделей: из БД читаются
+    # только нужные столбцы, без создания ORM-объектов
+    return select(*(getattr(orm_model, name) for name in fields))
+
+
+def serialize(rows: Iterable, response_model: Type[BaseModel], fields: Tuple[str, ...]) -> List[dict]:
+    model = narrowed_model(response_model, fields)
+    return [model.model_validate(dict(row)).model_dump(mode="json") for row in rows]
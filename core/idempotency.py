@@ -0,0 +1,203 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+
+from config import settings
+from database import SessionLocal
+from models import IdempotencyKey
+from core import metrics
+from core.cache import TTLCache
+from core.singleflight import SingleFlight
+
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL_SECONDS = 0.1
+
+
+class _StoredResponse:
+    __slots__ = ("status_code", "body", "request_hash")
+
+    def __init__(self, status_code: int, body: str, request_hash: str):
+        self.status_code = status_code
+        self.body = body
+        self.request_hash = request_hash
+
+
+# Быстрый кэш сохраненных ответов перед таблицей idempotency_keys
+_front_cache = TTLCache(
+    maxsize=settings.IDEMPOTENCY_CACHE_SIZE,
+    ttl=settings.IDEMPOTENCY_KEY_TTL_HOURS * 3600,
+)
+# Одновременные дубликаты внутри процесса ждут первый запрос, а не гонятся с ним
+_flight = SingleFlight("idempotency")
+_stats_lock = threading.Lock()
+_stats = {"executed": 0, "replayed": 0, "waited_for_other_worker": 0}
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _stats_snapshot() -> dict:
+    with _stats_lock:
+        result = dict(_stats)
+    result["front_cache"] = _front_cache.stats()
+    return result
+
+
+metrics.register("idempotency", _stats_snapshot)
+
+
+def _request_hash(payload: Any) -> str:
+    data = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _to_response(stored: _StoredResponse, request_hash: str, replayed: bool) -> JSONResponse:
+    if stored.request_hash != request_hash:
+        raise HTTPException(
+            status_code=422,
+            detail="Ключ идемпотентности уже использован для другого запроса",
+        )
+    return JSONResponse(
+        status_code=stored.status_code,
+        content=json.loads(stored.body),
+        headers={"Idempotency-Replayed": "true" if replayed else "false"},
+    )
+
+
+def run_idempotent(
+        key: Optional[str],
+        scope: str,
+        user_id: int,
+        payload: Any,
+        handler: Callable[[], Any],
+):
+    """Выполняет handler не более одного раза для ключа Idempotency-Key.
+
+    Повторный запрос с тем же ключом получает сохраненный ответ без повторного
+    выполнения обработчика. Без ключа обработчик вызывается как обычно.
+    """
+    if key is None:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Некорректный ключ идемпотентности")
+
+    request_hash = _request_hash(payload)
+    cache_key = (user_id, scope, key)
+
+    stored = _front_cache.get(cache_key)
+    if stored is not None:
+        _count("replayed")
+        return _to_response(stored, request_hash, replayed=True)
+
+    replayed = []
+    leader = []
+
+    def execute():
+        leader.append(True)
+        return _execute(cache_key, request_hash, handler, replayed)
+
+    stored = _flight.do(cache_key, execute)
+    if not leader:
+        # execute не вызывался: ответ получен от одновременного запроса с тем же ключом
+        _count("replayed")
+        replayed.append(True)
+    return _to_response(stored, request_hash, replayed=bool(replayed))
+
+
+def _execute(cache_key, request_hash: str, handler: Callable[[], Any], replayed: list) -> _StoredResponse:
+    user_id, scope, key = cache_key
+    db = SessionLocal()
+    try:
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT_SECONDS
+        while True:
+            record = _load(db, user_id, scope, key)
+            if record is None:
+                record = _claim(db, user_id, scope, key, request_hash)
+                if record is not None:
+                    break
+                # Ключ только что занял другой процесс — ждем его результат
+                if time.monotonic() >= deadline:
+                    raise HTTPException(status_code=409, detail="Запрос с этим ключом идемпотентности еще выполняется")
+                continue
+            if record.status_code is not None:
+                stored = _StoredResponse(record.status_code, record.response_body, record.request_hash)
+                _front_cache.set(cache_key, stored, ttl=_remaining_seconds(record))
+                _count("replayed")
+                replayed.append(True)
+                return stored
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=409, detail="Запрос с этим ключом идемпотентности еще выполняется")
+            _count("waited_for_other_worker")
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+        try:
+            result = handler()
+        except BaseException:
+            # Ошибка не меняет состояние: освобождаем ключ, чтобы клиент мог повторить запрос
+            db.delete(record)
+            db.commit()
+            raise
+
+        stored = _StoredResponse(200, json.dumps(jsonable_encoder(result), ensure_ascii=False), request_hash)
+        record.status_code = stored.status_code
+        record.response_body = stored.body
+        db.commit()
+        _front_cache.set(cache_key, stored, ttl=_remaining_seconds(record))
+        _count("executed")
+        return stored
+    finally:
+        db.close()
+
+
+def _load(db, user_id: int, scope: str, key: str) -> Optional[IdempotencyKey]:
+    db.expire_all()
+    record = db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.scope == scope,
+        IdempotencyKey.key == key,
+    ).first()
+    if record is None:
+        return None
+    now = datetime.utcnow()
+    abandoned = (
+        record.status_code is None
+        and record.created_at < now - timedelta(seconds=settings.IDEMPOTENCY_WAIT_TIMEOUT_SECONDS)
+    )
+    if record.expires_at <= now or abandoned:
+        db.delete(record)
+        db.commit()
+        return None
+    return record
+
+
+def _claim(db, user_id: int, scope: str, key: str, request_hash: str) -> Optional[IdempotencyKey]:
+    now = datetime.utcnow()
+    record = IdempotencyKey(
+        user_id=user_id,
+        scope=scope,
+        key=key,
+        request_hash=request_hash,
+        created_at=now,
+        expires_at=now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+    )
+    db.add(record)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return record
+
+
+def _remaining_seconds(record: IdempotencyKey) -> float:
+    return max((record.expires_at - datetime.utcnow()).total_seconds(), 0.0)
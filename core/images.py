@@ -0,0 +1,199 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from config import settings
+from core import metrics
+from core.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Размеры миниатюр: наибольшая сторона в пикселях
+THUMBNAIL_SIZES = {"small": 160, "medium": 480, "large": 1024}
+ORIGINAL = "original"
+THUMBNAIL_FORMAT = "webp"
+THUMBNAIL_QUALITY = 80
+# Расширения исходных изображений по формату Pillow
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp", "gif": "image/gif"}
+MAX_PIXELS = 40_000_000
+# FileResponse открывает файл уже после resolve(); столько секунд отданная
+# миниатюра не вытесняется, чтобы файл не исчез до открытия
+SERVE_PIN_SECONDS = 30.0
+
+# Ключ изображения — sha256 содержимого и расширение: один файл на одинаковое
+# содержимое, а по ключу ответ никогда не меняется
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}\.(jpg|png|webp|gif)$")
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+class ImageStore:
+    """Хранилище изображений товаров на диске.
+
+    Исходные файлы лежат в originals/ по ключу содержимого и не удаляются.
+    Миниатюры создаются при первом запросе и хранятся в thumbs/<размер>/;
+    их суммарный объем ограничен, при превышении удаляются давно не
+    запрошенные. Порядок использования ведется в памяти и при старте
+    восстанавливается по времени изменения файлов.
+    """
+
+    def __init__(self, root: str, thumbnail_budget_bytes: int):
+        self.root = root
+        self.thumbnail_budget_bytes = thumbnail_budget_bytes
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._lru_bytes = 0
+        self._pinned_until: dict = {}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("thumbnails")
+        self._scanned = False
+        self.hits = 0
+        self.generated = 0
+        self.evicted = 0
+
+    def original_path(self, key: str) -> str:
+        return os.path.join(self.root, "originals", key[:2], key)
+
+    def thumbnail_path(self, key: str, size: str) -> str:
+        digest = key.split(".", 1)[0]
+        return os.path.join(self.root, "thumbs", size, digest[:2], f"{digest}.{THUMBNAIL_FORMAT}")
+
+    def save_original(self, data: bytes) -> str:
+        """Проверяет и сохраняет загруженное изображение, возвращает его ключ."""
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image_format = image.format
+                width, height = image.size
+                image.verify()
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+            raise InvalidImage("Файл не является изображением")
+        if image_format not in FORMAT_EXTENSIONS:
+            raise InvalidImage(f"Формат {image_format} не поддерживается")
+        if width * height > MAX_PIXELS:
+            raise InvalidImage("Слишком большое разрешение изображения")
+        key = f"{hashlib.sha256(data).hexdigest()}.{FORMAT_EXTENSIONS[image_format]}"
+        path = self.original_path(key)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        return key
+
+    def resolve(self, key: str, size: str) -> Optional[Tuple[str, str]]:
+        """Путь к файлу и его тип для ключа и размера; None — изображения нет."""
+        original = self.original_path(key)
+        if size == ORIGINAL:
+            return (original, MEDIA_TYPES[key.rsplit(".", 1)[1]]) if os.path.exists(original) else None
+        path = self.thumbnail_path(key, size)
+        self._scan()
+        with self._lock:
+            cached = path in self._lru
+            if cached:
+                self._lru.move_to_end(path)
+                self._pinned_until[path] = time.monotonic() + SERVE_PIN_SECONDS
+        # Файл мог удалить другой процесс; тогда миниатюра создается заново
+        if cached and os.path.exists(path):
+            with self._lock:
+                self.hits += 1
+            return path, MEDIA_TYPES[THUMBNAIL_FORMAT]
+        if not os.path.exists(original):
+            return None
+        # Одновременные запросы одной миниатюры кодируют ее один раз
+        self._flight.do(path, lambda: self._generate(original, path, THUMBNAIL_SIZES[size]))
+        return path, MEDIA_TYPES[THUMBNAIL_FORMAT]
+
+    def _generate(self, original: str, path: str, max_side: int):
+        if not os.path.exists(path):
+            with Image.open(original) as image:
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((max_side, max_side))
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+                buffer = io.BytesIO()
+                image.save(buffer, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+            _write_atomic(path, buffer.getvalue())
+            with self._lock:
+                self.generated += 1
+        self._remember(path, os.path.getsize(path))
+        self._evict()
+
+    def _remember(self, path: str, size: int):
+        with self._lock:
+            previous = self._lru.pop(path, None)
+            if previous is not None:
+                self._lru_bytes -= previous
+            self._lru[path] = size
+            self._lru_bytes += size
+            self._pinned_until[path] = time.monotonic() + SERVE_PIN_SECONDS
+
+    def _evict(self):
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            if self._lru_bytes <= self.thumbnail_budget_bytes:
+                return
+            # Недавно отданные миниатюры пропускаются: их сейчас открывают
+            for path in list(self._lru):
+                if self._lru_bytes <= self.thumbnail_budget_bytes:
+                    break
+                if self._pinned_until.get(path, 0.0) > now:
+                    continue
+                self._lru_bytes -= self._lru.pop(path)
+                self._pinned_until.pop(path, None)
+                self.evicted += 1
+                victims.append(path)
+        for path in victims:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _scan(self):
+        if self._scanned:
+            return
+        with self._lock:
+            if self._scanned:
+                return
+            files = []
+            for directory, _, names in os.walk(os.path.join(self.root, "thumbs")):
+                for name in names:
+                    if name.endswith(f".{THUMBNAIL_FORMAT}"):
+                        path = os.path.join(directory, name)
+                        stat = os.stat(path)
+                        files.append((stat.st_mtime, path, stat.st_size))
+            for _, path, size in sorted(files):
+                self._lru[path] = size
+                self._lru_bytes += size
+            self._scanned = True
+        self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "thumbnails": len(self._lru),
+                "thumbnail_bytes": self._lru_bytes,
+                "thumbnail_budget_bytes": self.thumbnail_budget_bytes,
+                "hits": self.hits,
+                "generated": self.generated,
+                "evicted": self.evicted,
+            }
+
+
+image_store = ImageStore(settings.MEDIA_ROOT, settings.IMAGE_THUMBNAIL_BUDGET_BYTES)
+metrics.register("images", image_store.stats)
@@ -0,0 +1,309 @@
+import asyncio
+import inspect
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from config import settings
+from database import SessionLocal
+from models import Job
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Задача в статусе running дольше этого времени считается брошенной упавшим процессом
+STALE_JOB_TIMEOUT = timedelta(minutes=15)
+
+
+class _Task:
+    __slots__ = ("fn", "is_async", "max_attempts")
+
+    def __init__(self, fn: Callable, max_attempts: int):
+        self.fn = fn
+        self.is_async = inspect.iscoroutinefunction(fn)
+        self.max_attempts = max_attempts
+
+
+class _QueuedJob:
+    __slots__ = ("id", "name", "payload", "attempts")
+
+    def __init__(self, name: str, payload: dict, attempts: int = 0, id: Optional[int] = None):
+        self.id = id
+        self.name = name
+        self.payload = payload
+        self.attempts = attempts
+
+
+class JobQueue:
+    """Очередь фоновых задач на asyncio-воркерах.
+
+    Задачи ставятся из любого потока через enqueue() и выполняются ограниченным
+    числом воркеров в цикле событий приложения; синхронные обработчики уходят
+    в пул потоков. Ошибки повторяются с экспоненциальной задержкой. В устойчивом
+    режиме задачи хранятся в таблице jobs и переживают перезапуск процесса.
+    """
+
+    def __init__(
+            self,
+            concurrency: int,
+            max_size: int,
+            durable: bool = False,
+            max_attempts: int = 5,
+            retry_base_seconds: float = 2.0,
+            poll_seconds: float = 1.0,
+    ):
+        self.concurrency = concurrency
+        self.max_size = max_size
+        self.durable = durable
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.poll_seconds = poll_seconds
+        self._tasks: Dict[str, _Task] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pending: deque = deque()
+        self._workers = []
+        self._depth = 0
+        self._running = 0
+        self._counters = {"enqueued": 0, "completed": 0, "retried": 0, "failed": 0, "rejected": 0}
+
+    def task(self, name: str, max_attempts: Optional[int] = None):
+        def decorator(fn: Callable):
+            self._tasks[name] = _Task(fn, max_attempts or self.max_attempts)
+            return fn
+        return decorator
+
+    def enqueue(self, name: str, **payload) -> bool:
+        if name not in self._tasks:
+            raise KeyError(f"Неизвестная фоновая задача: {name}")
+        if self.durable:
+            self._insert_job(name, payload)
+            with self._lock:
+                self._counters["enqueued"] += 1
+                loop = self._loop
+            if loop is not None:
+                loop.call_soon_threadsafe(self._wakeup.set)
+            return True
+
+        with self._lock:
+            if self._depth >= self.max_size:
+                self._counters["rejected"] += 1
+                logger.warning("Очередь фоновых задач переполнена, задача %s отклонена", name)
+                return False
+            self._depth += 1
+            self._counters["enqueued"] += 1
+        self._submit(_QueuedJob(name, payload))
+        return True
+
+    def _submit(self, job: _QueuedJob, delay: float = 0):
+        with self._lock:
+            if self._loop is None:
+                # Воркеры еще не запущены: задача дождется start()
+                self._pending.append(job)
+                return
+            loop = self._loop
+        if delay:
+            loop.call_soon_threadsafe(loop.call_later, delay, self._queue.put_nowait, job)
+        else:
+            loop.call_soon_threadsafe(self._queue.put_nowait, job)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        if self.durable:
+            await asyncio.to_thread(self._requeue_stale_jobs)
+            worker = self._durable_worker
+        else:
+            worker = self._memory_worker
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            while self._pending:
+                self._queue.put_nowait(self._pending.popleft())
+        self._workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+
+    async def stop(self, timeout: float = 10.0):
+        if self._loop is None:
+            return
+        if not self.durable:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Остановка очереди: %s задач не успели выполниться", self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        with self._lock:
+            self._loop = None
+
+    async def _execute(self, job: _QueuedJob):
+        task = self._tasks[job.name]
+        with self._lock:
+            self._running += 1
+        try:
+            if task.is_async:
+                await task.fn(**job.payload)
+            else:
+                await asyncio.to_thread(task.fn, **job.payload)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _retry_delay(self, attempts: int) -> float:
+        return self.retry_base_seconds * 2 ** (attempts - 1)
+
+    async def _memory_worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._execute(job)
+            except Exception:
+                job.attempts += 1
+                if job.attempts < self._tasks[job.name].max_attempts:
+                    with self._lock:
+                        self._counters["retried"] += 1
+                    delay = self._retry_delay(job.attempts)
+                    logger.warning("Задача %s завершилась ошибкой, повтор через %.1f с", job.name, delay,
+                                   exc_info=True)
+                    self._loop.call_later(delay, self._queue.put_nowait, job)
+                else:
+                    with self._lock:
+                        self._depth -= 1
+                        self._counters["failed"] += 1
+                    logger.exception("Задача %s не выполнена после %s попыток", job.name, job.attempts)
+            else:
+                with self._lock:
+                    self._depth -= 1
+                    self._counters["completed"] += 1
+            finally:
+                self._queue.task_done()
+
+    async def _durable_worker(self):
+        while True:
+            job = await asyncio.to_thread(self._claim_job)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._execute(job)
+            except Exception as exc:
+                logger.warning("Задача %s (id=%s) завершилась ошибкой", job.name, job.id, exc_info=True)
+                await asyncio.to_thread(self._fail_job, job, exc)
+            else:
+                await asyncio.to_thread(self._finish_job, job)
+
+    # Операции с таблицей jobs (устойчивый режим)
+    def _insert_job(self, name: str, payload: dict):
+        db = SessionLocal()
+        try:
+            db.add(Job(name=name, payload=json.dumps(payload, ensure_ascii=False), status="queued",
+                       run_at=datetime.utcnow()))
+            db.commit()
+        finally:
+            db.close()
+
+    def _claim_job(self) -> Optional[_QueuedJob]:
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(
+                Job.status == "queued",
+                Job.run_at <= datetime.utcnow(),
+                Job.name.in_(list(self._tasks)),
+            ).order_by(Job.run_at).with_for_update(skip_locked=True).first()
+            if job is None:
+                db.rollback()
+                return None
+            # Значения до UPDATE: после коммита job перечитается уже с
+            # увеличенным attempts
+            queued = _QueuedJob(job.name, json.loads(job.payload), job.attempts + 1, id=job.id)
+            # Условное обновление защищает от двойного захвата там, где
+            # SKIP LOCKED не поддерживается (SQLite)
+            claimed = db.query(Job).filter(Job.id == job.id, Job.status == "queued").update(
+                {Job.status: "running", Job.locked_at: datetime.utcnow(), Job.attempts: Job.attempts + 1},
+                synchronize_session=False,
+            )
+            db.commit()
+            return queued if claimed else None
+        finally:
+            db.close()
+
+    def _finish_job(self, job: _QueuedJob):
+        db = SessionLocal()
+        try:
+            db.query(Job).filter(Job.id == job.id).update(
+                {Job.status: "done", Job.locked_at: None}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._counters["completed"] += 1
+
+    def _fail_job(self, job: _QueuedJob, exc: Exception):
+        if job.attempts >= self._tasks[job.name].max_attempts:
+            values = {Job.status: "failed"}
+            counter = "failed"
+        else:
+            values = {
+                Job.status: "queued",
+                Job.run_at: datetime.utcnow() + timedelta(seconds=self._retry_delay(job.attempts)),
+            }
+            counter = "retried"
+        values[Job.locked_at] = None
+        values[Job.last_error] = repr(exc)
+        db = SessionLocal()
+        try:
+            db.query(Job).filter(Job.id == job.id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _requeue_stale_jobs(self):
+        db = SessionLocal()
+        try:
+            db.query(Job).filter(
+                Job.status == "running",
+                Job.locked_at < datetime.utcnow() - STALE_JOB_TIMEOUT,
+            ).update({Job.status: "queued", Job.locked_at: None}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _durable_depth(self) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(Job).filter(Job.status == "queued").count()
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._counters)
+            result["running"] = self._running
+            result["depth"] = self._depth
+        result["durable"] = self.durable
+        if self.durable:
+            result["depth"] = self._durable_depth()
+        return result
+
+
+job_queue = JobQueue(
+    concurrency=settings.JOB_QUEUE_CONCURRENCY,
+    max_size=settings.JOB_QUEUE_MAX_SIZE,
+    durable=settings.JOB_QUEUE_DURABLE,
+    max_attempts=settings.JOB_QUEUE_MAX_ATTEMPTS,
+    retry_base_seconds=settings.JOB_QUEUE_RETRY_BASE_SECONDS,
+    poll_seconds=settings.JOB_QUEUE_POLL_SECONDS,
+)
+metrics.register("jobs", job_queue.stats)
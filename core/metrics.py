@@ -0,0 +1,18 @@
+from threading import Lock
+from typing import Callable, Dict
+
+# Реестр источников метрик: каждая подсистема регистрирует функцию,
+# возвращающую словарь с текущими значениями счетчиков
+_providers: Dict[str, Callable[[], dict]] = {}
+_lock = Lock()
+
+
+def register(name: str, provider: Callable[[], dict]):
+    with _lock:
+        _providers[name] = provider
+
+
+def snapshot() -> dict:
+    with _lock:
+        providers = dict(_providers)
+    return {name: provider() for name, provider in providers.items()}
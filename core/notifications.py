@@ -0,0 +1,65 @@
+import repository
+from config import settings
+from database import SessionLocal
+from models import Order, User
+from auth.security import create_password_reset_token
+from core.jobs import job_queue
+from core.mailer import send_email
+
+
+# Письмо со ссылкой для восстановления пароля
+@job_queue.task("send_password_reset_email")
+def send_password_reset_email(user_id: int):
+    db = SessionLocal()
+    try:
+        user = repository.user_by_id(db, user_id)
+        if not user or user.is_active == 0:
+            return
+        username, email = user.username, user.email
+        token = create_password_reset_token(user.username, user.hashed_password)
+    finally:
+        db.close()
+
+    send_email(
+        to=email,
+        subject="Восстановление пароля",
+        body=(
+            f"Здравствуйте, {username}!\n\n"
+            f"Для восстановления пароля перейдите по ссылке:\n"
+            f"{settings.PASSWORD_RESET_URL.format(token=token)}\n\n"
+            f"Ссылка действительна {settings.PASSWORD_RESET_TOKEN_EXPIRE_MINUTES} минут."
+        ),
+    )
+
+
+# Письмо с подтверждением заказа
+@job_queue.task("send_order_confirmation")
+def send_order_confirmation(order_id: int):
+    db = SessionLocal()
+    try:
+        order = repository.order_by_id(db, order_id)
+        if not order:
+            return
+        email = order.user.email
+        lines = [
+            f"- {item.product_name}: {item.quantity} x {item.price:.2f}"
+            for item in order.items
+        ]
+        body = (
+            f"Здравствуйте, {order.user.username}!\n\n"
+            f"Ваш заказ #{order.id} принят.\n"
+            + "\n".join(lines)
+            + f"\n\nИтого: {order.total_price:.2f}"
+        )
+    finally:
+        db.close()
+
+    send_email(to=email, subject=f"Заказ #{order_id} принят", body=body)
+
+
+def enqueue_password_reset(user: User):
+    job_queue.enqueue("send_password_reset_email", user_id=user.id)
+
+
+def enqueue_order_confirmation(order: Order):
+    job_queue.enqueue("send_order_confirmation", order_id=order.id)
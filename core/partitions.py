@@ -0,0 +1,153 @@
+import logging
+from datetime import date, datetime
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("orders", "order_items")
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+def is_partitioned(engine) -> bool:
+    if engine.dialect.name != "postgresql":
+        return False
+    with engine.connect() as connection:
+        return bool(connection.execute(text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = 'orders'"
+        )).scalar())
+
+
+def ensure_partitions(engine, months_ahead: int = 3) -> List[str]:
+    """Создает секции orders и order_items на текущий и следующие месяцы.
+
+    Секция DEFAULT принимает заказы за месяцы без своей секции, чтобы
+    оформление не падало, если секции вовремя не созданы. Когда секция
+    месяца появляется, его строки переносятся в нее из DEFAULT.
+    """
+    if not is_partitioned(engine):
+        return []
+    created = []
+    this_month = datetime.utcnow().date().replace(day=1)
+    with engine.begin() as connection:
+        existing = {name for name, _ in _list_partitions(connection, "orders")}
+        existing |= {name for name, _ in _list_partitions(connection, "order_items")}
+        for table in PARTITIONED_TABLES:
+            name = default_partition_name(table)
+            if name not in existing:
+                connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} DEFAULT"))
+                created.append(name)
+        for offset in range(months_ahead + 1):
+            month = add_months(this_month, offset)
+            if partition_name("orders", month) in existing and partition_name("order_items", month) in existing:
+                continue
+            moved = _take_from_default(connection, month)
+            for table in PARTITIONED_TABLES:
+                name = partition_name(table, month)
+                if name in existing:
+                    continue
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+                ))
+                created.append(name)
+            if moved:
+                # Сначала заказы: позиции ссылаются на них внешним ключом
+                for table in PARTITIONED_TABLES:
+                    connection.execute(text(f"INSERT INTO {table} SELECT * FROM moved_{table}"))
+                    connection.execute(text(f"DROP TABLE moved_{table}"))
+                logger.warning("Из секции DEFAULT перенесено заказов за %s: %d", month, moved)
+    for name in created:
+        logger.info("Создана секция %s", name)
+    return created
+
+
+def _take_from_default(connection, month: date) -> int:
+    """Выносит строки месяца из секций DEFAULT во временные таблицы
+    moved_<table>: пока они в DEFAULT, секцию месяца создать нельзя.
+    """
+    bounds = {"start": month, "end": add_months(month, 1)}
+    moved = connection.execute(text(
+        f"SELECT count(*) FROM {default_partition_name('orders')} "
+        "WHERE order_date >= :start AND order_date < :end"
+    ), bounds).scalar()
+    if not moved:
+        return 0
+    for table in PARTITIONED_TABLES:
+        connection.execute(text(
+            f"CREATE TEMP TABLE moved_{table} AS SELECT * FROM {default_partition_name(table)} "
+            "WHERE order_date >= :start AND order_date < :end"
+        ), bounds)
+    # Сначала позиции: они ссылаются на заказы внешним ключом
+    for table in reversed(PARTITIONED_TABLES):
+        connection.execute(text(
+            f"DELETE FROM {default_partition_name(table)} WHERE order_date >= :start AND order_date < :end"
+        ), bounds)
+    return moved
+
+
+def _list_partitions(connection, table: str) -> List[Tuple[str, str]]:
+    return [tuple(row) for row in connection.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+        "FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table ORDER BY child.relname"
+    ), {"table": table})]
+
+
+def drop_empty_partitions(engine, before_month: date) -> List[str]:
+    """Отсоединяет и удаляет пустые секции за месяцы раньше before_month.
+
+    Секции пустеют после переноса заказов в архив (core.archive).
+    """
+    if not is_partitioned(engine):
+        return []
+    dropped = []
+    with engine.begin() as connection:
+        months = sorted({
+            name.rsplit("_", 1)[1] for name, _ in _list_partitions(connection, "orders")
+            if name != default_partition_name("orders")
+        })
+        for suffix in months:
+            month = date(int(suffix[1:5]), int(suffix[6:8]), 1)
+            if month >= before_month:
+                continue
+            orders_partition = f"orders_{suffix}"
+            items_partition = f"order_items_{suffix}"
+            has_rows = connection.execute(text(
+                f"SELECT EXISTS (SELECT 1 FROM {orders_partition}) "
+                f"OR EXISTS (SELECT 1 FROM {items_partition})"
+            )).scalar()
+            if has_rows:
+                continue
+            # Сначала позиции: они ссылаются на секцию заказов внешним ключом
+            connection.execute(text(f"ALTER TABLE order_items DETACH PARTITION {items_partition}"))
+            connection.execute(text(f"DROP TABLE {items_partition}"))
+            connection.execute(text(f"ALTER TABLE orders DETACH PARTITION {orders_partition}"))
+            connection.execute(text(f"DROP TABLE {orders_partition}"))
+            dropped += [items_partition, orders_partition]
+    return dropped
+
+
+def list_partitions(engine) -> List[Tuple[str, str]]:
+    if not is_partitioned(engine):
+        return []
+    with engine.connect() as connection:
+        return [
+            row for table in PARTITIONED_TABLES for row in _list_partitions(connection, table)
+        ]
@@ -0,0 +1,303 @@
+import asyncio
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import pstats
+import random
+import re
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi.routing import APIRoute
+from jose import JWTError, jwt
+from sqlalchemy import event
+
+from config import settings
+from database import SessionLocal, engine
+from models import UserRole
+from auth.principal import principal_cache
+from auth.security import ALGORITHM, PASSWORD_RESET_SCOPE, SECRET_KEY
+from core import metrics
+
+# Профилирование включается только вызовом install(): без него нет ни
+# промежуточного слоя, ни обработчиков событий движка, ни оберток маршрутов
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+PROFILE_ID_PATTERN = re.compile(r"^\d{8}T\d{12}-[0-9a-f]{8}$")
+# Сколько SQL-запросов и функций попадает в отчет
+MAX_QUERIES = 200
+TOP_FUNCTIONS = 30
+
+_current: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("profile", default=None)
+# Одновременно профилируется один запрос: cProfile замедляет выполнение, а
+# профили параллельных запросов в цикле событий смешивались бы
+_busy = threading.Lock()
+_counters = {"requested": 0, "sampled": 0, "skipped_busy": 0}
+
+
+class RequestProfile:
+    __slots__ = (
+        "id", "method", "path", "reason", "created_at", "started", "profiler",
+        "endpoint_seconds", "sql_seconds", "sql_count", "queries", "_lock",
+    )
+
+    def __init__(self, method: str, path: str, reason: str):
+        self.created_at = datetime.utcnow()
+        # ID начинается со времени: сортировка по ID — сортировка по времени
+        self.id = f"{self.created_at:%Y%m%dT%H%M%S%f}-{secrets.token_hex(4)}"
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started = time.perf_counter()
+        self.profiler: Optional[cProfile.Profile] = None
+        self.endpoint_seconds = 0.0
+        self.sql_seconds = 0.0
+        self.sql_count = 0
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def start_endpoint(self) -> bool:
+        """Включает cProfile на время обработчика; вложенные обработчики
+        (подзапросы /batch) профилем не охватываются, только их SQL.
+        """
+        if self.profiler is not None:
+            return False
+        self.profiler = cProfile.Profile()
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Уже работает другой профилировщик
+            self.profiler = None
+            return False
+        self.endpoint_seconds = time.perf_counter()
+        return True
+
+    def stop_endpoint(self):
+        self.profiler.disable()
+        self.endpoint_seconds = time.perf_counter() - self.endpoint_seconds
+
+    def add_query(self, statement: str, seconds: float):
+        with self._lock:
+            self.sql_seconds += seconds
+            self.sql_count += 1
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append((statement, seconds))
+
+
+def _wrap_endpoint(call):
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None or not profile.start_endpoint():
+                return await call(*args, **kwargs)
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                profile.stop_endpoint()
+    else:
+        # Синхронный обработчик выполняется в пуле потоков; контекст с
+        # профилем копируется туда, и cProfile включается в том же потоке
+        @functools.wraps(call)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None or not profile.start_endpoint():
+                return call(*args, **kwargs)
+            try:
+                return call(*args, **kwargs)
+            finally:
+                profile.stop_endpoint()
+    return wrapper
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = conn.info.get("profiling_started")
+    if profile is not None and started:
+        profile.add_query(statement, time.perf_counter() - started.pop())
+
+
+async def _is_admin(headers: dict) -> bool:
+    scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    username = payload.get("sub")
+    if username is None or payload.get("scope") == PASSWORD_RESET_SCOPE:
+        return False
+    db = SessionLocal()
+    try:
+        principal = await principal_cache.aload(db, username)
+    finally:
+        db.close()
+    return principal is not None and principal.is_active == 1 and principal.role == UserRole.admin
+
+
+async def _trigger(scope) -> Optional[str]:
+    headers = dict(scope["headers"])
+    requested = (
+        headers.get(PROFILE_HEADER, b"").lower() in (b"1", b"true")
+        or re.search(rb"(^|&)profile=(1|true)(&|$)", scope.get("query_string", b"")) is not None
+    )
+    # Запрос профиля принимается только от администратора; остальным он
+    # не виден, и запрос выполняется как обычно
+    if requested and await _is_admin(headers):
+        return "requested"
+    if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+class ProfilingMiddleware:
+    """Выполняет запрос под профилировщиком по заголовку X-Profile: 1
+    (или параметру profile=1) от администратора либо по выборке
+    PROFILING_SAMPLE_RATE. Отчет сохраняется в profile_store.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _current.get() is not None:
+            await self.app(scope, receive, send)
+            return
+        reason = await _trigger(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+        if not _busy.acquire(blocking=False):
+            _counters["skipped_busy"] += 1
+            await self.app(scope, receive, send)
+            return
+        _counters[reason] += 1
+        profile = RequestProfile(scope["method"], scope["path"], reason)
+        token = _current.set(profile)
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if reason == "requested":
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                       (PROFILE_ID_HEADER, profile.id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _current.reset(token)
+            _busy.release()
+            await asyncio.to_thread(profile_store.save, profile, status_code)
+
+
+class ProfileStore:
+    """Отчеты профилирования на диске: <id>.json со сводкой и <id>.prof —
+    данные cProfile (открываются snakeviz, flameprof, pstats). Хранятся
+    последние max_reports отчетов.
+    """
+
+    def __init__(self, root: str, max_reports: int):
+        self.root = root
+        self.max_reports = max_reports
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str, extension: str) -> str:
+        return os.path.join(self.root, f"{profile_id}.{extension}")
+
+    def save(self, profile: RequestProfile, status_code: int):
+        total_seconds = time.perf_counter() - profile.started
+        functions = []
+        if profile.profiler is not None:
+            stats = pstats.Stats(profile.profiler)
+            top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+            functions = [
+                {
+                    "function": f"{name} ({filename}:{line})",
+                    "calls": calls,
+                    "self_ms": round(self_time * 1000, 3),
+                    "cumulative_ms": round(cumulative * 1000, 3),
+                }
+                for (filename, line, name), (_, calls, self_time, cumulative, _) in top
+            ]
+        report = {
+            "id": profile.id,
+            "method": profile.method,
+            "path": profile.path,
+            "status": status_code,
+            "reason": profile.reason,
+            "created_at": profile.created_at.isoformat(),
+            "total_ms": round(total_seconds * 1000, 3),
+            "endpoint_ms": round(profile.endpoint_seconds * 1000, 3),
+            "sql_ms": round(profile.sql_seconds * 1000, 3),
+            "sql_count": profile.sql_count,
+            "has_profile": profile.profiler is not None,
+            "queries": [{"statement": statement, "ms": round(seconds * 1000, 3)}
+                        for statement, seconds in profile.queries],
+            "functions": functions,
+        }
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            if profile.profiler is not None:
+                profile.profiler.dump_stats(self._path(profile.id, "prof"))
+            with open(self._path(profile.id, "json"), "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False)
+            self._prune()
+
+    def _prune(self):
+        reports = sorted(name[:-5] for name in os.listdir(self.root) if name.endswith(".json"))
+        for profile_id in reports[:-self.max_reports] if len(reports) > self.max_reports else []:
+            for extension in ("json", "prof"):
+                try:
+                    os.remove(self._path(profile_id, extension))
+                except FileNotFoundError:
+                    pass
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id, "json"), encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def list(self, limit: int) -> List[dict]:
+        if not os.path.isdir(self.root):
+            return []
+        ids = sorted((name[:-5] for name in os.listdir(self.root) if name.endswith(".json")), reverse=True)
+        return [report for report in map(self.get, ids[:limit]) if report is not None]
+
+    def prof_path(self, profile_id: str) -> Optional[str]:
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = self._path(profile_id, "prof")
+        return path if os.path.exists(path) else None
+
+
+def install(app):
+    """Подключает профилирование к приложению; вызывается после подключения маршрутов."""
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            route.dependant.call = _wrap_endpoint(route.dependant.call)
+    app.add_middleware(ProfilingMiddleware)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+profile_store = ProfileStore(settings.PROFILING_DIR, settings.PROFILING_MAX_REPORTS)
+metrics.register("profiling", lambda: {"enabled": settings.PROFILING_ENABLED, **_counters})
@@ -0,0 +1,160 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from config import settings
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько ключей хранит локальный ограничитель; давно не встречавшиеся
+# ключи вытесняются, их корзины все равно уже полны
+MAX_LOCAL_KEYS = 100_000
+
+# Корзина токенов в Redis: пополнение и списание атомарны для всех
+# рабочих процессов, время берется с сервера Redis
+REDIS_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class LocalBuckets:
+    """Корзины токенов в памяти процесса."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """Списывает токен; возвращает 0 или сколько секунд ждать следующего."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [float(burst), now]
+                self._buckets[key] = bucket
+                if len(self._buckets) > MAX_LOCAL_KEYS:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0.0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RedisBuckets:
+    """Общие для всех рабочих процессов корзины токенов в Redis."""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        # Пакет redis нужен только при заданном RATE_LIMIT_REDIS_URL
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._script = self._client.register_script(REDIS_SCRIPT)
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        return float(self._script(keys=[f"rate_limit:{key}"], args=[rate, burst]))
+
+
+class RateLimiter:
+    def __init__(self, redis_url: Optional[str] = None):
+        self.local = LocalBuckets()
+        self.shared = RedisBuckets(redis_url) if redis_url else None
+        self._lock = threading.Lock()
+        self._allowed = defaultdict(int)
+        self._rejected = defaultdict(int)
+        self._backend_errors = 0
+
+    def _take(self, key: str, rate: float, burst: int) -> float:
+        if self.shared is not None:
+            try:
+                return self.shared.take(key, rate, burst)
+            except Exception:
+                # Недоступный Redis не должен закрывать вход: ограничиваем
+                # хотя бы в пределах процесса
+                with self._lock:
+                    self._backend_errors += 1
+                logger.warning("Ограничитель запросов: Redis недоступен, используется локальный", exc_info=True)
+        return self.local.take(key, rate, burst)
+
+    def hit(self, scope: str, kind: str, value: str, per_minute: int, burst: int):
+        """Учитывает запрос; при исчерпании корзины — 429 с Retry-After."""
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        wait = self._take(f"{scope}:{kind}:{value}", per_minute / 60.0, burst)
+        with self._lock:
+            if wait:
+                self._rejected[f"{scope}.{kind}"] += 1
+            else:
+                self._allowed[f"{scope}.{kind}"] += 1
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail="Слишком много запросов, повторите позже",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.shared.name if self.shared is not None else self.local.name,
+                "local_keys": len(self.local),
+                "allowed": dict(self._allowed),
+                "rejected": dict(self._rejected),
+                "backend_errors": self._backend_errors,
+            }
+
+
+rate_limiter = RateLimiter(settings.RATE_LIMIT_REDIS_URL)
+metrics.register("rate_limit", rate_limiter.stats)
+
+
+def limit_by_ip(scope: str):
+    """Зависимость маршрута: ограничение частоты запросов с одного IP-адреса."""
+    def dependency(request: Request):
+        client = request.client.host if request.client else "unknown"
+        rate_limiter.hit(scope, "ip", client, settings.RATE_LIMIT_IP_PER_MINUTE, settings.RATE_LIMIT_IP_BURST)
+
+    return dependency
+
+
+def limit_by_username(scope: str, username: str):
+    """Ограничение частоты попыток для одной учетной записи: перебор паролей
+    с многих адресов упирается в него, даже если лимит по IP не достигнут.
+    """
+    rate_limiter.hit(
+        scope, "user", username.lower(),
+        settings.RATE_LIMIT_USERNAME_PER_MINUTE, settings.RATE_LIMIT_USERNAME_BURST,
+    )
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sqlalchemy import select
+
+from config import settings
+from database import SessionLocal
+from models import OrderItem
+from core import metrics
+from core.jobs import job_queue
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "cooccurrence.npz"
+NEIGHBORS_FILE = "neighbors.npy"
+SCORES_FILE = "scores.npy"
+FETCH_CHUNK = 50000
+# Как часто рабочий процесс проверяет, не пересобрал ли индекс другой процесс
+RELOAD_CHECK_SECONDS = 30.0
+# ID заказа выдается при вставке, а виден заказ после коммита: транзакция с
+# меньшим ID может закоммититься позже сборки, уже учевшей больший ID.
+# Поэтому каждая сборка перечитывает окно из стольких ID ниже отметки и
+# пропускает заказы из этого окна, которые уже учтены
+OVERLAP_ORDER_IDS = 1000
+
+
+class RelatedIndex:
+    """Top-K соседей каждого продукта по совместным покупкам.
+
+    Строка i массивов neighbors/scores соответствует продукту с id == i,
+    поэтому поиск — это обращение по индексу без запросов к БД. Массивы
+    отображаются в память (mmap) и разделяются между рабочими процессами.
+    """
+
+    def __init__(self, neighbors: np.ndarray, scores: np.ndarray):
+        self.neighbors = neighbors
+        self.scores = scores
+
+    def related(self, product_id: int, limit: int) -> List[Tuple[int, float]]:
+        if product_id < 0 or product_id >= self.neighbors.shape[0]:
+            return []
+        row = self.neighbors[product_id, :limit]
+        count = int(np.count_nonzero(row >= 0))
+        return list(zip(row[:count].tolist(), self.scores[product_id, :count].tolist()))
+
+    def for_products(self, product_ids: Iterable[int], limit: int) -> List[Tuple[int, float]]:
+        rows = [pid for pid in set(product_ids) if 0 <= pid < self.neighbors.shape[0]]
+        if not rows:
+            return []
+        neighbors = np.asarray(self.neighbors[rows]).ravel()
+        scores = np.asarray(self.scores[rows]).ravel()
+        mask = (neighbors >= 0) & ~np.isin(neighbors, rows)
+        totals = np.bincount(neighbors[mask], weights=scores[mask])
+        candidates = np.flatnonzero(totals)
+        top = candidates[np.argsort(-totals[candidates], kind="stable")[:limit]]
+        return list(zip(top.tolist(), totals[top].astype(np.float32).tolist()))
+
+
+def _fetch_pairs(after_order_id: int) -> Tuple[np.ndarray, np.ndarray]:
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            select(OrderItem.order_id, OrderItem.product_id)
+            .where(OrderItem.order_id > after_order_id, OrderItem.product_id.is_not(None))
+            .execution_options(yield_per=FETCH_CHUNK)
+        )
+        chunks = [np.asarray(rows, dtype=np.int64).reshape(-1, 2) for rows in result.partitions()]
+    finally:
+        db.close()
+    if not chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.concatenate(chunks)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _cooccurrence(order_ids: np.ndarray, product_ids: np.ndarray, size: int) -> sp.csr_matrix:
+    # Матрица заказы x продукты (0/1), произведение X^T X — число заказов,
+    # в которых продукты встречаются вместе
+    orders, order_index = np.unique(order_ids, return_inverse=True)
+    basket = sp.csr_matrix(
+        (np.ones(len(product_ids), dtype=np.float32), (order_index, product_ids)),
+        shape=(len(orders), size),
+    )
+    basket.sum_duplicates()
+    basket.data[:] = 1.0
+    counts = (basket.T @ basket).tocsr()
+    counts.setdiag(0)
+    counts.eliminate_zeros()
+    return counts
+
+
+def _top_k(counts: sp.csr_matrix, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    size = counts.shape[0]
+    neighbors = np.full((size, k), -1, dtype=np.int32)
+    scores = np.zeros((size, k), dtype=np.float32)
+    if counts.nnz == 0:
+        return neighbors, scores
+    rows = np.repeat(np.arange(size), np.diff(counts.indptr))
+    # Сортировка внутри строк по убыванию числа совместных покупок
+    order = np.lexsort((counts.indices, -counts.data, rows))
+    rows, cols, data = rows[order], counts.indices[order], counts.data[order]
+    rank = np.arange(len(rows)) - counts.indptr[rows]
+    keep = rank < k
+    neighbors[rows[keep], rank[keep]] = cols[keep]
+    scores[rows[keep], rank[keep]] = data[keep]
+    return neighbors, scores
+
+
+class Recommender:
+    def __init__(self, directory: str, k: int):
+        self.directory = directory
+        self.k = k
+        self.index: Optional[RelatedIndex] = None
+        self._loaded_mtime = 0.0
+        self._checked_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._refresh_pending = threading.Event()
+        self._lookups = 0
+        self._last_build = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def load(self) -> bool:
+        try:
+            mtime = os.stat(self._path(NEIGHBORS_FILE)).st_mtime
+            neighbors = np.load(self._path(NEIGHBORS_FILE), mmap_mode="r")
+            scores = np.load(self._path(SCORES_FILE), mmap_mode="r")
+        except FileNotFoundError:
+            return False
+        self.index = RelatedIndex(neighbors, scores)
+        self._loaded_mtime = mtime
+        return True
+
+    def _current(self) -> Optional[RelatedIndex]:
+        now = time.monotonic()
+        if now - self._checked_at >= RELOAD_CHECK_SECONDS:
+            self._checked_at = now
+            try:
+                if os.stat(self._path(NEIGHBORS_FILE)).st_mtime != self._loaded_mtime:
+                    self.load()
+            except FileNotFoundError:
+                pass
+        return self.index
+
+    def related(self, product_id: int, limit: int) -> List[Tuple[int, float]]:
+        self._lookups += 1
+        index = self._current()
+        return index.related(product_id, limit) if index else []
+
+    def for_products(self, product_ids: Iterable[int], limit: int) -> List[Tuple[int, float]]:
+        self._lookups += 1
+        index = self._current()
+        return index.for_products(product_ids, limit) if index else []
+
+    def _load_state(self):
+        with np.load(self._path(STATE_FILE)) as state:
+            counts = sp.csr_matrix(
+                (state["data"], state["indices"], state["indptr"]), shape=tuple(state["shape"])
+            )
+            meta = json.loads(str(state["meta"]))
+        return counts, meta
+
+    def _save(self, counts: sp.csr_matrix, meta: dict, neighbors: np.ndarray, scores: np.ndarray):
+        os.makedirs(self.directory, exist_ok=True)
+        # Пишем во временные файлы и атомарно подменяем, чтобы читатели
+        # никогда не видели частично записанный индекс
+        tmp_state = self._path(STATE_FILE + ".tmp.npz")
+        np.savez(tmp_state, data=counts.data, indices=counts.indices, indptr=counts.indptr,
+                 shape=np.array(counts.shape), meta=np.array(json.dumps(meta)))
+        os.replace(tmp_state, self._path(STATE_FILE))
+        for name, array in ((SCORES_FILE, scores), (NEIGHBORS_FILE, neighbors)):
+            tmp = self._path(name + ".tmp.npy")
+            np.save(tmp, array)
+            os.replace(tmp, self._path(name))
+
+    def build(self, incremental: bool = True) -> dict:
+        """Строит индекс заново или добавляет заказы, появившиеся после прошлой сборки."""
+        with self._refresh_lock:
+            started = time.perf_counter()
+            counts, last_order_id, seen = None, 0, np.empty(0, dtype=np.int64)
+            window_start = 0
+            if incremental and os.path.exists(self._path(STATE_FILE)):
+                counts, meta = self._load_state()
+                last_order_id = meta["last_order_id"]
+                window_start = last_order_id
+                # В состоянии старого формата окна нет: все до отметки учтено
+                if "seen_order_ids" in meta:
+                    seen = np.asarray(meta["seen_order_ids"], dtype=np.int64)
+                    window_start = max(last_order_id - OVERLAP_ORDER_IDS, 0)
+
+            order_ids, product_ids = _fetch_pairs(window_start)
+            fresh = ~np.isin(order_ids, seen)
+            order_ids, product_ids = order_ids[fresh], product_ids[fresh]
+            if counts is not None and not len(order_ids):
+                return {"new_items": 0, "products": counts.shape[0], "seconds": 0.0}
+
+            size = max(int(product_ids.max(initial=-1)) + 1, counts.shape[0] if counts is not None else 0)
+            delta = _cooccurrence(order_ids, product_ids, size)
+            if counts is not None:
+                counts.resize((size, size))
+                counts = (counts + delta).tocsr()
+            else:
+                counts = delta
+            neighbors, scores = _top_k(counts, self.k)
+            last_order_id = int(order_ids.max(initial=last_order_id))
+            seen = np.union1d(seen, order_ids)
+            meta = {
+                "last_order_id": last_order_id,
+                "seen_order_ids": seen[seen > last_order_id - OVERLAP_ORDER_IDS].tolist(),
+                "k": self.k,
+            }
+            self._save(counts, meta, neighbors, scores)
+            self.load()
+            self._last_build = {
+                "new_items": int(len(order_ids)),
+                "products": size,
+                "pairs": int(counts.nnz),
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+            return self._last_build
+
+    def request_refresh(self):
+        # Несколько новых заказов подряд дают одно инкрементальное обновление
+        if not self._refresh_pending.is_set():
+            self._refresh_pending.set()
+            if not job_queue.enqueue("refresh_recommendations"):
+                self._refresh_pending.clear()
+
+    def refresh(self):
+        self._refresh_pending.clear()
+        self.build(incremental=True)
+
+    def stats(self) -> dict:
+        index = self.index
+        return {
+            "loaded": index is not None,
+            "products": int(index.neighbors.shape[0]) if index else 0,
+            "k": self.k,
+            "lookups": self._lookups,
+            "last_build": self._last_build,
+        }
+
+
+recommender = Recommender(settings.RECOMMENDATIONS_DIR, settings.RECOMMENDATIONS_TOP_K)
+metrics.register("recommendations", recommender.stats)
+
+
+@job_queue.task("refresh_recommendations", max_attempts=3)
+def refresh_recommendations():
+    recommender.refresh()
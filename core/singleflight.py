@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from core import metrics
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Объединение одновременных одинаковых запросов.
+
+    Пока выполняется вызов с ключом key, все остальные вызовы с тем же ключом
+    не идут в базу, а ждут и получают тот же результат (или то же исключение).
+    Поддерживаются синхронные обработчики (пул потоков) и асинхронные.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self._requests = 0
+        self._executions = 0
+        metrics.register(f"singleflight.{name}", self.stats)
+
+    # Синхронный режим: обработчики FastAPI, выполняемые в пуле потоков
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._requests += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    # Асинхронный режим: корутины в одном цикле событий
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        with self._lock:
+            self._requests += 1
+            future = self._async_calls.get(key)
+            if future is None:
+                future = asyncio.get_running_loop().create_future()
+                self._async_calls[key] = future
+                self._executions += 1
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Исключение получат ожидающие; помечаем его как обработанное,
+            # чтобы цикл событий не ругался, если ожидающих не было
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._async_calls[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self._requests
+            executions = self._executions
+            in_flight = len(self._calls) + len(self._async_calls)
+        shared = requests - executions
+        return {
+            "requests": requests,
+            "executions": executions,
+            "shared": shared,
+            "in_flight": in_flight,
+            "coalescing_ratio": round(shared / requests, 4) if requests else 0.0,
+        }
@@ -0,0 +1,241 @@
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from core import metrics
+from core.cache import TTLCache
+from models import ServiceSlot, SlotReservation
+
+# Статусы резервирования мест в слоте
+HELD = "held"            # временная бронь до оформления заказа
+CONFIRMED = "confirmed"  # место закреплено за заказом
+RELEASED = "released"    # бронь снята пользователем или заказ отменен
+EXPIRED = "expired"      # бронь не была подтверждена вовремя
+
+# Свободные места по дням для каждого товара: короткий TTL снимает нагрузку
+# частых запросов календаря, после изменения занятости запись сбрасывается
+_availability = TTLCache(
+    maxsize=settings.SLOT_AVAILABILITY_CACHE_SIZE,
+    ttl=settings.SLOT_AVAILABILITY_CACHE_SECONDS,
+)
+_counters = defaultdict(int)
+_counters_lock = threading.Lock()
+
+
+def _count(name: str, value: int = 1):
+    with _counters_lock:
+        _counters[name] += value
+
+
+def _take(db: Session, slot_id: int, quantity: int) -> bool:
+    # Атомарное увеличение счетчика с проверкой вместимости: строка слота
+    # блокируется только на время этого UPDATE и до конца транзакции,
+    # конкурирующие брони не читают счетчик заранее и не перепроверяют его
+    updated = db.execute(
+        update(ServiceSlot)
+        .where(ServiceSlot.id == slot_id, ServiceSlot.reserved + quantity <= ServiceSlot.capacity)
+        .values(reserved=ServiceSlot.reserved + quantity)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    _count("reserved" if updated else "rejected")
+    return bool(updated)
+
+
+def _give_back(db: Session, released: Iterable[Tuple[int, int]]):
+    per_slot: Dict[int, int] = defaultdict(int)
+    for slot_id, quantity in released:
+        per_slot[slot_id] += quantity
+    # Фиксированный порядок блокировок строк слотов исключает взаимоблокировки
+    for slot_id in sorted(per_slot):
+        db.execute(
+            update(ServiceSlot)
+            .where(ServiceSlot.id == slot_id)
+            .values(reserved=ServiceSlot.reserved - per_slot[slot_id])
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _slot_id(db: Session, product_id: int, slot_date: date) -> int:
+    slot_id = db.execute(
+        select(ServiceSlot.id).where(ServiceSlot.product_id == product_id, ServiceSlot.slot_date == slot_date)
+    ).scalar()
+    if slot_id is None:
+        raise HTTPException(status_code=404, detail="Слот на выбранную дату не найден")
+    return slot_id
+
+
+def expire_holds(db: Session, slot_id: Optional[int] = None) -> int:
+    """Возвращает в слоты места просроченных броней; коммит за вызывающим."""
+    query = update(SlotReservation).where(
+        SlotReservation.status == HELD, SlotReservation.expires_at <= datetime.utcnow(),
+    )
+    if slot_id is not None:
+        query = query.where(SlotReservation.slot_id == slot_id)
+    released = db.execute(
+        query.values(status=EXPIRED)
+        .returning(SlotReservation.slot_id, SlotReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    _give_back(db, released)
+    _count("expired", len(released))
+    return len(released)
+
+
+def hold(db: Session, user_id: int, product_id: int, slot_date: date, quantity: int) -> SlotReservation:
+    """Временно бронирует места в слоте на SLOT_HOLD_MINUTES минут."""
+    slot_id = _slot_id(db, product_id, slot_date)
+    expire_holds(db, slot_id)
+    if not _take(db, slot_id, quantity):
+        db.rollback()
+        raise HTTPException(status_code=409, detail="В выбранном слоте недостаточно свободных мест")
+    reservation = SlotReservation(
+        slot_id=slot_id,
+        user_id=user_id,
+        quantity=quantity,
+        status=HELD,
+        expires_at=datetime.utcnow() + timedelta(minutes=settings.SLOT_HOLD_MINUTES),
+    )
+    db.add(reservation)
+    db.commit()
+    db.refresh(reservation)
+    invalidate(product_id)
+    return reservation
+
+
+def release_hold(db: Session, user_id: int, reservation_id: int) -> bool:
+    released = db.execute(
+        update(SlotReservation)
+        .where(SlotReservation.id == reservation_id, SlotReservation.user_id == user_id,
+               SlotReservation.status == HELD)
+        .values(status=RELEASED)
+        .returning(SlotReservation.slot_id, SlotReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not released:
+        return False
+    _give_back(db, released)
+    db.commit()
+    invalidate_slots(db, [slot_id for slot_id, _ in released])
+    return True
+
+
+def reserve_for_order(db: Session, user_id: int, order_id: int, lines: Dict[Tuple[int, date], int]) -> List[int]:
+    """Закрепляет места за заказом в текущей транзакции.
+
+    lines — количество мест по ключу (product_id, slot_date). Действующие
+    брони пользователя на эти слоты засчитываются, недостающие места
+    занимаются атомарно. Возвращает product_id затронутых товаров.
+    """
+    slots = {key: _slot_id(db, *key) for key in lines}
+    for key in sorted(lines, key=lambda key: slots[key]):
+        slot_id, quantity = slots[key], lines[key]
+        # Бронь переходит в заказ только пока она не просрочена: удаление
+        # по условию status = 'held' не пересекается с очисткой просроченных
+        held = sum(db.execute(
+            delete(SlotReservation)
+            .where(SlotReservation.user_id == user_id, SlotReservation.slot_id == slot_id,
+                   SlotReservation.status == HELD, SlotReservation.expires_at > datetime.utcnow())
+            .returning(SlotReservation.quantity)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+        if quantity > held:
+            expire_holds(db, slot_id)
+            if not _take(db, slot_id, quantity - held):
+                raise HTTPException(status_code=409, detail=f"На {key[1]} не осталось свободных мест")
+        elif held > quantity:
+            _give_back(db, [(slot_id, held - quantity)])
+        db.add(SlotReservation(
+            slot_id=slot_id, user_id=user_id, order_id=order_id, quantity=quantity, status=CONFIRMED,
+        ))
+    return [product_id for product_id, _ in lines]
+
+
+def release_for_orders(db: Session, order_ids: List[int]) -> List[int]:
+    """Освобождает места отмененных заказов в текущей транзакции."""
+    if not order_ids:
+        return []
+    released = db.execute(
+        update(SlotReservation)
+        .where(SlotReservation.order_id.in_(order_ids), SlotReservation.status == CONFIRMED)
+        .values(status=RELEASED)
+        .returning(SlotReservation.slot_id, SlotReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    _give_back(db, released)
+    return [slot_id for slot_id, _ in released]
+
+
+def set_capacity(db: Session, product_id: int, date_from: date, date_to: date, capacity: int) -> List[ServiceSlot]:
+    existing = {
+        slot.slot_date: slot for slot in db.query(ServiceSlot).filter(
+            ServiceSlot.product_id == product_id,
+            ServiceSlot.slot_date >= date_from,
+            ServiceSlot.slot_date <= date_to,
+        ).with_for_update()
+    }
+    slots = []
+    day = date_from
+    while day <= date_to:
+        slot = existing.get(day)
+        if slot is None:
+            slot = ServiceSlot(product_id=product_id, slot_date=day, capacity=capacity, reserved=0)
+            db.add(slot)
+        elif slot.reserved > capacity:
+            db.rollback()
+            raise HTTPException(
+                status_code=409, detail=f"На {day} уже занято {slot.reserved} мест, это больше новой вместимости",
+            )
+        else:
+            slot.capacity = capacity
+        slots.append(slot)
+        day += timedelta(days=1)
+    db.commit()
+    invalidate(product_id)
+    return slots
+
+
+def availability(db: Session, product_id: int) -> List[Tuple[date, int, int]]:
+    """Свободные места товара по дням начиная с сегодняшнего: (дата, вместимость, занято)."""
+    cached = _availability.get(product_id)
+    if cached is not None:
+        return cached
+    # Просроченные брони освобождаются при промахе кэша, а не только
+    # при следующей попытке бронирования того же слота
+    if expire_holds(db):
+        db.commit()
+    rows = [
+        tuple(row) for row in db.execute(
+            select(ServiceSlot.slot_date, ServiceSlot.capacity, ServiceSlot.reserved)
+            .where(ServiceSlot.product_id == product_id, ServiceSlot.slot_date >= date.today())
+            .order_by(ServiceSlot.slot_date)
+        )
+    ]
+    _availability.set(product_id, rows)
+    return rows
+
+
+def invalidate(*product_ids: int):
+    for product_id in product_ids:
+        _availability.pop(product_id)
+
+
+def invalidate_slots(db: Session, slot_ids: List[int]):
+    if slot_ids:
+        invalidate(*db.execute(
+            select(ServiceSlot.product_id).where(ServiceSlot.id.in_(set(slot_ids)))
+        ).scalars())
+
+
+def stats() -> dict:
+    with _counters_lock:
+        counters = dict(_counters)
+    return {**counters, "availability_cache": _availability.stats()}
+
+
+metrics.register("slots", stats)
@@ -0,0 +1,23 @@
+import time
+
+
+class Throttle:
+    """Пауза между пачками: не меньше sleep_seconds и не быстрее max_rows_per_second."""
+
+    def __init__(self, sleep_seconds: float = 0.0, max_rows_per_second: int = 0):
+        self.sleep_seconds = sleep_seconds
+        self.max_rows_per_second = max_rows_per_second
+        self._batch_started = time.monotonic()
+
+    def delay(self, rows: int, elapsed: float) -> float:
+        """Пауза после пачки из rows строк, выполненной за elapsed секунд."""
+        delay = self.sleep_seconds
+        if self.max_rows_per_second and rows:
+            delay = max(delay, rows / self.max_rows_per_second - elapsed)
+        return delay
+
+    def pause(self, rows: int):
+        delay = self.delay(rows, time.monotonic() - self._batch_started)
+        if delay > 0:
+            time.sleep(delay)
+        self._batch_started = time.monotonic()
@@ -1,17 +1,34 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import settings
 
+connect_args = {}
+if make_url(settings.DATABASE_URL).get_driver_name() == "psycopg":
+    # psycopg 3 готовит на сервере запрос, выполненный prepare_threshold раз
+    # на соединении: повторные выполнения пропускают разбор и планирование.
+    # psycopg2 серверную подготовку не поддерживает
+    connect_args["prepare_threshold"] = settings.DB_PREPARE_THRESHOLD
+
 # Подключение к базе данных PostgreSQL
-engine = create_engine(settings.DATABASE_URL)
+engine = create_engine(
+    settings.DATABASE_URL,
+    connect_args=connect_args,
+    query_cache_size=settings.DB_QUERY_CACHE_SIZE,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
 
-# Получение сессии для работы с базой данных
-def get_db():
+# Получение сессии для работы с базой данных. Подзапросы пакетного
+# запроса (/batch) используют общую сессию из request.state.db
+def get_db(request: Request):
+    shared = getattr(request.state, "db", None)
+    if shared is not None:
+        yield shared
+        return
     db = SessionLocal()
     try:
         yield db
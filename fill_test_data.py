@@ -126,14 +126,18 @@ def create_test_orders(db: Session, username: str):
         user_id=user.id,
         order_date=datetime.utcnow(),
         status=OrderStatus.pending,
-        total_price=product.price * 2
+        total_price=product.price * 2,
+        item_count=2
     )
     db.add(order)
     db.commit()
 
     order_item = OrderItem(
         order_id=order.id,
+        order_date=order.order_date,
         product_id=product.id,
+        product_name=product.name,
+        product_category=product.category,
         quantity=2,
         price=product.price
     )
@@ -1,6 +1,17 @@
+import asyncio
+
 from fastapi import FastAPI
+from config import settings
 from database import Base, engine
-from routers import auth, products, cart, users, orders
+from core.audit import audit_log
+from core.cart_store import cart_store
+from core.cleanup import schedule_cleanup
+from core.events import order_events
+from core.jobs import job_queue
+from core.partitions import ensure_partitions
+from core import profiling
+from core.recommendations import recommender
+from routers import auth, products, cart, users, orders, metrics, analytics, slots, batch, images, admin
 
 
 Base.metadata.create_all(bind=engine)
@@ -17,7 +28,40 @@ app.include_router(products.router)
 app.include_router(cart.router)
 app.include_router(users.router)
 app.include_router(orders.router)
+app.include_router(metrics.router)
+app.include_router(analytics.router)
+app.include_router(slots.router)
+app.include_router(batch.router)
+app.include_router(images.router)
+app.include_router(admin.router)
+
+if settings.PROFILING_ENABLED:
+    profiling.install(app)
+
+
+# Фоновые службы приложения
+@app.on_event("startup")
+async def start_background_services():
+    ensure_partitions(engine, months_ahead=settings.ORDER_PARTITION_MONTHS_AHEAD)
+    if settings.ORDER_EVENTS_PG_BRIDGE:
+        order_events.start_pg_bridge(engine)
+    recommender.load()
+    cart_store.start()
+    audit_log.start()
+    await job_queue.start()
+    if settings.CLEANUP_INTERVAL_MINUTES > 0:
+        app.state.cleanup_task = asyncio.create_task(schedule_cleanup(settings.CLEANUP_INTERVAL_MINUTES))
+
 
+@app.on_event("shutdown")
+async def stop_background_services():
+    cleanup_task = getattr(app.state, "cleanup_task", None)
+    if cleanup_task is not None:
+        cleanup_task.cancel()
+    await job_queue.stop()
+    cart_store.stop()
+    audit_log.stop()
+    order_events.stop_pg_bridge()
 
 
 # Главная страница
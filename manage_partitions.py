@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+from datetime import datetime
+
+# Добавляем путь к проекту, чтобы можно было импортировать modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from config import settings
+from database import SessionLocal, engine
+from core.archive import archive_orders
+from core.partitions import add_months, drop_empty_partitions, ensure_partitions, list_partitions
+
+
+# Обслуживание секций заказов и архивирование старых заказов
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание секций orders/order_items и архива заказов")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ensure = commands.add_parser("ensure", help="создать секции на будущие месяцы")
+    ensure.add_argument("--months-ahead", type=int, default=settings.ORDER_PARTITION_MONTHS_AHEAD)
+
+    archive = commands.add_parser("archive", help="перенести завершенные заказы старше N месяцев в архив")
+    archive.add_argument("--older-than-months", type=int, default=settings.ORDER_ARCHIVE_AFTER_MONTHS)
+    archive.add_argument("--batch-size", type=int, default=500)
+    archive.add_argument("--sleep", type=float, default=0.0, help="пауза между пачками, секунды")
+    archive.add_argument("--drop-empty", action="store_true", help="удалить опустевшие секции")
+
+    commands.add_parser("list", help="показать секции")
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        created = ensure_partitions(engine, months_ahead=args.months_ahead)
+        print(f"Создано секций: {len(created)} {created}")
+    elif args.command == "archive":
+        db = SessionLocal()
+        try:
+            archived = archive_orders(db, args.older_than_months, args.batch_size, args.sleep)
+        finally:
+            db.close()
+        print(f"Перенесено в архив заказов: {archived}")
+        if args.drop_empty:
+            this_month = datetime.utcnow().date().replace(day=1)
+            dropped = drop_empty_partitions(engine, add_months(this_month, -args.older_than_months))
+            print(f"Удалено секций: {len(dropped)} {dropped}")
+    elif args.command == "list":
+        for name, bounds in list_partitions(engine):
+            print(f"{name}: {bounds}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, ForeignKey, Enum
+from sqlalchemy import (
+    Column, Integer, String, Float, Text, Date, DateTime, ForeignKey, Enum, UniqueConstraint, Index, LargeBinary, CheckConstraint, text,
+    DDL, event, func,
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -25,6 +28,24 @@ class User(Base):
     orders = relationship("Order", back_populates="user")
 
 
+# Индексы поиска пользователей. Префиксный поиск без учета регистра — по
+# lower(); text_pattern_ops позволяет использовать индекс для LIKE 'abc%'
+# при любой collation. Поиск по подстроке на PostgreSQL — по триграммам
+Index("ix_users_username_lower", func.lower(User.username).label("username_lower"),
+      postgresql_ops={"username_lower": "text_pattern_ops"})
+Index("ix_users_email_lower", func.lower(User.email).label("email_lower"),
+      postgresql_ops={"email_lower": "text_pattern_ops"})
+Index("ix_users_role_is_active_id", User.role, User.is_active, User.id)
+Index("ix_users_username_trgm", User.username,
+      postgresql_using="gin", postgresql_ops={"username": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+Index("ix_users_email_trgm", User.email,
+      postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}).ddl_if(dialect="postgresql")
+event.listen(
+    User.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
 # Модель товара
 class Product(Base):
     __tablename__ = "products"
@@ -37,17 +58,24 @@ class Product(Base):
     image_url = Column(String(255), nullable=True)
     available = Column(Integer, default=1)  # 1 - доступен, 0 - недоступен
 
-    cart_items = relationship("CartItem", back_populates="product")
+    # Позиции корзины удаляются вместе с товаром
+    cart_items = relationship("CartItem", back_populates="product", cascade="all, delete-orphan")
 
 
 # Модель элемента корзины
 class CartItem(Base):
     __tablename__ = "cart_items"
+    __table_args__ = (
+        # Поиск брошенных корзин: последнее изменение по каждому пользователю
+        Index("ix_cart_items_user_id_updated_at", "user_id", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     quantity = Column(Integer, nullable=False)
+    slot_date = Column(Date, nullable=True)  # день выполнения услуги, если у товара есть слоты
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     user = relationship("User", back_populates="cart_items")
     product = relationship("Product", back_populates="cart_items")
@@ -61,27 +89,211 @@ class OrderStatus(enum.Enum):
     cancelled = "Отменен"
 
 
+# Допустимые переходы между статусами заказа
+ORDER_STATUS_TRANSITIONS = {
+    OrderStatus.pending: {OrderStatus.processing, OrderStatus.cancelled},
+    OrderStatus.processing: {OrderStatus.shipped, OrderStatus.cancelled},
+    OrderStatus.shipped: {OrderStatus.delivered},
+    OrderStatus.delivered: set(),
+    OrderStatus.cancelled: set(),
+}
+
+
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Покрывает и поиск по user_id, и список заказов пользователя по дате
+        Index("ix_orders_user_id_order_date", "user_id", text("order_date DESC")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     order_date = Column(DateTime, default=datetime.utcnow)
     status = Column(Enum(OrderStatus), default=OrderStatus.pending)
     total_price = Column(Float, nullable=False)
+    item_count = Column(Integer, nullable=False, default=0)  # общее количество единиц товара в заказе
 
     user = relationship("User", back_populates="orders")
-    items = relationship("OrderItem", back_populates="order")
+    # Соединение и по дате заказа: на PostgreSQL таблицы секционированы по
+    # order_date, и загрузка позиций заказа затрагивает только одну секцию
+    items = relationship(
+        "OrderItem",
+        back_populates="order",
+        primaryjoin="and_(Order.id == foreign(OrderItem.order_id), "
+                    "Order.order_date == foreign(OrderItem.order_date))",
+    )
 
 
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
+    order_date = Column(DateTime, nullable=True)  # копия orders.order_date - ключ секционирования
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="SET NULL"), index=True)
+    # Снимок товара на момент оформления: чтение заказов не соединяется с
+    # products и не ломается после удаления товара
+    product_name = Column(String(255), nullable=True)
+    product_category = Column(String(100), nullable=True)
     quantity = Column(Integer, nullable=False)
     price = Column(Float, nullable=False)
 
-    order = relationship("Order", back_populates="items")
+    order = relationship(
+        "Order",
+        back_populates="items",
+        primaryjoin="and_(Order.id == foreign(OrderItem.order_id), "
+                    "Order.order_date == foreign(OrderItem.order_date))",
+    )
     product = relationship("Product")
+
+
+# Ключ идемпотентности: сохраненный ответ на запрос с заголовком Idempotency-Key
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "scope", "key", name="uq_idempotency_keys_user_scope_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    scope = Column(String(100), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)  # NULL - запрос еще выполняется
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# Фоновая задача в устойчивом (табличном) режиме очереди задач
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# Сводные таблицы аналитики продаж, обновляемые инкрементально при создании
+# заказов и смене их статуса. Отмененные заказы в выручку не входят.
+class DailySales(Base):
+    __tablename__ = "daily_sales"
+
+    day = Column(Date, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class OrderStatusCount(Base):
+    __tablename__ = "order_status_counts"
+
+    status = Column(Enum(OrderStatus), primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+
+
+class ProductSales(Base):
+    __tablename__ = "product_sales"
+
+    product_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class CategorySales(Base):
+    __tablename__ = "category_sales"
+
+    category = Column(String(100), primary_key=True)  # "" - товары без категории
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+# Архив старых завершенных заказов: заказ вместе с позициями хранится
+# одной сжатой JSON-записью и больше не занимает место в секциях orders
+class OrderArchive(Base):
+    __tablename__ = "order_archive"
+
+    order_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    order_date = Column(DateTime, nullable=False)
+    status = Column(Enum(OrderStatus), nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    payload = Column(LargeBinary, nullable=False)  # zlib(JSON)
+
+
+# Дневная вместимость мастерской по услуге: reserved увеличивается
+# атомарно и никогда не превышает capacity
+class ServiceSlot(Base):
+    __tablename__ = "service_slots"
+    __table_args__ = (
+        UniqueConstraint("product_id", "slot_date", name="uq_service_slots_product_date"),
+        CheckConstraint("reserved >= 0 AND reserved <= capacity", name="ck_service_slots_reserved"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    slot_date = Column(Date, nullable=False)
+    capacity = Column(Integer, nullable=False)
+    reserved = Column(Integer, nullable=False, default=0)
+
+
+# Бронь мест в слоте: временная (held) до оформления заказа или закрепленная
+# за заказом. order_id без внешнего ключа: на PostgreSQL orders секционирована
+class SlotReservation(Base):
+    __tablename__ = "slot_reservations"
+    __table_args__ = (
+        Index("ix_slot_reservations_status_expires_at", "status", "expires_at"),
+        Index("ix_slot_reservations_user_id_slot_id", "user_id", "slot_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    slot_id = Column(Integer, ForeignKey("service_slots.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    order_id = Column(Integer, nullable=True, index=True)
+    quantity = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False)  # held, confirmed, released, expired
+    expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# Refresh-токен: хранится только sha256 от случайного значения. Токены одной
+# цепочки ротации объединены family_id: повторное использование уже
+# замененного токена отзывает всю цепочку
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    family_id = Column(String(32), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    used_at = Column(DateTime, nullable=True)  # токен обменян на новый
+    revoked_at = Column(DateTime, nullable=True)
+
+
+# Журнал изменений состояния заказов и учетных записей. Пишется пачками
+# из core.audit; ссылок на другие таблицы нет, чтобы запись пережила
+# удаление или архивирование сущности
+class AuditEvent(Base):
+    __tablename__ = "audit_events"
+    __table_args__ = (
+        Index("ix_audit_events_entity", "entity_type", "entity_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    entity_type = Column(String(20), nullable=False)  # order, user
+    entity_id = Column(Integer, nullable=False)
+    action = Column(String(50), nullable=False)
+    actor_id = Column(Integer, nullable=True)  # кто изменил; нет для системных изменений
+    old_value = Column(String(100), nullable=True)
+    new_value = Column(String(100), nullable=True)
+    created_at = Column(DateTime, nullable=False)
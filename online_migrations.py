@@ -0,0 +1,334 @@
+import logging
+import math
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Optional, Sequence
+
+import sqlalchemy as sa
+from alembic import context, op
+from sqlalchemy.exc import DBAPIError
+
+from core.throttle import Throttle
+
+# Операции миграций, безопасные для больших таблиц под нагрузкой
+# (orders, order_items). Используются из файлов alembic/versions:
+#
+#     from online_migrations import add_nullable_column, backfill, create_index_concurrently, set_not_null
+#
+# На PostgreSQL индексы строятся CONCURRENTLY, ALTER TABLE выполняется с
+# lock_timeout и повторами, а заполнение идет короткими транзакциями по
+# диапазонам ключа с паузами. На SQLite те же вызовы сводятся к обычным
+# операциям Alembic.
+#
+# Пробный прогон: alembic -x dry_run=1 upgrade head. Миграции выполняются
+# в одной транзакции, которая затем откатывается; заполнение делает одну
+# пробную пачку и пишет в журнал число строк и оценку длительности, индексы
+# только оцениваются. Миграции, которые сами вызывают autocommit_block(),
+# в пробном прогоне не работают — для них есть функции этого модуля.
+
+logger = logging.getLogger("alembic.online_migrations")
+
+# SQLSTATE lock_not_available: истек lock_timeout
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def is_dry_run() -> bool:
+    return context.get_x_argument(as_dictionary=True).get("dry_run", "").lower() in ("1", "true", "yes")
+
+
+def _is_postgresql(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+def _in_autocommit(bind) -> bool:
+    return bind.get_execution_options().get("isolation_level") == "AUTOCOMMIT"
+
+
+def _sqlstate(exc: DBAPIError) -> Optional[str]:
+    # psycopg2 — pgcode, psycopg 3 — sqlstate
+    return getattr(exc.orig, "pgcode", None) or getattr(exc.orig, "sqlstate", None)
+
+
+@contextmanager
+def lock_timeout(timeout: str = "3s", statement_timeout: Optional[str] = None):
+    """Ограничивает ожидание блокировок (и, если задано, длительность
+    запросов) на время блока. Только PostgreSQL, на других СУБД ничего не делает.
+
+    При ошибке внутри транзакции прежние значения вернет ее откат.
+    """
+    bind = op.get_bind()
+    if not _is_postgresql(bind):
+        yield
+        return
+    settings = {"lock_timeout": timeout}
+    if statement_timeout is not None:
+        settings["statement_timeout"] = statement_timeout
+    previous = {name: bind.execute(sa.text("SELECT current_setting(:name)"), {"name": name}).scalar()
+                for name in settings}
+
+    def apply(values: dict):
+        for name, value in values.items():
+            bind.execute(sa.text("SELECT set_config(:name, :value, false)"), {"name": name, "value": value})
+
+    apply(settings)
+    try:
+        yield
+    except Exception:
+        if _in_autocommit(bind):
+            apply(previous)
+        raise
+    apply(previous)
+
+
+def run_with_lock_retries(operation, timeout: str = "3s", attempts: int = 5, delay_seconds: float = 1.0):
+    """Выполняет operation() с lock_timeout и повторяет ее, если блокировку
+    не удалось получить вовремя.
+
+    Длинная транзакция на таблице иначе заставит ALTER TABLE ждать, а за ним
+    в очередь встанут все запросы к этой таблице. С lock_timeout попытка
+    быстро сдается, откатывается к точке сохранения и повторяется позже.
+    В autocommit_block() каждая команда — своя транзакция, и точка
+    сохранения не нужна.
+    """
+    bind = op.get_bind()
+    if not _is_postgresql(bind):
+        return operation()
+    for attempt in range(1, attempts + 1):
+        try:
+            with (nullcontext() if _in_autocommit(bind) else bind.begin_nested()), lock_timeout(timeout):
+                return operation()
+        except DBAPIError as exc:
+            if _sqlstate(exc) != LOCK_NOT_AVAILABLE or attempt == attempts:
+                raise
+            logger.warning("Блокировка не получена за %s (попытка %d из %d), повтор через %.1f с",
+                           timeout, attempt, attempts, delay_seconds * attempt)
+            time.sleep(delay_seconds * attempt)
+
+
+def add_nullable_column(table_name: str, column: sa.Column, timeout: str = "3s", attempts: int = 5):
+    """Добавляет столбец, допускающий NULL, если его еще нет.
+
+    На PostgreSQL это изменение только в каталоге, без перезаписи таблицы,
+    если значение по умолчанию не задано или постоянно. NOT NULL ставится
+    после заполнения через set_not_null().
+    """
+    if not column.nullable:
+        raise ValueError(f"Столбец {table_name}.{column.name} должен допускать NULL; NOT NULL — через set_not_null()")
+    bind = op.get_bind()
+    if column.name in {existing["name"] for existing in sa.inspect(bind).get_columns(table_name)}:
+        logger.info("Столбец %s.%s уже есть", table_name, column.name)
+        return
+    run_with_lock_retries(lambda: op.add_column(table_name, column), timeout, attempts)
+
+
+def set_not_null(table_name: str, column_name: str, timeout: str = "3s", attempts: int = 5):
+    """Запрещает NULL в заполненном столбце.
+
+    На PostgreSQL каждый шаг коммитится отдельно. Проверка добавляется как
+    NOT VALID — это короткая ACCESS EXCLUSIVE блокировка. VALIDATE
+    сканирует таблицу под SHARE UPDATE EXCLUSIVE, не мешая чтению и записи.
+    SET NOT NULL затем опирается на проверенное ограничение и таблицу не
+    сканирует. В одной транзакции ACCESS EXCLUSIVE от ADD CONSTRAINT
+    держалась бы до конца сканирования.
+    """
+    bind = op.get_bind()
+    if is_dry_run():
+        # Пробное заполнение обновило только одну пачку, проверять нечего
+        nulls = bind.execute(sa.text(f"SELECT COUNT(*) FROM {table_name} WHERE {column_name} IS NULL")).scalar()
+        logger.info("[dry-run] NOT NULL для %s.%s: сейчас %d строк с NULL, ограничение проверяется "
+                    "сканированием без блокировки записи", table_name, column_name, nulls)
+        return
+    if not _is_postgresql(bind):
+        # Alembic не отражает индексы по выражениям, и копирование таблицы
+        # в batch-режиме их теряет; они пересоздаются по сохраненному SQL
+        expression_indexes = bind.execute(sa.text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+        ), {"table": table_name}).scalars().all()
+        with op.batch_alter_table(table_name) as batch_op:
+            batch_op.alter_column(column_name, nullable=False)
+        for statement in expression_indexes:
+            op.execute(statement.replace("INDEX ", "INDEX IF NOT EXISTS ", 1))
+        return
+    constraint = f"{table_name}_{column_name}_not_null"[:63]
+
+    def set_and_drop_check():
+        op.execute(f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET NOT NULL")
+        op.execute(f"ALTER TABLE {table_name} DROP CONSTRAINT {constraint}")
+
+    # В autocommit_block() каждая команда — своя транзакция
+    with op.get_context().autocommit_block():
+        # Ограничение могло остаться от прерванного запуска
+        exists = bind.execute(sa.text(
+            "SELECT 1 FROM pg_constraint WHERE conname = :name AND conrelid = to_regclass(:table)"
+        ), {"name": constraint, "table": table_name}).scalar()
+        if not exists:
+            run_with_lock_retries(lambda: op.execute(
+                f"ALTER TABLE {table_name} ADD CONSTRAINT {constraint} CHECK ({column_name} IS NOT NULL) NOT VALID"
+            ), timeout, attempts)
+        op.execute(f"ALTER TABLE {table_name} VALIDATE CONSTRAINT {constraint}")
+        run_with_lock_retries(set_and_drop_check, timeout, attempts)
+
+
+def backfill(table_name: str, set_clause: str, where: Optional[str] = None, params: Optional[dict] = None,
+             key: str = "id", batch_size: int = 5000, sleep_seconds: float = 0.0, max_rows_per_second: int = 0,
+             timeout: str = "3s") -> int:
+    """Выполняет UPDATE table SET set_clause [WHERE where] пачками по
+    диапазонам целочисленного ключа; возвращает число обновленных строк.
+
+    Диапазон ключей фиксируется в начале: строки, вставленные позже, пишет
+    уже новый код. На PostgreSQL каждая пачка — отдельная транзакция, так
+    что блокировки строк держатся недолго, а между пачками выдерживается
+    пауза (sleep_seconds, max_rows_per_second). where лучше делать
+    идемпотентным (например, "new_column IS NULL"): прерванное заполнение
+    тогда можно просто запустить снова.
+    """
+    bind = op.get_bind()
+    params = dict(params or {})
+    condition = f" AND ({where})" if where else ""
+    first_key, last_key = bind.execute(sa.text(f"SELECT MIN({key}), MAX({key}) FROM {table_name}")).one()
+    if first_key is None:
+        logger.info("Заполнение %s: таблица пуста", table_name)
+        return 0
+    next_upper = sa.text(
+        f"SELECT {key} FROM {table_name} WHERE {key} > :last ORDER BY {key} LIMIT 1 OFFSET :offset"
+    )
+    update = sa.text(
+        f"UPDATE {table_name} SET {set_clause} WHERE {key} > :last AND {key} <= :upper{condition}"
+    )
+    throttle = Throttle(sleep_seconds, max_rows_per_second)
+
+    def run_batch(last: int) -> tuple:
+        upper = bind.execute(next_upper, {"last": last, "offset": batch_size - 1}).scalar()
+        upper = last_key if upper is None or upper > last_key else upper
+        started = time.perf_counter()
+        rows = bind.execute(update, {**params, "last": last, "upper": upper}).rowcount
+        return upper, rows, time.perf_counter() - started
+
+    if is_dry_run():
+        return _estimate_backfill(bind, table_name, key, condition, params, first_key, last_key,
+                                  batch_size, throttle, run_batch)
+
+    updated = 0
+    batches = 0
+    last = first_key - 1
+    postgresql = _is_postgresql(bind)
+    with (op.get_context().autocommit_block() if postgresql else nullcontext()), lock_timeout(timeout):
+        while last < last_key:
+            last, rows, _ = run_batch(last)
+            updated += rows
+            batches += 1
+            if batches % 100 == 0:
+                logger.info("Заполнение %s: %d строк, ключ %s из %s", table_name, updated, last, last_key)
+            throttle.pause(rows)
+    logger.info("Заполнение %s: обновлено %d строк за %d пачек", table_name, updated, batches)
+    return updated
+
+
+def _estimate_backfill(bind, table_name, key, condition, params, first_key, last_key, batch_size, throttle, run_batch):
+    scanned, matching = bind.execute(sa.text(
+        f"SELECT COUNT(*), COALESCE(SUM(CASE WHEN TRUE{condition} THEN 1 ELSE 0 END), 0) FROM {table_name} "
+        f"WHERE {key} >= :first AND {key} <= :last"
+    ), {**params, "first": first_key, "last": last_key}).one()
+    # Пробная пачка выполняется по-настоящему и откатывается вместе с прогоном
+    _, rows, seconds = run_batch(first_key - 1)
+    batches = math.ceil(scanned / batch_size)
+    estimate = batches * (seconds + throttle.delay(rows, seconds))
+    logger.info(
+        "[dry-run] Заполнение %s: %d строк к обновлению из %d, %d пачек по %d; "
+        "пробная пачка — %d строк за %.3f с; оценка %.1f с",
+        table_name, matching, scanned, batches, batch_size, rows, seconds, estimate,
+    )
+    return matching
+
+
+def _index_columns(columns: Sequence[str]) -> list:
+    return [column if column.isidentifier() else sa.text(column) for column in columns]
+
+
+def _relkind(bind, name: str) -> Optional[str]:
+    return bind.execute(
+        sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": name}
+    ).scalar()
+
+
+def _drop_invalid_index(bind, name: str):
+    # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс,
+    # из-за которого IF NOT EXISTS пропустил бы построение
+    invalid = bind.execute(
+        sa.text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+    ).scalar()
+    if invalid:
+        logger.warning("Индекс %s невалиден после прерванного построения, пересоздается", name)
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def create_index_concurrently(index_name: str, table_name: str, columns: Sequence[str], unique: bool = False,
+                              where: Optional[str] = None, using: Optional[str] = None, timeout: str = "3s"):
+    """Строит индекс без блокировки записи в таблицу.
+
+    columns — имена столбцов или SQL-выражения ("lower(email)"). Для
+    секционированной таблицы индекс создается на родителе (ON ONLY), затем
+    CONCURRENTLY на каждой секции и присоединяется к родителю; секции,
+    созданные позже, получают индекс сами.
+    """
+    bind = op.get_bind()
+    if not _is_postgresql(bind):
+        op.create_index(index_name, table_name, _index_columns(columns), unique=unique, if_not_exists=True,
+                        sqlite_where=sa.text(where) if where else None)
+        return
+    if is_dry_run():
+        rows, size = bind.execute(sa.text(
+            "SELECT COALESCE(SUM(GREATEST(reltuples, 0)), 0)::bigint, "
+            "pg_size_pretty(COALESCE(SUM(pg_relation_size(oid)), 0)::bigint) FROM pg_class "
+            "WHERE oid = to_regclass(:table) "
+            "OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(:table))"
+        ), {"table": table_name}).one()
+        logger.info("[dry-run] Индекс %s на %s: около %d строк, %s; строится CONCURRENTLY без блокировки записи",
+                    index_name, table_name, rows, size)
+        return
+
+    definition = (f"{f'USING {using} ' if using else ''}({', '.join(columns)})"
+                  f"{f' WHERE {where}' if where else ''}")
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    # CONCURRENTLY ждет завершения всех более старых транзакций, и это
+    # ожидание тоже считается ожиданием блокировки. Поэтому lock_timeout
+    # ограничивает только короткие изменения каталога (ON ONLY, ATTACH),
+    # а само построение ждет сколько нужно, не мешая записи
+    with op.get_context().autocommit_block():
+        if _relkind(bind, table_name) != "p":
+            _drop_invalid_index(bind, index_name)
+            op.execute(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {index_name} ON {table_name} {definition}")
+            return
+        # У секционированной таблицы CONCURRENTLY не поддерживается
+        run_with_lock_retries(lambda: op.execute(
+            f"CREATE {kind} IF NOT EXISTS {index_name} ON ONLY {table_name} {definition}"
+        ), timeout)
+        partitions = bind.execute(sa.text(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:table)"
+        ), {"table": table_name}).scalars().all()
+        for partition in partitions:
+            partition_index = f"{partition}_{index_name}"[:63]
+            _drop_invalid_index(bind, partition_index)
+            op.execute(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} {definition}")
+            run_with_lock_retries(lambda: op.execute(
+                f"ALTER INDEX {index_name} ATTACH PARTITION {partition_index}"
+            ), timeout)
+    logger.info("Индекс %s построен на %d секциях %s", index_name, len(partitions), table_name)
+
+
+def drop_index_concurrently(index_name: str, table_name: str, timeout: str = "3s"):
+    bind = op.get_bind()
+    if not _is_postgresql(bind):
+        op.drop_index(index_name, table_name=table_name, if_exists=True)
+        return
+    if is_dry_run():
+        logger.info("[dry-run] Индекс %s на %s будет удален", index_name, table_name)
+        return
+    with op.get_context().autocommit_block():
+        # Индекс секционированной таблицы CONCURRENTLY не удаляется: обычный
+        # DROP берет блокировку, и ее ожидание ограничено lock_timeout.
+        # DROP ... CONCURRENTLY, как и построение, ждет старые транзакции
+        if _relkind(bind, index_name) == "I":
+            run_with_lock_retries(lambda: op.execute(f"DROP INDEX IF EXISTS {index_name}"), timeout)
+        else:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
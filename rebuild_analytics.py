@@ -0,0 +1,25 @@
+import os
+import sys
+
+# Добавляем путь к проекту, чтобы можно было импортировать modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+from database import Base, SessionLocal, engine
+from core import analytics
+
+
+# Первичное заполнение и полный пересчет сводных таблиц аналитики
+def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print("Пересчитываем сводные таблицы аналитики...")
+        analytics.rebuild(db)
+        print("Сводные таблицы аналитики пересчитаны")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from typing import List, Optional
+
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.orm import Session
+
+from models import CartItem, Order, Product, User
+
+# Частые запросы по ключу, общие для маршрутов и сервисов. Они собраны
+# через lambda_stmt: SQLAlchemy строит и компилирует конструкцию один раз
+# на место вызова, а дальше берет готовый SQL из кэша по коду лямбды и
+# подставляет только значения параметров. db.query(...).filter(...) на
+# каждом вызове заново собирает выражение и считает ключ кэша по всему дереву
+
+
+def user_by_username(db: Session, username: str) -> Optional[User]:
+    return db.execute(lambda_stmt(lambda: select(User).where(User.username == username))).scalar()
+
+
+def user_by_id(db: Session, user_id: int) -> Optional[User]:
+    return db.execute(lambda_stmt(lambda: select(User).where(User.id == user_id))).scalar()
+
+
+def product_by_id(db: Session, product_id: int) -> Optional[Product]:
+    return db.execute(lambda_stmt(lambda: select(Product).where(Product.id == product_id))).scalar()
+
+
+def available_product_by_id(db: Session, product_id: int) -> Optional[Product]:
+    return db.execute(lambda_stmt(
+        lambda: select(Product).where(Product.id == product_id, Product.available == 1)
+    )).scalar()
+
+
+def cart_items_for_user(db: Session, user_id: int) -> List[CartItem]:
+    return db.execute(lambda_stmt(lambda: select(CartItem).where(CartItem.user_id == user_id))).scalars().all()
+
+
+def order_by_id(db: Session, order_id: int) -> Optional[Order]:
+    return db.execute(lambda_stmt(lambda: select(Order).where(Order.id == order_id))).scalar()
+
+
+def order_for_user(db: Session, order_id: int, user_id: int) -> Optional[Order]:
+    return db.execute(lambda_stmt(
+        lambda: select(Order).where(Order.id == order_id, Order.user_id == user_id)
+    )).scalar()
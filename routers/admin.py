@@ -0,0 +1,131 @@
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import AuditEvent
+from schemas import AuditEventResponse, DashboardResponse, ProfileReport, ProfileReportSummary
+from auth.principal import UserPrincipal
+from auth.security import get_current_active_admin
+from core.audit import audit_log
+from core.dashboard import dashboard_snapshot
+from core.profiling import profile_store
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"]
+)
+
+
+@router.get(
+    "/dashboard",
+    response_model=DashboardResponse,
+    summary="Сводка для панели администратора",
+    description="Пользователи, заказы по статусам, выручка за сегодня и самые продаваемые продукты "
+                "(только для администратора). Сводка пересчитывается в фоне не чаще раза в несколько "
+                "секунд и может отставать от данных; время расчета — в generated_at.",
+    responses={
+        200: {"description": "Сводка"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def dashboard(
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    return dashboard_snapshot.get()
+
+
+@router.get(
+    "/profiles",
+    response_model=List[ProfileReportSummary],
+    summary="Отчеты профилирования",
+    description="Последние отчеты профилирования запросов, новые первыми (только для администратора). "
+                "Запрос профилируется по заголовку X-Profile: 1 или параметру profile=1 от администратора "
+                "либо по случайной выборке; ID отчета возвращается в заголовке X-Profile-Id. "
+                "Работает, если включено PROFILING_ENABLED.",
+    responses={
+        200: {"description": "Отчеты профилирования"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def list_profiles(
+        limit: int = Query(50, ge=1, le=500),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    return profile_store.list(limit)
+
+
+@router.get(
+    "/profiles/{profile_id}",
+    response_model=ProfileReport,
+    summary="Отчет профилирования",
+    description="Время запроса по частям, SQL-запросы и самые затратные функции (только для администратора).",
+    responses={
+        200: {"description": "Отчет профилирования"},
+        404: {"description": "Отчет не найден"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def get_profile(
+        profile_id: str,
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    report = profile_store.get(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Отчет не найден")
+    return report
+
+
+@router.get(
+    "/profiles/{profile_id}/download",
+    summary="Скачать профиль cProfile",
+    description="Файл .prof для snakeviz, flameprof или pstats (только для администратора).",
+    responses={
+        200: {"description": "Файл профиля"},
+        404: {"description": "Профиль не найден"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def download_profile(
+        profile_id: str,
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    path = profile_store.prof_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+
+@router.get(
+    "/auditLog",
+    response_model=List[AuditEventResponse],
+    summary="Журнал изменений",
+    description="История изменений статуса заказа или учетной записи пользователя, новые события первыми "
+                "(только для администратора). Страницы задаются параметром before_id — ID последнего "
+                "события предыдущей страницы.",
+    responses={
+        200: {"description": "События журнала"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def audit_events(
+        entity_type: Literal["order", "user"] = Query(..., description="Тип сущности"),
+        entity_id: int = Query(..., description="ID заказа или пользователя"),
+        before_id: Optional[int] = Query(None, description="ID последнего события предыдущей страницы"),
+        limit: int = Query(100, ge=1, le=500),
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    # Еще не записанные события дописываются, чтобы журнал был полным
+    audit_log.flush()
+    query = db.query(AuditEvent).filter(AuditEvent.entity_type == entity_type, AuditEvent.entity_id == entity_id)
+    if before_id is not None:
+        query = query.filter(AuditEvent.id < before_id)
+    return query.order_by(AuditEvent.id.desc()).limit(limit).all()
@@ -0,0 +1,106 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+
+from database import get_db
+from models import DailySales, OrderStatusCount, ProductSales, CategorySales
+from schemas import (
+    DailySalesResponse,
+    OrderStatusCountResponse,
+    ProductSalesResponse,
+    CategorySalesResponse,
+)
+from auth.principal import UserPrincipal
+from auth.security import get_current_active_admin
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["Analytics"]
+)
+
+# Все маршруты читают только сводные таблицы, а не заказы и их позиции
+
+
+@router.get(
+    "/dailyRevenue",
+    response_model=List[DailySalesResponse],
+    summary="Выручка по дням",
+    description="Количество заказов и выручка по дням за период (только для администратора). "
+                "По умолчанию — последние 30 дней.",
+    responses={
+        200: {"description": "Выручка по дням"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def daily_revenue(
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or date_to - timedelta(days=30)
+    return db.query(DailySales).filter(
+        DailySales.day >= date_from, DailySales.day <= date_to
+    ).order_by(DailySales.day).all()
+
+
+@router.get(
+    "/ordersByStatus",
+    response_model=List[OrderStatusCountResponse],
+    summary="Заказы по статусам",
+    description="Количество заказов в каждом статусе (только для администратора).",
+    responses={
+        200: {"description": "Количество заказов по статусам"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def orders_by_status(
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    return db.query(OrderStatusCount).all()
+
+
+@router.get(
+    "/productSales",
+    response_model=List[ProductSalesResponse],
+    summary="Продажи по продуктам",
+    description="Продажи по продуктам, отсортированные по выручке (только для администратора).",
+    responses={
+        200: {"description": "Продажи по продуктам"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def product_sales(
+        limit: int = 20,
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    return db.query(ProductSales).order_by(ProductSales.revenue.desc()).limit(limit).all()
+
+
+@router.get(
+    "/categorySales",
+    response_model=List[CategorySalesResponse],
+    summary="Продажи по категориям",
+    description="Продажи по категориям продуктов (только для администратора).",
+    responses={
+        200: {"description": "Продажи по категориям"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def category_sales(
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    rows = db.query(CategorySales).order_by(CategorySales.revenue.desc()).all()
+    return [
+        CategorySalesResponse(category=row.category or None, quantity=row.quantity, revenue=row.revenue)
+        for row in rows
+    ]
@@ -5,14 +5,21 @@ from sqlalchemy.orm import Session
 
 from database import get_db
 from models import User
-from schemas import Token, UserCreate, UserResponse
+import repository
+from schemas import PasswordReset, Token, RefreshTokenRequest, UserCreate, UserResponse
 from auth.security import (
     authenticate_user,
     create_access_token,
+    decode_password_reset_token,
     get_current_active_user,
     get_password_hash,
+    password_fingerprint,
 )
+from auth.principal import principal_cache
+from auth.refresh_tokens import issue_refresh_token, revoke_refresh_token, revoke_user_tokens, rotate_refresh_token
 from config import settings
+from core.notifications import enqueue_password_reset
+from core.rate_limit import limit_by_ip, limit_by_username
 
 router = APIRouter(
     prefix="/auth",
@@ -20,6 +27,14 @@ router = APIRouter(
 )
 
 
+def _token_pair(user: User, refresh_token: str) -> dict:
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user.username}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
 @router.post(
     "/register",
     response_model=UserResponse,
@@ -28,7 +43,9 @@ router = APIRouter(
     responses={
         400: {"description": "Пользователь с таким именем или email уже существует"},
         200: {"description": "Пользователь успешно зарегистрирован"},
-    }
+        429: {"description": "Слишком много запросов"},
+    },
+    dependencies=[Depends(limit_by_ip("register"))],
 )
 def register(
         user: UserCreate = Body(
@@ -41,6 +58,7 @@ def register(
         ),
         db: Session = Depends(get_db)
 ):
+    limit_by_username("register", user.username)
     db_user = db.query(User).filter(
         (User.username == user.username) | (User.email == user.email)
     ).first()
@@ -55,6 +73,8 @@ def register(
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    # Сбрасываем отрицательную запись, если имя уже искали до регистрации
+    principal_cache.invalidate(new_user.username)
     return new_user
 
 
@@ -62,24 +82,62 @@ def register(
     "/login",
     response_model=Token,
     summary="Аутентификация пользователя",
-    description="Выполняет вход пользователя и возвращает JWT токен для дальнейших запросов. Деактивированные пользователи не могут войти в систему.",
+    description="Выполняет вход пользователя и возвращает JWT токен для дальнейших запросов и refresh-токен "
+                "для его продления без повторного ввода пароля. Деактивированные пользователи не могут войти в систему.",
     responses={
         200: {"description": "Успешная аутентификация"},
         400: {"description": "Неверное имя пользователя или пароль или учетная запись деактивирована"},
-    }
+        429: {"description": "Слишком много попыток входа"},
+    },
+    dependencies=[Depends(limit_by_ip("login"))],
 )
 def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
+    # Лимиты проверяются до bcrypt: отклоненная попытка почти не тратит CPU
+    limit_by_username("login", form_data.username)
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Неверное имя пользователя или пароль или учетная запись деактивирована")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    refresh_token = issue_refresh_token(db, user.id)
+    db.commit()
+    return _token_pair(user, refresh_token)
+
+
+@router.post(
+    "/refresh",
+    response_model=Token,
+    summary="Обновление токенов",
+    description="Обменивает refresh-токен на новую пару токенов без проверки пароля. Каждый refresh-токен "
+                "действует один раз; повторное использование отзывает все токены этой сессии.",
+    responses={
+        200: {"description": "Новая пара токенов"},
+        401: {"description": "Refresh-токен недействителен, истек или уже использован"},
+    }
+)
+def refresh_access_token(
+        refresh_request: RefreshTokenRequest,
+        db: Session = Depends(get_db)
+):
+    user, refresh_token = rotate_refresh_token(db, refresh_request.refresh_token)
+    return _token_pair(user, refresh_token)
+
+
+@router.post(
+    "/logout",
+    summary="Выход",
+    description="Отзывает refresh-токен и все токены, полученные обменом из него.",
+    responses={
+        200: {"description": "Сессия завершена"},
+    }
+)
+def logout(
+        refresh_request: RefreshTokenRequest,
+        db: Session = Depends(get_db)
+):
+    revoke_refresh_token(db, refresh_request.refresh_token)
+    return {"message": "Сессия завершена"}
 
 
 @router.post(
@@ -89,14 +147,48 @@ def login_for_access_token(
     responses={
         200: {"description": "Инструкция отправлена на email"},
         404: {"description": "Пользователь с таким email не найден"},
-    }
+        429: {"description": "Слишком много запросов"},
+    },
+    dependencies=[Depends(limit_by_ip("forgot_password"))],
 )
 def forgot_password(
         email: str = Body(..., example="john@example.com", description="Email пользователя"),
         db: Session = Depends(get_db)
 ):
+    limit_by_username("forgot_password", email)
     user = db.query(User).filter(User.email == email).first()
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь с таким email не найден")
-    # Логика отправки email (не реализована)
+    # Письмо отправляется фоновой задачей, не задерживая ответ
+    enqueue_password_reset(user)
     return {"message": "Инструкция по восстановлению пароля отправлена на ваш email"}
+
+
+@router.post(
+    "/reset-password",
+    summary="Установка нового пароля",
+    description="Устанавливает новый пароль по токену из письма восстановления. Токен действует один раз; "
+                "после смены пароля все refresh-токены пользователя отзываются.",
+    responses={
+        200: {"description": "Пароль изменен"},
+        400: {"description": "Токен недействителен, истек или уже использован"},
+        429: {"description": "Слишком много запросов"},
+    },
+    dependencies=[Depends(limit_by_ip("reset_password"))],
+)
+def reset_password(
+        password_reset: PasswordReset,
+        db: Session = Depends(get_db)
+):
+    invalid_token = HTTPException(status_code=400, detail="Ссылка для восстановления пароля недействительна")
+    decoded = decode_password_reset_token(password_reset.token)
+    if decoded is None:
+        raise invalid_token
+    username, fingerprint = decoded
+    user = repository.user_by_username(db, username)
+    if not user or user.is_active == 0 or password_fingerprint(user.hashed_password) != fingerprint:
+        raise invalid_token
+    user.hashed_password = get_password_hash(password_reset.new_password)
+    revoke_user_tokens(db, user.id)
+    db.commit()
+    return {"message": "Пароль успешно изменен"}
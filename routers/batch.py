@@ -0,0 +1,151 @@
+import asyncio
+import json
+from typing import Optional
+from urllib.parse import urlsplit
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import get_db
+from schemas import BatchRequest, BatchSubRequest, BatchSubResponse, BatchResponse
+from auth.principal import UserPrincipal
+from auth.security import get_current_active_user
+
+router = APIRouter(
+    tags=["Batch"]
+)
+
+# Подзапросы к этим путям не выполняются: вложенные пакеты и бесконечный поток SSE
+FORBIDDEN_PATHS = ("/batch", "/orders/events")
+ALLOWED_METHODS = {"GET", "POST", "PUT", "DELETE"}
+# Заголовки, которые подзапрос не может переопределить
+PROTECTED_HEADERS = {"authorization", "content-length", "content-type", "host"}
+
+
+def _validate(sub_request: BatchSubRequest) -> Optional[str]:
+    path = urlsplit(sub_request.path).path
+    if sub_request.method.upper() not in ALLOWED_METHODS:
+        return f"Метод {sub_request.method} не поддерживается"
+    if not path.startswith("/") or any(path == prefix or path.startswith(prefix + "/") for prefix in FORBIDDEN_PATHS):
+        return f"Путь {path} недоступен в пакетном запросе"
+    return None
+
+
+async def _dispatch(request: Request, sub_request: BatchSubRequest, state: dict) -> BatchSubResponse:
+    """Выполняет подзапрос в приложении без сетевого вызова."""
+    url = urlsplit(sub_request.path)
+    body = b"" if sub_request.body is None else json.dumps(sub_request.body).encode()
+    headers = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in sub_request.headers.items() if name.lower() not in PROTECTED_HEADERS
+    ]
+    headers.append((b"authorization", request.headers["authorization"].encode("latin-1")))
+    headers.append((b"content-length", str(len(body)).encode()))
+    if sub_request.body is not None:
+        headers.append((b"content-type", b"application/json"))
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": sub_request.method.upper(),
+        "scheme": request.scope.get("scheme", "http"),
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "headers": headers,
+        "state": state,
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status_code = 500
+    response_headers = {}
+    chunks = []
+
+    async def send(message):
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+            for name, value in message.get("headers", []):
+                name = name.decode("latin-1")
+                if name != "content-length":
+                    response_headers[name] = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await request.app(scope, receive, send)
+    except Exception:
+        # Ответ 500 уже отправлен обработчиком ошибок приложения; ошибка
+        # одного подзапроса не прерывает весь пакет
+        if not chunks:
+            status_code = 500
+            chunks.append(b"Internal Server Error")
+    raw = b"".join(chunks)
+    if response_headers.get("content-type", "").startswith("application/json") and raw:
+        payload = json.loads(raw)
+    else:
+        payload = raw.decode("utf-8", errors="replace") or None
+    return BatchSubResponse(id=sub_request.id, status=status_code, headers=response_headers, body=payload)
+
+
+@router.post(
+    "/batch",
+    response_model=BatchResponse,
+    summary="Пакетный запрос",
+    description="Выполняет несколько запросов к API за один HTTP-запрос. Токен проверяется один раз, "
+                "подзапросы выполняются по очереди в общей сессии БД. С parallel=true подзапросы GET "
+                "выполняются одновременно, каждый в своей сессии. Ответы возвращаются в порядке подзапросов.",
+    responses={
+        200: {"description": "Ответы подзапросов"},
+        400: {"description": "Слишком много подзапросов или параллельное выполнение не-GET подзапросов"},
+        401: {"description": "Неавторизованный доступ"},
+    }
+)
+async def batch(
+        batch_request: BatchRequest,
+        request: Request,
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_user),
+):
+    sub_requests = batch_request.requests
+    if len(sub_requests) > settings.BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"Не более {settings.BATCH_MAX_REQUESTS} подзапросов")
+    if batch_request.parallel and any(sub.method.upper() != "GET" for sub in sub_requests):
+        raise HTTPException(status_code=400, detail="Параллельно можно выполнять только GET-подзапросы")
+
+    errors = [_validate(sub_request) for sub_request in sub_requests]
+
+    if batch_request.parallel:
+        responses = await asyncio.gather(*(
+            _dispatch(request, sub_request, {"batch_user": current_user})
+            for sub_request, error in zip(sub_requests, errors) if error is None
+        ))
+    else:
+        responses = []
+        for sub_request, error in zip(sub_requests, errors):
+            if error is not None:
+                continue
+            response = await _dispatch(request, sub_request, {"batch_user": current_user, "db": db})
+            if response.status >= 400:
+                # Незавершенная транзакция неудачного подзапроса не должна
+                # попасть в следующий
+                db.rollback()
+            responses.append(response)
+
+    results = iter(responses)
+    return BatchResponse(responses=[
+        BatchSubResponse(id=sub_request.id, status=400, body={"detail": error}) if error is not None
+        else next(results)
+        for sub_request, error in zip(sub_requests, errors)
+    ])
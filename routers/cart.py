@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
+import repository
 from database import get_db
-from models import CartItem, User, Product
-from schemas import CartItemCreate, CartItemResponse
+from models import Product, ServiceSlot
+from schemas import CartItemCreate, CartItemResponse, RelatedProductResponse
+from auth.principal import UserPrincipal
 from auth.security import get_current_active_user
+from core.cart_store import CartLine, cart_store
+from core.idempotency import run_idempotent
+from core.recommendations import recommender
 
 router = APIRouter(
     prefix="/cart",
@@ -13,6 +18,17 @@ router = APIRouter(
 )
 
 
+def _cart_item_response(line: CartLine, product: Product) -> CartItemResponse:
+    return CartItemResponse(
+        id=line.id,
+        product_id=line.product_id,
+        product_name=product.name,
+        product_price=product.price,
+        quantity=line.quantity,
+        slot_date=line.slot_date,
+    )
+
+
 # Просмотр корзины
 @router.get(
     "/displayCart",
@@ -26,19 +42,17 @@ router = APIRouter(
 )
 def display_cart(
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_user),
+        current_user: UserPrincipal = Depends(get_current_active_user),
 ):
-    cart_items = db.query(CartItem).filter(CartItem.user_id == current_user.id).all()
-    return [
-        CartItemResponse(
-            id=item.id,
-            product_id=item.product_id,
-            product_name=item.product.name,
-            product_price=item.product.price,
-            quantity=item.quantity,
-        )
-        for item in cart_items
-    ]
+    lines = cart_store.items(db, current_user.id)
+    if not lines:
+        return []
+    products = {
+        product.id: product
+        for product in db.query(Product).filter(Product.id.in_({line.product_id for line in lines}))
+    }
+    # Позиции удаленных товаров не показываются
+    return [_cart_item_response(line, products[line.product_id]) for line in lines if line.product_id in products]
 
 
 # Добавление товара в корзину
@@ -46,50 +60,40 @@ def display_cart(
     "/addInCart",
     response_model=CartItemResponse,
     summary="Добавить товар в корзину",
-    description="Добавляет выбранный товар в корзину текущего пользователя.",
+    description="Добавляет выбранный товар в корзину текущего пользователя. "
+                "Повторный запрос с тем же заголовком Idempotency-Key не увеличивает количество повторно.",
     responses={
         200: {"description": "Товар успешно добавлен в корзину"},
         404: {"description": "Товар не найден или недоступен"},
         401: {"description": "Неавторизованный доступ"},
+        409: {"description": "Запрос с этим ключом идемпотентности еще выполняется"},
+        422: {"description": "Ключ идемпотентности использован для другого запроса"},
     }
 )
 def add_in_cart(
         cart_item: CartItemCreate,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_user),
+        current_user: UserPrincipal = Depends(get_current_active_user),
+        idempotency_key: Optional[str] = Header(None, description="Ключ идемпотентности запроса"),
 ):
-    product = db.query(Product).filter(Product.id == cart_item.product_id).first()
+    return run_idempotent(
+        idempotency_key, "addInCart", current_user.id, cart_item,
+        lambda: _add_in_cart(cart_item, db, current_user),
+    )
+
+
+def _add_in_cart(cart_item: CartItemCreate, db: Session, current_user: UserPrincipal):
+    product = repository.product_by_id(db, cart_item.product_id)
     if not product or product.available == 0:
         raise HTTPException(status_code=404, detail="Товар не найден или недоступен")
+    if cart_item.slot_date is not None and not db.query(ServiceSlot.id).filter(
+        ServiceSlot.product_id == cart_item.product_id,
+        ServiceSlot.slot_date == cart_item.slot_date,
+    ).first():
+        raise HTTPException(status_code=404, detail="Слот на выбранную дату не найден")
 
-    existing_item = db.query(CartItem).filter(
-        CartItem.user_id == current_user.id,
-        CartItem.product_id == cart_item.product_id
-    ).first()
-
-    if existing_item:
-        existing_item.quantity += cart_item.quantity
-        db.commit()
-        db.refresh(existing_item)
-        item = existing_item
-    else:
-        new_cart_item = CartItem(
-            user_id=current_user.id,
-            product_id=cart_item.product_id,
-            quantity=cart_item.quantity,
-        )
-        db.add(new_cart_item)
-        db.commit()
-        db.refresh(new_cart_item)
-        item = new_cart_item
-
-    return CartItemResponse(
-        id=item.id,
-        product_id=item.product_id,
-        product_name=product.name,
-        product_price=product.price,
-        quantity=item.quantity,
-    )
+    line = cart_store.add(db, current_user.id, cart_item.product_id, cart_item.quantity, cart_item.slot_date)
+    return _cart_item_response(line, product)
 
 
 # Удаление товара из корзины
@@ -106,16 +110,10 @@ def add_in_cart(
 def delete_from_cart(
         item_id: int,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_user),
+        current_user: UserPrincipal = Depends(get_current_active_user),
 ):
-    cart_item = db.query(CartItem).filter(
-        CartItem.id == item_id,
-        CartItem.user_id == current_user.id
-    ).first()
-    if not cart_item:
+    if not cart_store.remove(db, current_user.id, item_id):
         raise HTTPException(status_code=404, detail="Товар в корзине не найден")
-    db.delete(cart_item)
-    db.commit()
     return {"message": f"Товар с id {item_id} удален из корзины"}
 
 
@@ -131,10 +129,30 @@ def delete_from_cart(
 )
 def clear_cart(
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_user),
+        current_user: UserPrincipal = Depends(get_current_active_user),
 ):
-    cart_items = db.query(CartItem).filter(CartItem.user_id == current_user.id).all()
-    for item in cart_items:
-        db.delete(item)
-    db.commit()
+    cart_store.clear(db, current_user.id)
     return {"message": "Корзина очищена"}
+
+
+# Рекомендации к корзине
+@router.get(
+    "/recommendations",
+    response_model=List[RelatedProductResponse],
+    summary="Рекомендации к корзине",
+    description="Продукты, которые чаще всего заказывают вместе с товарами из корзины текущего пользователя.",
+    responses={
+        200: {"description": "Список рекомендуемых продуктов"},
+        401: {"description": "Неавторизованный доступ"},
+    }
+)
+def cart_recommendations(
+        limit: int = 10,
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_user),
+):
+    product_ids = [line.product_id for line in cart_store.items(db, current_user.id)]
+    return [
+        RelatedProductResponse(product_id=related_id, score=score)
+        for related_id, score in recommender.for_products(product_ids, limit)
+    ]
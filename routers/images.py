@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from core.images import KEY_PATTERN, ORIGINAL, THUMBNAIL_SIZES, image_store
+
+router = APIRouter(
+    prefix="/images",
+    tags=["Images"]
+)
+
+# Содержимое по ключу никогда не меняется, поэтому кэшировать можно бессрочно
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get(
+    "/{size}/{key}",
+    summary="Изображение товара",
+    description="Отдает исходное изображение (size=original) или миниатюру small, medium, large. "
+                "Миниатюра создается при первом запросе и затем отдается с диска без перекодирования.",
+    responses={
+        200: {"description": "Файл изображения"},
+        304: {"description": "Изображение не изменилось"},
+        404: {"description": "Изображение не найдено"},
+    }
+)
+def get_image(
+        size: str,
+        key: str,
+        request: Request,
+):
+    if (size != ORIGINAL and size not in THUMBNAIL_SIZES) or not KEY_PATTERN.match(key):
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+    etag = f'"{key.split(".", 1)[0]}-{size}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    resolved = image_store.resolve(key, size)
+    if resolved is None:
+        raise HTTPException(status_code=404, detail="Изображение не найдено")
+    path, media_type = resolved
+    return FileResponse(path, media_type=media_type, headers=headers)
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends
+
+from auth.principal import UserPrincipal
+from auth.security import get_current_active_admin
+from core import metrics
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"]
+)
+
+
+@router.get(
+    "/snapshot",
+    summary="Метрики сервиса",
+    description="Возвращает текущие значения внутренних метрик (только для администратора).",
+    responses={
+        200: {"description": "Снимок метрик"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def get_metrics(
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    return metrics.snapshot()
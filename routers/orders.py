@@ -1,17 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+import asyncio
+from collections import defaultdict
+
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
 from datetime import datetime
 
+import repository
 from database import get_db
-from models import Order, OrderItem, Product, User, OrderStatus
+from models import Order, OrderItem, Product, OrderStatus, ORDER_STATUS_TRANSITIONS
 from schemas import (
     OrderCreate,
     OrderResponse,
     OrderItemResponse,
     OrderStatusUpdate,
+    OrderBulkStatusUpdate,
+    OrderBulkStatusResult,
+    OrderBulkStatusResponse,
 )
+from auth.principal import UserPrincipal
 from auth.security import get_current_active_user, get_current_active_admin
+from config import settings
+from core import analytics, slots
+from core.audit import audit_log
+from core.archive import load_archived_order
+from core.cart_store import cart_store
+from core.events import order_events, order_status_event, publish_order_status
+from core.idempotency import run_idempotent
+from core.notifications import enqueue_order_confirmation
+from core.recommendations import recommender
 
 router = APIRouter(
     prefix="/orders",
@@ -19,66 +38,124 @@ router = APIRouter(
 )
 
 
+# Максимальное количество заказов в одном массовом обновлении по списку ID
+BULK_STATUS_MAX_IDS = 1000
+
+# Через сколько миллисекунд клиент SSE переподключается после обрыва
+SSE_RETRY_MILLISECONDS = 3000
+
+
+# Ответ заказа с позициями для клиента
+def _order_response(order: Order) -> OrderResponse:
+    return OrderResponse(
+        id=order.id,
+        order_date=order.order_date,
+        status=order.status,
+        total_price=order.total_price,
+        item_count=order.item_count,
+        items=[
+            OrderItemResponse(
+                product_id=item.product_id,
+                product_name=item.product_name or "",
+                quantity=item.quantity,
+                price=item.price,
+            )
+            for item in order.items
+        ],
+    )
+
+
 @router.post(
     "/createOrder",
     response_model=OrderResponse,
     summary="Создать заказ",
-    description="Создает новый заказ на основе текущей корзины пользователя. После создания заказа корзина очищается.",
+    description="Создает новый заказ на основе текущей корзины пользователя. После создания заказа корзина очищается. "
+                "Повторный запрос с тем же заголовком Idempotency-Key возвращает ранее созданный заказ.",
     responses={
         200: {"description": "Заказ успешно создан"},
         400: {"description": "Корзина пуста"},
         401: {"description": "Неавторизованный доступ"},
+        409: {"description": "Запрос с этим ключом идемпотентности еще выполняется"},
+        422: {"description": "Ключ идемпотентности использован для другого запроса"},
     }
 )
 def create_order(
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_user),
+        current_user: UserPrincipal = Depends(get_current_active_user),
+        idempotency_key: Optional[str] = Header(None, description="Ключ идемпотентности запроса"),
 ):
-    cart_items = db.query(OrderItem).filter(OrderItem.user_id == current_user.id).all()
+    return run_idempotent(
+        idempotency_key, "createOrder", current_user.id, None,
+        lambda: _create_order(db, current_user),
+    )
+
+
+def _create_order(db: Session, current_user: UserPrincipal):
+    cart_items = cart_store.items(db, current_user.id)
     if not cart_items:
         raise HTTPException(status_code=400, detail="Корзина пуста")
+    products = {
+        product.id: product
+        for product in db.query(Product).filter(Product.id.in_({item.product_id for item in cart_items}))
+    }
+    # Позиции удаленных товаров пропускаются и убираются из корзины, как
+    # SQL-хранилище убирает их каскадом при удалении товара
+    stale_ids = [item.id for item in cart_items if item.product_id not in products]
+    if stale_ids:
+        cart_items = [item for item in cart_items if item.product_id in products]
+        cart_store.discard_on_commit(db, current_user.id, stale_ids)
+        if not cart_items:
+            db.commit()
+            raise HTTPException(status_code=400, detail="Корзина пуста")
 
-    total_price = sum(item.quantity * item.product.price for item in cart_items)
+    total_price = sum(item.quantity * products[item.product_id].price for item in cart_items)
 
     new_order = Order(
         user_id=current_user.id,
         order_date=datetime.utcnow(),
         status=OrderStatus.pending,
         total_price=total_price,
+        item_count=sum(item.quantity for item in cart_items),
     )
     db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
+    db.flush()
 
     # Переносим элементы корзины в позиции заказа
     for item in cart_items:
+        product = products[item.product_id]
         order_item = OrderItem(
             order_id=new_order.id,
+            order_date=new_order.order_date,
             product_id=item.product_id,
+            product_name=product.name,
+            product_category=product.category,
             quantity=item.quantity,
-            price=item.product.price,
+            price=product.price,
         )
         db.add(order_item)
-        db.delete(item)  # Удаляем из корзины
+    # Оформленные позиции уходят из корзины вместе с коммитом заказа
+    cart_store.discard_on_commit(db, current_user.id, [item.id for item in cart_items])
+
+    # Места в слотах занимаются последними, чтобы строки слотов были
+    # заблокированы как можно меньшую часть транзакции
+    slot_lines = defaultdict(int)
+    for item in cart_items:
+        if item.slot_date is not None:
+            slot_lines[(item.product_id, item.slot_date)] += item.quantity
+    slot_products = slots.reserve_for_order(db, current_user.id, new_order.id, slot_lines)
+    analytics.apply_order_created(db, new_order, [
+        (item.product_id, products[item.product_id].category, item.quantity, products[item.product_id].price)
+        for item in cart_items
+    ])
     db.commit()
+    slots.invalidate(*slot_products)
+    publish_order_status(new_order)
+    enqueue_order_confirmation(new_order)
+    if settings.RECOMMENDATIONS_REFRESH_ON_ORDER:
+        recommender.request_refresh()
 
     # Формируем ответ
-    order_items = db.query(OrderItem).filter(OrderItem.order_id == new_order.id).all()
-    return OrderResponse(
-        id=new_order.id,
-        order_date=new_order.order_date,
-        status=new_order.status,
-        total_price=new_order.total_price,
-        items=[
-            OrderItemResponse(
-                product_id=order_item.product_id,
-                product_name=order_item.product.name,
-                quantity=order_item.quantity,
-                price=order_item.price,
-            )
-            for order_item in order_items
-        ],
-    )
+    return _order_response(new_order)
 
 
 @router.get(
@@ -93,27 +170,12 @@ def create_order(
 )
 def get_my_orders(
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_user),
+        current_user: UserPrincipal = Depends(get_current_active_user),
 ):
-    orders = db.query(Order).filter(Order.user_id == current_user.id).all()
-    return [
-        OrderResponse(
-            id=order.id,
-            order_date=order.order_date,
-            status=order.status,
-            total_price=order.total_price,
-            items=[
-                OrderItemResponse(
-                    product_id=item.product_id,
-                    product_name=item.product.name,
-                    quantity=item.quantity,
-                    price=item.price,
-                )
-                for item in order.items
-            ],
-        )
-        for order in orders
-    ]
+    orders = db.query(Order).options(selectinload(Order.items)).filter(
+        Order.user_id == current_user.id
+    ).order_by(Order.order_date.desc()).all()
+    return [_order_response(order) for order in orders]
 
 
 @router.get(
@@ -130,25 +192,61 @@ def get_my_orders(
 def get_order_details(
         order_id: int,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_user),
+        current_user: UserPrincipal = Depends(get_current_active_user),
 ):
-    order = db.query(Order).filter(Order.id == order_id, Order.user_id == current_user.id).first()
+    order = repository.order_for_user(db, order_id, current_user.id)
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
-    return OrderResponse(
-        id=order.id,
-        order_date=order.order_date,
-        status=order.status,
-        total_price=order.total_price,
-        items=[
-            OrderItemResponse(
-                product_id=item.product_id,
-                product_name=item.product.name,
-                quantity=item.quantity,
-                price=item.price,
-            )
-            for item in order.items
-        ],
+    return _order_response(order)
+
+
+@router.get(
+    "/events",
+    summary="Поток изменений статусов заказов",
+    description="Server-Sent Events поток изменений статусов заказов текущего пользователя. "
+                "Заменяет периодический опрос /orders/myOrders/{order_id}. Поддерживает возобновление "
+                "по заголовку Last-Event-ID и отправляет heartbeat-комментарии при простое.",
+    responses={
+        200: {"description": "Поток событий text/event-stream"},
+        401: {"description": "Неавторизованный доступ"},
+    }
+)
+async def order_status_events(
+        request: Request,
+        current_user: UserPrincipal = Depends(get_current_active_user),
+        last_event_id: Optional[str] = Header(None, description="ID последнего полученного события"),
+):
+    user_id = current_user.id
+    try:
+        last_id = int(last_event_id) if last_event_id else 0
+    except ValueError:
+        last_id = 0
+
+    async def stream():
+        nonlocal last_id
+        # Подписываемся до чтения истории, чтобы не потерять события между ними
+        async with order_events.subscribe(user_id) as subscription:
+            yield f"retry: {SSE_RETRY_MILLISECONDS}\n\n"
+            for event in order_events.history_since(user_id, last_id):
+                last_id = event.id
+                yield event.to_sse()
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=settings.ORDER_EVENTS_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event.id <= last_id:
+                    continue
+                last_id = event.id
+                yield event.to_sse()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -166,15 +264,21 @@ def get_order_details(
 def cancel_order(
         order_id: int,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_user),
+        current_user: UserPrincipal = Depends(get_current_active_user),
 ):
-    order = db.query(Order).filter(Order.id == order_id, Order.user_id == current_user.id).first()
+    order = repository.order_for_user(db, order_id, current_user.id)
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
     if order.status != OrderStatus.pending:
         raise HTTPException(status_code=400, detail="Заказ не может быть отменен")
     order.status = OrderStatus.cancelled
+    analytics.apply_status_changes(db, [(order.id, OrderStatus.pending, OrderStatus.cancelled)])
+    released_slots = slots.release_for_orders(db, [order.id])
     db.commit()
+    audit_log.record("order", order.id, "cancelled", current_user.id,
+                     OrderStatus.pending.value, OrderStatus.cancelled.value)
+    slots.invalidate_slots(db, released_slots)
+    publish_order_status(order)
     return {"message": f"Заказ с id {order_id} отменен"}
 
 
@@ -182,7 +286,8 @@ def cancel_order(
     "/listOrders",
     response_model=List[OrderResponse],
     summary="Список всех заказов",
-    description="Возвращает список всех заказов (только для администратора).",
+    description="Возвращает список всех заказов (только для администратора). Фильтр по дате заказа "
+                "ограничивает просмотр нужными месячными секциями таблицы заказов.",
     responses={
         200: {"description": "Список всех заказов"},
         401: {"description": "Неавторизованный доступ"},
@@ -190,36 +295,28 @@ def cancel_order(
     }
 )
 def list_all_orders(
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_admin),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
 ):
-    orders = db.query(Order).all()
-    return [
-        OrderResponse(
-            id=order.id,
-            order_date=order.order_date,
-            status=order.status,
-            total_price=order.total_price,
-            items=[
-                OrderItemResponse(
-                    product_id=item.product_id,
-                    product_name=item.product.name,
-                    quantity=item.quantity,
-                    price=item.price,
-                )
-                for item in order.items
-            ],
-        )
-        for order in orders
-    ]
+    query = db.query(Order).options(selectinload(Order.items))
+    if date_from is not None:
+        query = query.filter(Order.order_date >= date_from)
+    if date_to is not None:
+        query = query.filter(Order.order_date < date_to)
+    orders = query.all()
+    return [_order_response(order) for order in orders]
 
 
 @router.put(
     "/updateOrderStatus/{order_id}",
     summary="Обновить статус заказа",
-    description="Позволяет администратору обновить статус заказа.",
+    description="Позволяет администратору обновить статус заказа. Допустимы только переходы "
+                "В ожидании → В обработке → Отправлен → Доставлен и отмена заказа, который еще не отправлен.",
     responses={
         200: {"description": "Статус заказа обновлен"},
+        400: {"description": "Недопустимый переход статуса"},
         401: {"description": "Неавторизованный доступ"},
         403: {"description": "Недостаточно прав"},
         404: {"description": "Заказ не найден"},
@@ -229,21 +326,144 @@ def update_order_status(
         order_id: int,
         status_update: OrderStatusUpdate,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_admin),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
 ):
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = repository.order_by_id(db, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
+    # Те же правила, что и в массовом обновлении: в частности, отмененный
+    # заказ не возвращается в работу, его места в слотах уже освобождены
+    if status_update.status not in ORDER_STATUS_TRANSITIONS[order.status]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Недопустимый переход статуса: {order.status.value} → {status_update.status.value}",
+        )
+    analytics.apply_status_changes(db, [(order.id, order.status, status_update.status)])
+    released_slots = []
+    if status_update.status == OrderStatus.cancelled:
+        released_slots = slots.release_for_orders(db, [order.id])
+    previous_status = order.status
     order.status = status_update.status
     db.commit()
+    audit_log.record("order", order.id, "status_changed", current_user.id,
+                     previous_status.value, status_update.status.value)
+    slots.invalidate_slots(db, released_slots)
+    publish_order_status(order)
     return {"message": f"Статус заказа с id {order_id} обновлен на {order.status.value}"}
 
 
+@router.put(
+    "/bulkUpdateStatus",
+    response_model=OrderBulkStatusResponse,
+    summary="Массовое обновление статуса заказов",
+    description="Переводит заказы из списка ID или подходящие под фильтр в новый статус одним запросом "
+                "UPDATE ... RETURNING (только для администратора). Обновляются только заказы, для которых "
+                "переход в новый статус допустим; результат возвращается по каждому заказу. "
+                "Фильтр должен быть непустым; за один запрос — не больше 1000 заказов.",
+    responses={
+        200: {"description": "Результаты обновления по каждому заказу"},
+        400: {"description": "Нужно указать либо список ID, либо непустой фильтр; превышен предел заказов"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def bulk_update_order_status(
+        bulk_update: OrderBulkStatusUpdate,
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    if (bulk_update.order_ids is None) == (bulk_update.filter is None):
+        raise HTTPException(status_code=400, detail="Нужно указать либо список ID заказов, либо фильтр")
+    if bulk_update.order_ids is not None and len(bulk_update.order_ids) > BULK_STATUS_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Не более {BULK_STATUS_MAX_IDS} заказов за один запрос")
+    if bulk_update.filter is not None and not bulk_update.filter.model_dump(exclude_none=True):
+        raise HTTPException(status_code=400, detail="Фильтр должен содержать хотя бы одно условие")
+
+    target = bulk_update.status
+    sources = [source for source, targets in ORDER_STATUS_TRANSITIONS.items() if target in targets]
+
+    if bulk_update.order_ids is not None:
+        conditions = [Order.id.in_(set(bulk_update.order_ids))]
+    else:
+        order_filter = bulk_update.filter
+        conditions = []
+        if order_filter.status is not None:
+            conditions.append(Order.status == order_filter.status)
+        if order_filter.user_id is not None:
+            conditions.append(Order.user_id == order_filter.user_id)
+        if order_filter.date_from is not None:
+            conditions.append(Order.order_date >= order_filter.date_from)
+        if order_filter.date_to is not None:
+            conditions.append(Order.order_date < order_filter.date_to)
+        # Тот же предел, что и для списка ID: считаются не больше предела + 1 строк
+        matched = db.execute(
+            select(func.count()).select_from(
+                select(Order.id).where(*conditions).limit(BULK_STATUS_MAX_IDS + 1).subquery()
+            )
+        ).scalar()
+        if matched > BULK_STATUS_MAX_IDS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Под фильтр попадает больше {BULK_STATUS_MAX_IDS} заказов, уточните фильтр",
+            )
+
+    # Заказы, подходящие под условие, но с недопустимым переходом
+    skipped_query = select(Order.id, Order.status).where(*conditions)
+    if sources:
+        skipped_query = skipped_query.where(Order.status.not_in(sources))
+    skipped_rows = db.execute(skipped_query).all()
+
+    # Одно UPDATE на каждый допустимый исходный статус (их не больше двух),
+    # чтобы знать прежний статус обновленных заказов для аналитики
+    updated_rows = []
+    status_changes = []
+    for source in sources:
+        rows = db.execute(
+            update(Order)
+            .where(*conditions, Order.status == source)
+            .values(status=target)
+            .returning(Order.id, Order.user_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        updated_rows += rows
+        status_changes += [(order_id, source, target) for order_id, _ in rows]
+    analytics.apply_status_changes(db, status_changes)
+    released_slots = []
+    if target == OrderStatus.cancelled:
+        released_slots = slots.release_for_orders(db, [order_id for order_id, _ in updated_rows])
+    db.commit()
+    for order_id, source, _ in status_changes:
+        audit_log.record("order", order_id, "status_changed", current_user.id, source.value, target.value)
+    slots.invalidate_slots(db, released_slots)
+
+    order_events.publish_many(
+        order_status_event(order_id, user_id, target) for order_id, user_id in updated_rows
+    )
+
+    results = [
+        OrderBulkStatusResult(order_id=order_id, result="updated", status=target)
+        for order_id, _ in updated_rows
+    ]
+    results += [
+        OrderBulkStatusResult(order_id=order_id, result="invalid_transition", status=status)
+        for order_id, status in skipped_rows
+    ]
+    if bulk_update.order_ids is not None:
+        found = {result.order_id for result in results}
+        results += [
+            OrderBulkStatusResult(order_id=order_id, result="not_found")
+            for order_id in dict.fromkeys(bulk_update.order_ids) if order_id not in found
+        ]
+    results.sort(key=lambda result: result.order_id)
+    return OrderBulkStatusResponse(updated=len(updated_rows), results=results)
+
+
 @router.get(
     "/getOrder/{order_id}",
     response_model=OrderResponse,
     summary="Получить детали заказа",
-    description="Возвращает детали указанного заказа (только для администратора).",
+    description="Возвращает детали указанного заказа (только для администратора), включая заказы, "
+                "перенесенные в архив.",
     responses={
         200: {"description": "Детали заказа"},
         401: {"description": "Неавторизованный доступ"},
@@ -254,23 +474,12 @@ def update_order_status(
 def get_order_admin(
         order_id: int,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_admin),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
 ):
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
+    order = repository.order_by_id(db, order_id)
+    if order:
+        return _order_response(order)
+    archived = load_archived_order(db, order_id)
+    if not archived:
         raise HTTPException(status_code=404, detail="Заказ не найден")
-    return OrderResponse(
-        id=order.id,
-        order_date=order.order_date,
-        status=order.status,
-        total_price=order.total_price,
-        items=[
-            OrderItemResponse(
-                product_id=item.product_id,
-                product_name=item.product.name,
-                quantity=item.quantity,
-                price=item.price,
-            )
-            for item in order.items
-        ],
-    )
+    return OrderResponse(**archived)
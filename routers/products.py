@@ -1,35 +1,65 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
+import repository
 from database import get_db
-from models import Product, User
-from schemas import ProductCreate, ProductUpdate, ProductResponse
+from models import Product
+from schemas import ProductCreate, ProductUpdate, ProductResponse, RelatedProductResponse
+from auth.principal import UserPrincipal
 from auth.security import get_current_active_admin, get_current_active_user
+from config import settings
+from core import fieldsets
+from core.images import InvalidImage, ORIGINAL, image_store
+from core.recommendations import recommender
+from core.singleflight import SingleFlight
 
 router = APIRouter(
     prefix="/products",
     tags=["Products"]
 )
 
+# Одновременные одинаковые запросы каталога обслуживаются одним запросом к БД.
+# Результат преобразуется в схемы внутри вызова, чтобы ожидающие потоки не
+# обращались к ORM-объектам чужой сессии.
+product_flight = SingleFlight("products")
+
 
 # Получение списка доступных товаров
 @router.get(
     "/listProducts",
     response_model=List[ProductResponse],
     summary="Список доступных продуктов",
-    description="Получение списка доступных продуктов и услуг.",
+    description="Получение списка доступных продуктов и услуг. Параметр fields ограничивает поля ответа: "
+                "из БД читаются только соответствующие столбцы.",
     responses={
         200: {"description": "Список продуктов"},
+        400: {"description": "Неизвестное поле в параметре fields"},
     }
 )
 def list_products(
         db: Session = Depends(get_db),
         skip: int = 0,
         limit: int = 100,
+        fields: Optional[str] = Query(None, description=fieldsets.FIELDS_DESCRIPTION),
 ):
-    products = db.query(Product).filter(Product.available == 1).offset(skip).limit(limit).all()
-    return products
+    selected = fieldsets.parse_fields(fields, ProductResponse)
+    if selected is not None:
+        def fetch_fields():
+            rows = db.execute(
+                fieldsets.select_fields(Product, selected)
+                .where(Product.available == 1).offset(skip).limit(limit)
+            ).mappings()
+            return fieldsets.serialize(rows, ProductResponse, selected)
+
+        return JSONResponse(product_flight.do(("list_products", skip, limit, selected), fetch_fields))
+
+    def fetch():
+        products = db.query(Product).filter(Product.available == 1).offset(skip).limit(limit).all()
+        return [ProductResponse.model_validate(product, from_attributes=True) for product in products]
+
+    return product_flight.do(("list_products", skip, limit), fetch)
 
 
 # Добавление нового товара (только для администратора)
@@ -47,7 +77,7 @@ def list_products(
 def add_product(
         product: ProductCreate,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_admin),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
 ):
     db_product = Product(**product.dict())
     db.add(db_product)
@@ -71,7 +101,11 @@ def get_product(
         product_id: int,
         db: Session = Depends(get_db),
 ):
-    product = db.query(Product).filter(Product.id == product_id, Product.available == 1).first()
+    def fetch():
+        product = repository.available_product_by_id(db, product_id)
+        return ProductResponse.model_validate(product, from_attributes=True) if product else None
+
+    product = product_flight.do(("get_product", product_id), fetch)
     if not product:
         raise HTTPException(status_code=404, detail="Товар не найден")
     return product
@@ -94,9 +128,9 @@ def update_product(
         product_id: int,
         product_update: ProductUpdate,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_admin),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
 ):
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = repository.product_by_id(db, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Товар не найден")
     for key, value in product_update.dict(exclude_unset=True).items():
@@ -106,6 +140,45 @@ def update_product(
     return product
 
 
+# Загрузка изображения товара (только для администратора)
+@router.post(
+    "/uploadImage/{product_id}",
+    response_model=ProductResponse,
+    summary="Загрузить изображение продукта",
+    description="Сохраняет изображение продукта (JPEG, PNG, WEBP или GIF) и записывает его адрес в image_url "
+                "(только для администратора). Миниатюры доступны по тому же адресу с размером small, "
+                "medium или large вместо original.",
+    responses={
+        200: {"description": "Изображение загружено"},
+        400: {"description": "Файл не является поддерживаемым изображением"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+        404: {"description": "Продукт не найден"},
+        413: {"description": "Файл слишком большой"},
+    }
+)
+def upload_product_image(
+        product_id: int,
+        image: UploadFile = File(..., description="Файл изображения"),
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    product = repository.product_by_id(db, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Товар не найден")
+    data = image.file.read(settings.IMAGE_MAX_UPLOAD_BYTES + 1)
+    if len(data) > settings.IMAGE_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Файл слишком большой")
+    try:
+        key = image_store.save_original(data)
+    except InvalidImage as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    product.image_url = f"/images/{ORIGINAL}/{key}"
+    db.commit()
+    db.refresh(product)
+    return product
+
+
 # Удаление товара (только для администратора)
 @router.delete(
     "/deleteProduct/{product_id}",
@@ -121,11 +194,32 @@ def update_product(
 def delete_product(
         product_id: int,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_admin),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
 ):
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = repository.product_by_id(db, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Товар не найден")
     db.delete(product)
     db.commit()
     return {"message": f"Товар с id {product_id} удален"}
+
+
+# Товары, которые часто заказывают вместе с данным
+@router.get(
+    "/{product_id}/related",
+    response_model=List[RelatedProductResponse],
+    summary="Часто заказывают вместе",
+    description="Возвращает продукты, которые чаще всего заказывают вместе с указанным. "
+                "Ответ берется из заранее построенного индекса совместных покупок без запросов к БД.",
+    responses={
+        200: {"description": "Список рекомендуемых продуктов"},
+    }
+)
+def related_products(
+        product_id: int,
+        limit: int = 10,
+):
+    return [
+        RelatedProductResponse(product_id=related_id, score=score)
+        for related_id, score in recommender.related(product_id, limit)
+    ]
@@ -0,0 +1,136 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import date
+
+import repository
+from database import get_db
+from schemas import (
+    ServiceSlotCapacityUpdate,
+    SlotAvailabilityResponse,
+    SlotHoldCreate,
+    SlotReservationResponse,
+)
+from auth.principal import UserPrincipal
+from auth.security import get_current_active_user, get_current_active_admin
+from core import slots
+
+router = APIRouter(
+    prefix="/slots",
+    tags=["Slots"]
+)
+
+# Максимальный диапазон дней при задании вместимости одним запросом
+MAX_CAPACITY_RANGE_DAYS = 366
+
+
+@router.get(
+    "/availability/{product_id}",
+    response_model=List[SlotAvailabilityResponse],
+    summary="Свободные слоты",
+    description="Свободные места по дням для услуги начиная с сегодняшнего дня. Ответ берется из "
+                "кэша с коротким временем жизни и сбрасывается при каждом бронировании.",
+    responses={
+        200: {"description": "Свободные места по дням"},
+    }
+)
+def slot_availability(
+        product_id: int,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        db: Session = Depends(get_db),
+):
+    return [
+        SlotAvailabilityResponse(
+            slot_date=slot_date, capacity=capacity, reserved=reserved, available=max(capacity - reserved, 0),
+        )
+        for slot_date, capacity, reserved in slots.availability(db, product_id)
+        if (date_from is None or slot_date >= date_from) and (date_to is None or slot_date <= date_to)
+    ]
+
+
+@router.put(
+    "/setCapacity",
+    response_model=List[SlotAvailabilityResponse],
+    summary="Задать вместимость слотов",
+    description="Создает или обновляет дневную вместимость услуги на каждый день диапазона "
+                "(только для администратора).",
+    responses={
+        200: {"description": "Слоты обновлены"},
+        400: {"description": "Неверный диапазон дат"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+        404: {"description": "Товар не найден"},
+        409: {"description": "Новая вместимость меньше уже занятых мест"},
+    }
+)
+def set_slot_capacity(
+        capacity_update: ServiceSlotCapacityUpdate,
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    days = (capacity_update.date_to - capacity_update.date_from).days
+    if days < 0 or days >= MAX_CAPACITY_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Диапазон должен быть от 1 до {MAX_CAPACITY_RANGE_DAYS} дней")
+    if not repository.product_by_id(db, capacity_update.product_id):
+        raise HTTPException(status_code=404, detail="Товар не найден")
+    updated = slots.set_capacity(
+        db, capacity_update.product_id, capacity_update.date_from, capacity_update.date_to,
+        capacity_update.capacity,
+    )
+    return [
+        SlotAvailabilityResponse(
+            slot_date=slot.slot_date, capacity=slot.capacity, reserved=slot.reserved,
+            available=max(slot.capacity - slot.reserved, 0),
+        )
+        for slot in updated
+    ]
+
+
+@router.post(
+    "/hold",
+    response_model=SlotReservationResponse,
+    summary="Забронировать место",
+    description="Временно бронирует места в слоте. Бронь засчитывается при оформлении заказа "
+                "с этим днем в корзине и снимается автоматически, если заказ не оформлен вовремя.",
+    responses={
+        200: {"description": "Места забронированы"},
+        401: {"description": "Неавторизованный доступ"},
+        404: {"description": "Слот на выбранную дату не найден"},
+        409: {"description": "В слоте недостаточно свободных мест"},
+    }
+)
+def hold_slot(
+        slot_hold: SlotHoldCreate,
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_user),
+):
+    reservation = slots.hold(db, current_user.id, slot_hold.product_id, slot_hold.slot_date, slot_hold.quantity)
+    return SlotReservationResponse(
+        id=reservation.id,
+        product_id=slot_hold.product_id,
+        slot_date=slot_hold.slot_date,
+        quantity=reservation.quantity,
+        status=reservation.status,
+        expires_at=reservation.expires_at,
+    )
+
+
+@router.delete(
+    "/releaseHold/{reservation_id}",
+    summary="Снять бронь",
+    description="Снимает временную бронь текущего пользователя и возвращает места в слот.",
+    responses={
+        200: {"description": "Бронь снята"},
+        401: {"description": "Неавторизованный доступ"},
+        404: {"description": "Действующая бронь не найдена"},
+    }
+)
+def release_hold(
+        reservation_id: int,
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_user),
+):
+    if not slots.release_hold(db, current_user.id, reservation_id):
+        raise HTTPException(status_code=404, detail="Действующая бронь не найдена")
+    return {"message": f"Бронь с id {reservation_id} снята"}
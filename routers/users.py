@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, or_, select
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
+import repository
 from database import get_db
-from models import User
-from schemas import UserResponse
+from models import User, UserRole
+from schemas import UserResponse, UserSearchResponse
 from auth.security import get_current_active_admin
+from auth.principal import UserPrincipal, principal_cache
+from auth.refresh_tokens import revoke_user_tokens
+from core import fieldsets
+from core.audit import audit_log
+from core.estimates import estimate_count
 
 router = APIRouter(
     prefix="/users",
@@ -18,23 +26,101 @@ router = APIRouter(
     "/listUsers",
     response_model=List[UserResponse],
     summary="Список пользователей",
-    description="Получение списка всех пользователей (только для администратора).",
+    description="Получение списка всех пользователей (только для администратора). Параметр fields "
+                "ограничивает поля ответа: из БД читаются только соответствующие столбцы.",
     responses={
         200: {"description": "Список пользователей"},
+        400: {"description": "Неизвестное поле в параметре fields"},
         401: {"description": "Неавторизованный доступ"},
         403: {"description": "Недостаточно прав"},
     }
 )
 def list_users(
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_admin),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
         skip: int = 0,
         limit: int = 100,
+        fields: Optional[str] = Query(None, description=fieldsets.FIELDS_DESCRIPTION),
 ):
+    selected = fieldsets.parse_fields(fields, UserResponse)
+    if selected is not None:
+        rows = db.execute(fieldsets.select_fields(User, selected).offset(skip).limit(limit)).mappings()
+        return JSONResponse(fieldsets.serialize(rows, UserResponse, selected))
     users = db.query(User).offset(skip).limit(limit).all()
     return users
 
 
+# Короче этого поиск идет по префиксу: триграммный индекс не помогает
+# искать подстроку из одного-двух символов
+SUBSTRING_SEARCH_MIN_LENGTH = 3
+
+
+def _like_escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _search_condition(q: str):
+    pattern = _like_escape(q.lower())
+    if len(q) < SUBSTRING_SEARCH_MIN_LENGTH:
+        return or_(
+            func.lower(User.username).like(f"{pattern}%", escape="\\"),
+            func.lower(User.email).like(f"{pattern}%", escape="\\"),
+        )
+    return or_(
+        User.username.ilike(f"%{pattern}%", escape="\\"),
+        User.email.ilike(f"%{pattern}%", escape="\\"),
+    )
+
+
+# Поиск пользователей (только для администратора)
+@router.get(
+    "/searchUsers",
+    response_model=UserSearchResponse,
+    summary="Поиск пользователей",
+    description="Поиск по части имени пользователя или email и фильтры по роли и активности "
+                "(только для администратора). Строка короче трех символов ищется как префикс, "
+                "длиннее — как подстрока. Страницы задаются параметром after_id из предыдущего ответа. "
+                "Общее число — оценка планировщика БД, а не точный подсчет.",
+    responses={
+        200: {"description": "Найденные пользователи"},
+        401: {"description": "Неавторизованный доступ"},
+        403: {"description": "Недостаточно прав"},
+    }
+)
+def search_users(
+        q: Optional[str] = Query(None, min_length=1, max_length=255, description="Часть имени пользователя или email"),
+        role: Optional[UserRole] = Query(None, description="Роль пользователя"),
+        is_active: Optional[bool] = Query(None, description="Только активные или только деактивированные"),
+        after_id: Optional[int] = Query(None, description="ID последнего пользователя предыдущей страницы"),
+        limit: int = Query(50, ge=1, le=200),
+        db: Session = Depends(get_db),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
+):
+    conditions = []
+    if q:
+        conditions.append(_search_condition(q))
+    if role is not None:
+        conditions.append(User.role == role)
+    if is_active is not None:
+        conditions.append(User.is_active == int(is_active))
+    query = db.query(User).filter(*conditions)
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+    users = query.order_by(User.id).limit(limit).all()
+
+    if after_id is None and len(users) < limit:
+        # Все подходящие строки уже на первой странице
+        total, total_is_estimate = len(users), False
+    else:
+        total, total_is_estimate = estimate_count(db, select(User.id).where(*conditions))
+    return UserSearchResponse(
+        items=[UserResponse.model_validate(user, from_attributes=True) for user in users],
+        total=total,
+        total_is_estimate=total_is_estimate,
+        next_after_id=users[-1].id if len(users) == limit else None,
+    )
+
+
 # Получение информации о пользователе по ID (только для администратора)
 @router.get(
     "/getUser/{user_id}",
@@ -51,9 +137,9 @@ def list_users(
 def get_user(
         user_id: int,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_admin),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = repository.user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     return user
@@ -74,13 +160,17 @@ def get_user(
 def deactivate_user(
         user_id: int,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_active_admin),
+        current_user: UserPrincipal = Depends(get_current_active_admin),
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = repository.user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     user.is_active = 0
+    # Деактивированный пользователь не должен продлевать сессии
+    revoke_user_tokens(db, user.id)
     db.commit()
+    principal_cache.invalidate(user.username)
+    audit_log.record("user", user.id, "deactivated", current_user.id, "1", "0")
     return {"message": f"Пользователь с id {user_id} деактивирован"}
 
 
@@ -100,14 +190,16 @@ def deactivate_user(
 def activate_user(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_admin),
+    current_user: UserPrincipal = Depends(get_current_active_admin),
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = repository.user_by_id(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     if user.is_active == 1:
         return user  # Пользователь уже активен
     user.is_active = 1
     db.commit()
+    principal_cache.invalidate(user.username)
+    audit_log.record("user", user.id, "activated", current_user.id, "0", "1")
     db.refresh(user)
     return user
\ No newline at end of file
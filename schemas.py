@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from models import UserRole, OrderStatus
-from datetime import datetime
+from datetime import date, datetime
 
 
 # Схемы для пользователя
@@ -17,11 +17,19 @@ class UserCreate(UserBase):
 class UserResponse(UserBase):
     id: int = Field(..., description="ID пользователя", example=1)
     role: UserRole = Field(..., description="Роль пользователя", example="client")
+    is_active: int = Field(..., description="1 - активен, 0 - деактивирован", example=1)
 
     class Config:
         orm_mode = True
 
 
+class UserSearchResponse(BaseModel):
+    items: List[UserResponse] = Field(..., description="Найденные пользователи в порядке ID")
+    total: int = Field(..., description="Число подходящих пользователей", example=1250)
+    total_is_estimate: bool = Field(..., description="total — оценка, а не точное число")
+    next_after_id: Optional[int] = Field(None, description="Значение after_id для следующей страницы")
+
+
 # Схемы для продукта
 class ProductBase(BaseModel):
     name: str = Field(..., description="Название продукта", example="Чистка кожаной обуви")
@@ -49,10 +57,16 @@ class ProductResponse(ProductBase):
         orm_mode = True
 
 
+class RelatedProductResponse(BaseModel):
+    product_id: int = Field(..., description="ID рекомендуемого продукта", example=2)
+    score: float = Field(..., description="Сколько раз продукты заказывали вместе", example=15)
+
+
 # Схемы для элемента корзины
 class CartItemCreate(BaseModel):
     product_id: int = Field(..., description="ID продукта", example=1)
     quantity: int = Field(..., description="Количество товара", example=2)
+    slot_date: Optional[date] = Field(None, description="День выполнения услуги", example="2024-11-01")
 
 
 class CartItemResponse(BaseModel):
@@ -61,15 +75,83 @@ class CartItemResponse(BaseModel):
     product_name: str = Field(..., description="Название продукта", example="Чистка кожаной обуви")
     product_price: float = Field(..., description="Цена продукта", example=49.99)
     quantity: int = Field(..., description="Количество товара", example=2)
+    slot_date: Optional[date] = Field(None, description="День выполнения услуги", example="2024-11-01")
 
     class Config:
         orm_mode = True
 
 
+# Схемы слотов записи на услуги
+class ServiceSlotCapacityUpdate(BaseModel):
+    product_id: int = Field(..., description="ID продукта", example=1)
+    date_from: date = Field(..., description="Первый день", example="2024-11-01")
+    date_to: date = Field(..., description="Последний день (включительно)", example="2024-11-30")
+    capacity: int = Field(..., ge=0, description="Мест в день", example=20)
+
+
+class SlotAvailabilityResponse(BaseModel):
+    slot_date: date = Field(..., description="День", example="2024-11-01")
+    capacity: int = Field(..., description="Мест в день", example=20)
+    reserved: int = Field(..., description="Занято мест", example=5)
+    available: int = Field(..., description="Свободно мест", example=15)
+
+
+class SlotHoldCreate(BaseModel):
+    product_id: int = Field(..., description="ID продукта", example=1)
+    slot_date: date = Field(..., description="День выполнения услуги", example="2024-11-01")
+    quantity: int = Field(1, ge=1, description="Количество мест", example=1)
+
+
+class SlotReservationResponse(BaseModel):
+    id: int = Field(..., description="ID брони", example=1)
+    product_id: int = Field(..., description="ID продукта", example=1)
+    slot_date: date = Field(..., description="День выполнения услуги", example="2024-11-01")
+    quantity: int = Field(..., description="Количество мест", example=1)
+    status: str = Field(..., description="Статус брони: held, confirmed, released или expired", example="held")
+    expires_at: Optional[datetime] = Field(None, description="Когда временная бронь истекает")
+
+
+# Схемы пакетного запроса
+class BatchSubRequest(BaseModel):
+    id: Optional[str] = Field(None, description="Идентификатор подзапроса для сопоставления ответов", example="cart")
+    method: str = Field("GET", description="HTTP-метод", example="GET")
+    path: str = Field(..., description="Путь с параметрами запроса", example="/cart/displayCart")
+    headers: Dict[str, str] = Field(default_factory=dict, description="Дополнительные заголовки",
+                                    example={"Idempotency-Key": "c1b2"})
+    body: Optional[Any] = Field(None, description="Тело запроса (JSON)")
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchSubRequest] = Field(..., description="Подзапросы")
+    parallel: bool = Field(False, description="Выполнять параллельно (только если все подзапросы GET)")
+
+
+class BatchSubResponse(BaseModel):
+    id: Optional[str] = Field(None, description="Идентификатор подзапроса", example="cart")
+    status: int = Field(..., description="HTTP-статус подзапроса", example=200)
+    headers: Dict[str, str] = Field(default_factory=dict, description="Заголовки ответа подзапроса")
+    body: Any = Field(None, description="Тело ответа подзапроса")
+
+
+class BatchResponse(BaseModel):
+    responses: List[BatchSubResponse]
+
+
 # Схемы для аутентификации
 class Token(BaseModel):
     access_token: str = Field(..., description="Токен доступа", example="eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9...")
     token_type: str = Field(..., description="Тип токена", example="bearer")
+    refresh_token: Optional[str] = Field(None, description="Токен для получения новой пары токенов",
+                                         example="Nw3q0Jp6yqk5Yc6Q0p2lXh1uVt7o3D8aZ4mK9sRbE1w")
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str = Field(..., description="Refresh-токен", example="Nw3q0Jp6yqk5Yc6Q0p2lXh1uVt7o3D8aZ4mK9sRbE1w")
+
+
+class PasswordReset(BaseModel):
+    token: str = Field(..., description="Токен из письма восстановления пароля")
+    new_password: str = Field(..., description="Новый пароль", example="newstrongpassword123")
 
 
 class TokenData(BaseModel):
@@ -87,7 +169,7 @@ class OrderCreate(BaseModel):
 
 
 class OrderItemResponse(BaseModel):
-    product_id: int
+    product_id: Optional[int]
     product_name: str
     quantity: int
     price: float
@@ -100,12 +182,134 @@ class OrderStatusUpdate(BaseModel):
     status: OrderStatus = Field(..., description="Новый статус заказа", example="processing")
 
 
+class OrderFilter(BaseModel):
+    status: Optional[OrderStatus] = Field(None, description="Текущий статус заказа", example="В ожидании")
+    user_id: Optional[int] = Field(None, description="ID пользователя", example=1)
+    date_from: Optional[datetime] = Field(None, description="Заказы начиная с даты")
+    date_to: Optional[datetime] = Field(None, description="Заказы до даты (не включительно)")
+
+
+class OrderBulkStatusUpdate(BaseModel):
+    order_ids: Optional[List[int]] = Field(None, description="Список ID заказов", example=[1, 2, 3])
+    filter: Optional[OrderFilter] = Field(None, description="Фильтр заказов (вместо списка ID)")
+    status: OrderStatus = Field(..., description="Новый статус заказов", example="В обработке")
+
+
+class OrderBulkStatusResult(BaseModel):
+    order_id: int = Field(..., description="ID заказа", example=1)
+    result: str = Field(..., description="Результат: updated, invalid_transition или not_found", example="updated")
+    status: Optional[OrderStatus] = Field(None, description="Статус заказа после операции")
+
+
+class OrderBulkStatusResponse(BaseModel):
+    updated: int = Field(..., description="Количество обновленных заказов", example=3)
+    results: List[OrderBulkStatusResult]
+
+
 class OrderResponse(BaseModel):
     id: int
     order_date: datetime
     status: OrderStatus
     total_price: float
+    item_count: int
     items: List[OrderItemResponse]
 
     class Config:
         orm_mode = True
+
+
+# Схемы аналитики продаж
+class DailySalesResponse(BaseModel):
+    day: date = Field(..., description="День", example="2024-11-01")
+    order_count: int = Field(..., description="Количество заказов (без отмененных)", example=12)
+    revenue: float = Field(..., description="Выручка", example=599.88)
+
+    class Config:
+        orm_mode = True
+
+
+class OrderStatusCountResponse(BaseModel):
+    status: OrderStatus = Field(..., description="Статус заказа", example="В ожидании")
+    order_count: int = Field(..., description="Количество заказов", example=5)
+
+    class Config:
+        orm_mode = True
+
+
+class ProductSalesResponse(BaseModel):
+    product_id: int = Field(..., description="ID продукта", example=1)
+    quantity: int = Field(..., description="Продано единиц", example=40)
+    revenue: float = Field(..., description="Выручка", example=1999.6)
+
+    class Config:
+        orm_mode = True
+
+
+class DashboardTopProduct(BaseModel):
+    product_id: int = Field(..., description="ID продукта", example=1)
+    name: Optional[str] = Field(None, description="Название продукта (нет, если продукт удален)",
+                                example="Чистка кожаной обуви")
+    quantity: int = Field(..., description="Продано единиц", example=40)
+    revenue: float = Field(..., description="Выручка", example=1999.6)
+
+
+class DashboardResponse(BaseModel):
+    users_total: int = Field(..., description="Всего пользователей", example=1520)
+    users_active: int = Field(..., description="Активных пользователей", example=1490)
+    admins: int = Field(..., description="Администраторов", example=3)
+    orders_by_status: List[OrderStatusCountResponse] = Field(..., description="Заказы по статусам")
+    today_orders: int = Field(..., description="Заказов за сегодня (без отмененных)", example=12)
+    today_revenue: float = Field(..., description="Выручка за сегодня", example=599.88)
+    top_products: List[DashboardTopProduct] = Field(..., description="Продукты с наибольшей выручкой")
+    generated_at: datetime = Field(..., description="Время расчета сводки (UTC)")
+
+
+class ProfileQuery(BaseModel):
+    statement: str = Field(..., description="SQL-запрос")
+    ms: float = Field(..., description="Время выполнения, мс", example=1.8)
+
+
+class ProfileFunction(BaseModel):
+    function: str = Field(..., description="Функция и ее расположение", example="verify (passlib/context.py:2340)")
+    calls: int = Field(..., description="Количество вызовов", example=1)
+    self_ms: float = Field(..., description="Собственное время, мс", example=0.2)
+    cumulative_ms: float = Field(..., description="Время с вложенными вызовами, мс", example=212.5)
+
+
+class ProfileReportSummary(BaseModel):
+    id: str = Field(..., description="ID отчета", example="20261019T153000123456-1a2b3c4d")
+    method: str = Field(..., description="HTTP-метод", example="POST")
+    path: str = Field(..., description="Путь запроса", example="/auth/login")
+    status: int = Field(..., description="Код ответа", example=200)
+    reason: str = Field(..., description="requested — по заголовку администратора, sampled — по выборке")
+    created_at: datetime = Field(..., description="Время запроса (UTC)")
+    total_ms: float = Field(..., description="Полное время запроса, мс", example=240.1)
+    endpoint_ms: float = Field(..., description="Время обработчика маршрута, мс", example=231.7)
+    sql_ms: float = Field(..., description="Суммарное время SQL-запросов, мс", example=3.4)
+    sql_count: int = Field(..., description="Количество SQL-запросов", example=2)
+    has_profile: bool = Field(..., description="Есть ли файл cProfile для скачивания")
+
+
+class ProfileReport(ProfileReportSummary):
+    queries: List[ProfileQuery] = Field(..., description="SQL-запросы в порядке выполнения")
+    functions: List[ProfileFunction] = Field(..., description="Функции с наибольшим временем с вложенными вызовами")
+
+
+class AuditEventResponse(BaseModel):
+    id: int = Field(..., description="ID события", example=1)
+    entity_type: str = Field(..., description="Тип сущности: order или user", example="order")
+    entity_id: int = Field(..., description="ID сущности", example=5)
+    action: str = Field(..., description="Действие", example="status_changed")
+    actor_id: Optional[int] = Field(None, description="ID пользователя, выполнившего действие", example=1)
+    old_value: Optional[str] = Field(None, description="Прежнее значение", example="В ожидании")
+    new_value: Optional[str] = Field(None, description="Новое значение", example="Обработан")
+    created_at: datetime = Field(..., description="Время события (UTC)")
+
+    class Config:
+        orm_mode = True
+
+
+class CategorySalesResponse(BaseModel):
+    category: Optional[str] = Field(None, description="Категория", example="Чистка")
+    quantity: int = Field(..., description="Продано единиц", example=40)
+    revenue: float = Field(..., description="Выручка", example=1999.6)